@@ -0,0 +1,130 @@
+"""
+Cache de réponses /chat à deux niveaux :
+
+1. Exact : clé (requête normalisée, mode, filtre spatial trié)
+2. Sémantique : même mode et même filtre, et embedding de la requête à une
+   distance cosinus <= `max_distance` d'une requête déjà en cache
+
+Éviction LRU + TTL. Le cache est vidé dès que ingest.py signale l'ajout de
+documents (mtime du fichier témoin `stamp_path`).
+"""
+
+from __future__ import annotations
+
+import os
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    import numpy as np
+
+_ANY_STAMP = object()
+
+
+def touch_ingest_stamp(stamp_path: str) -> None:
+    """Met à jour le fichier témoin d'ingestion (appelé par ingest.py après indexation)."""
+    with open(stamp_path, "w", encoding="utf-8") as f:
+        f.write(str(time.time()))
+
+
+class AnswerCache:
+    """Cache LRU/TTL de réponses, avec recherche exacte puis sémantique."""
+
+    def __init__(
+        self,
+        max_entries: int = 512,
+        ttl_seconds: float = 3600.0,
+        max_distance: float = 0.05,
+        stamp_path: str | None = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_distance = max_distance
+        self.stamp_path = stamp_path
+        # key -> (expires_at, embedding normalisé | None, response)
+        self._entries: OrderedDict[tuple, tuple[float, np.ndarray | None, Any]] = OrderedDict()
+        self._stamp_mtime = self._read_stamp_mtime()
+
+    @staticmethod
+    def make_key(normalized_query: str, mode: str, document_filter: list[str] | None) -> tuple:
+        return (mode, tuple(sorted(document_filter or [])), normalized_query)
+
+    def _read_stamp_mtime(self) -> float | None:
+        if not self.stamp_path:
+            return None
+        try:
+            return os.path.getmtime(self.stamp_path)
+        except OSError:
+            return None
+
+    def _check_invalidation(self) -> None:
+        mtime = self._read_stamp_mtime()
+        if mtime != self._stamp_mtime:
+            self._stamp_mtime = mtime
+            self.clear()
+
+    def current_stamp(self) -> float | None:
+        """Témoin d'ingestion courant : à relever avant de calculer une réponse, puis à passer à `put`."""
+        self._check_invalidation()
+        return self._stamp_mtime
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def get_exact(self, key: tuple) -> Any | None:
+        """Recherche exacte (à compléter par `get_semantic` en cas d'échec)."""
+        self._check_invalidation()
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, _, response = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return response
+
+    def get_semantic(self, key: tuple, embedding: list[float]) -> Any | None:
+        """Plus proche voisin cosinus parmi les entrées de même (mode, filtre)."""
+        query_vec = _normalize(embedding)
+        now = time.monotonic()
+        best_key, best_distance = None, self.max_distance
+        for entry_key, (expires_at, vec, _) in list(self._entries.items()):
+            if expires_at < now:
+                del self._entries[entry_key]
+                continue
+            if vec is None or entry_key[:2] != key[:2]:
+                continue
+            distance = 1.0 - float(query_vec @ vec)
+            if distance <= best_distance:
+                best_key, best_distance = entry_key, distance
+
+        if best_key is None:
+            return None
+        self._entries.move_to_end(best_key)
+        return self._entries[best_key][2]
+
+    def put(self, key: tuple, embedding: list[float] | None, response: Any, stamp: Any = _ANY_STAMP) -> None:
+        """
+        Stocke une réponse. Si `stamp` (relevé par `current_stamp` avant le
+        calcul) ne correspond plus au témoin d'ingestion, la réponse a été
+        construite sur l'ancien index : elle n'est pas stockée.
+        """
+        if stamp is not _ANY_STAMP:
+            self._check_invalidation()
+            if stamp != self._stamp_mtime:
+                return
+        vec = _normalize(embedding) if embedding is not None else None
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, vec, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+def _normalize(embedding: list[float]) -> np.ndarray:
+    import numpy as np
+
+    vec = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
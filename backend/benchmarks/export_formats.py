@@ -0,0 +1,190 @@
+"""
+Benchmark des formats d'export (/export/gdb?format=...) : temps d'écriture et
+taille du fichier téléchargé, sur un jeu de couches synthétiques.
+
+Utilise les mêmes fonctions d'écriture que l'API (export_worker).
+
+Contrôle mémoire (--memory-check, Linux/macOS) : le chemin d'écriture de
+l'endpoint (main.write_export_layers, corps GeoJSON lu sur disque) est
+exécuté dans un processus neuf, une fois avec une seule couche puis avec
+--memory-layers couches de même taille. Plafond vérifié : le pic de RSS du
+processus API (au-delà de son RSS après imports de main et geopandas) pour N couches reste
+inférieur à EXPORT_PROCESSES fois celui d'une couche (couches converties en
+vol), avec une marge de --rss-tolerance. Il dépend de la plus grosse couche,
+pas de la taille totale de l'export. Code de sortie 1 si le plafond est
+dépassé.
+
+Usage (depuis backend/) :
+    python benchmarks/export_formats.py [--layers 20] [--features 20000]
+    python benchmarks/export_formats.py --memory-check [--memory-layers 10] [--processes 2]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from export_worker import finalize_export, write_export_layer  # noqa: E402
+
+FORMATS = {
+    "gpkg": "export_couches.gpkg",
+    "fgb": "export_couches_fgb.zip",
+    "parquet": "export_couches_parquet.zip",
+    "gdb": "export_couches.gdb.zip",
+}
+
+
+def synthetic_layer(n_features: int, seed: int):
+    """Polygones aléatoires (anneaux de 20 sommets) avec quelques attributs."""
+    import geopandas as gpd
+    from shapely.geometry import Polygon
+
+    rng = random.Random(seed)
+    geometries, rows = [], []
+    for i in range(n_features):
+        x, y = rng.uniform(-80, -60), rng.uniform(45, 60)
+        ring = [(x + rng.random() * 0.01, y + rng.random() * 0.01) for _ in range(20)]
+        geometries.append(Polygon(ring).buffer(0))
+        rows.append({"id": i, "nom": f"entite_{i}", "valeur": rng.random() * 1000})
+    return gpd.GeoDataFrame(rows, geometry=geometries, crs="EPSG:4326")
+
+
+# --- Contrôle mémoire ---
+
+def write_export_body(path: str, n_layers: int, n_features: int) -> None:
+    """Corps ExportRequest (GeoJSON) écrit couche par couche, sans le garder en mémoire."""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"layers": [')
+        for layer in range(n_layers):
+            rng = random.Random(layer)
+            features = []
+            for i in range(n_features):
+                x, y, r = rng.uniform(-80, -60), rng.uniform(45, 60), rng.uniform(0.001, 0.05)
+                ring = [[x + r * math.cos(a / 10 * math.pi), y + r * math.sin(a / 10 * math.pi)] for a in range(20)]
+                ring.append(ring[0])
+                features.append({
+                    "type": "Feature",
+                    "geometry": {"type": "Polygon", "coordinates": [ring]},
+                    "properties": {"id": i, "nom": f"entite_{i}", "valeur": rng.random() * 1000},
+                })
+            if layer:
+                f.write(", ")
+            json.dump({
+                "id": f"Bench/couche_{layer}.geojson",
+                "name": f"couche_{layer}.geojson",
+                "geojson": {"type": "FeatureCollection", "features": features},
+            }, f)
+        f.write("]}")
+
+
+def _max_rss_mb(who: int) -> float:
+    import resource
+
+    rss = resource.getrusage(who).ru_maxrss
+    return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024  # octets (macOS) ou Ko
+
+
+def _export_peak_rss(body_path: str, export_format: str, processes: int, result) -> None:
+    """Processus neuf : pic de RSS de l'API pendant write_export_layers, et du plus gros worker."""
+    import logging
+    import resource
+
+    os.environ["EXPORT_PROCESSES"] = str(processes)
+    import main
+    import geopandas, pyogrio  # noqa: E401,F401 — imports hors mesure : seul l'export compte
+    logging.getLogger("pyogrio").setLevel(logging.WARNING)
+
+    baseline = _max_rss_mb(resource.RUSAGE_SELF)
+    with tempfile.TemporaryDirectory() as work_dir:
+        main.write_export_layers(body_path, work_dir, export_format)
+        main.finalize_export(work_dir, export_format, main.EXPORT_FORMATS[export_format][1])
+    api_peak = _max_rss_mb(resource.RUSAGE_SELF) - baseline
+    main.export_executor.shutdown(wait=True)  # les workers terminés comptent dans RUSAGE_CHILDREN
+    result.put((api_peak, _max_rss_mb(resource.RUSAGE_CHILDREN)))
+
+
+def measure_export_memory(body_path: str, export_format: str, processes: int) -> tuple[float, float]:
+    ctx = multiprocessing.get_context("spawn")
+    result = ctx.Queue()
+    process = ctx.Process(target=_export_peak_rss, args=(body_path, export_format, processes, result))
+    process.start()
+    peaks = result.get()
+    process.join()
+    return peaks
+
+
+def memory_check(args) -> bool:
+    try:
+        import resource  # noqa: F401
+    except ImportError:
+        print("⚠️  Module resource indisponible (Windows) : contrôle mémoire ignoré")
+        return True
+
+    print(f"\n🧪 Contrôle mémoire ({args.memory_format}, EXPORT_PROCESSES={args.processes}, "
+          f"{args.features} entités par couche)")
+    with tempfile.TemporaryDirectory() as bench_dir:
+        runs = {}
+        for n_layers in (1, args.memory_layers):
+            body_path = os.path.join(bench_dir, f"body_{n_layers}.json")
+            write_export_body(body_path, n_layers, args.features)
+            body_mb = os.path.getsize(body_path) / 1024 / 1024
+            api_peak, worker_peak = measure_export_memory(body_path, args.memory_format, args.processes)
+            runs[n_layers] = api_peak
+            print(f"   {n_layers:>3} couche(s), corps {body_mb:7.1f} Mo : pic API +{api_peak:6.1f} Mo, "
+                  f"worker max {worker_peak:6.1f} Mo")
+            os.remove(body_path)
+
+    ceiling = runs[1] * args.processes * (1 + args.rss_tolerance)
+    ok = runs[args.memory_layers] <= ceiling
+    print(f"   Plafond : {args.processes} × {runs[1]:.1f} Mo × {1 + args.rss_tolerance:.2f} = {ceiling:.1f} Mo "
+          f"→ {'✅' if ok else '❌'} {runs[args.memory_layers]:.1f} Mo pour {args.memory_layers} couches")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark des formats d'export")
+    parser.add_argument("--layers", type=int, default=20)
+    parser.add_argument("--features", type=int, default=20000, help="entités par couche")
+    parser.add_argument("--memory-check", action="store_true", help="contrôle du pic de RSS au lieu du benchmark des formats")
+    parser.add_argument("--memory-layers", type=int, default=10)
+    parser.add_argument("--memory-format", choices=list(FORMATS), default="gpkg")
+    parser.add_argument("--processes", type=int, default=2, help="EXPORT_PROCESSES du contrôle mémoire")
+    parser.add_argument("--rss-tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    if args.memory_check:
+        sys.exit(0 if memory_check(args) else 1)
+
+    print(f"🧪 Génération de {args.layers} couches × {args.features} entités...")
+    layers = [synthetic_layer(args.features, seed) for seed in range(args.layers)]
+
+    print(f"\n{'format':<10}{'écriture (s)':>14}{'taille (Mo)':>14}")
+    for export_format, zip_name in FORMATS.items():
+        if export_format == "parquet":
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                print(f"{export_format:<10}{'pyarrow absent':>28}")
+                continue
+        with tempfile.TemporaryDirectory() as work_dir:
+            os.makedirs(os.path.join(work_dir, "layers"))
+            start = time.perf_counter()
+            for i, gdf in enumerate(layers):
+                write_export_layer(gdf, export_format, work_dir, f"couche_{i}", append=(i > 0))
+            output_path = finalize_export(work_dir, export_format, zip_name)
+            elapsed = time.perf_counter() - start
+            size_mb = os.path.getsize(output_path) / 1024 / 1024
+        print(f"{export_format:<10}{elapsed:>14.2f}{size_mb:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
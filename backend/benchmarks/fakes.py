@@ -0,0 +1,212 @@
+"""
+Doublures locales des services externes pour les benchmarks hors ligne :
+embeddings, LLM, LlamaParse et API Tavily, chacune avec une latence
+configurable. Aucune n'appelle le réseau (le serveur Tavily écoute sur
+127.0.0.1) ; les sorties sont déterministes pour des runs comparables.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import random
+import socket
+import threading
+import time
+from typing import Any, Sequence
+
+from llama_index.core import Document
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from llama_index.core.base.llms.types import (
+    ChatMessage,
+    ChatResponse,
+    CompletionResponse,
+    LLMMetadata,
+    MessageRole,
+)
+from llama_index.core.llms.custom import CustomLLM
+
+WORDS = (
+    "forage piézomètre nappe échantillon station sédiment turbidité conductivité "
+    "habitat espèce omble salvelinus fontinalis frayère cours d'eau ruisseau rive "
+    "remblai géotechnique sondage argile sable gravier roc pH métaux hydrocarbures "
+    "caractérisation phase rapport suivi zone lot règlement article annexe"
+).split()
+
+
+def synthetic_text(seed: str, n_words: int) -> str:
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) for _ in range(n_words))
+
+
+class FakeEmbedding(BaseEmbedding):
+    """Vecteurs pseudo-aléatoires déterministes (hash du texte), latence par appel."""
+
+    embed_dim: int = 256
+    latency_s: float = 0.02
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "FakeEmbedding"
+
+    def _vector(self, text: str) -> Embedding:
+        # Somme de vecteurs par mot : des textes proches ont des vecteurs proches
+        vector = [0.0] * self.embed_dim
+        for word in text.lower().split()[:512]:
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            rng = random.Random(digest)
+            for _ in range(4):
+                vector[rng.randrange(self.embed_dim)] += rng.choice((-1.0, 1.0))
+        norm = sum(v * v for v in vector) ** 0.5 or 1.0
+        return [v / norm for v in vector]
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        time.sleep(self.latency_s)
+        return self._vector(query)
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        await asyncio.sleep(self.latency_s)
+        return self._vector(query)
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embeddings([text])[0]
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[Embedding]:
+        time.sleep(self.latency_s)  # un appel d'API par lot
+        return [self._vector(t) for t in texts]
+
+    async def _aget_text_embeddings(self, texts: list[str]) -> list[Embedding]:
+        await asyncio.sleep(self.latency_s)
+        return [self._vector(t) for t in texts]
+
+
+class FakeLLM(CustomLLM):
+    """
+    LLM de chat : réponse synthétique de `answer_words` mots après `latency_s`,
+    ou en streaming (premier token après `first_token_s`, puis régulier).
+    Les variantes async dorment sans bloquer la boucle d'événements.
+    """
+
+    model_name: str = "gpt-4o"
+    latency_s: float = 0.5
+    first_token_s: float = 0.2
+    answer_words: int = 120
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(model_name=self.model_name, is_chat_model=True)
+
+    def _answer(self, prompt: str) -> str:
+        return synthetic_text(prompt[-200:], self.answer_words)
+
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        time.sleep(self.latency_s)
+        return CompletionResponse(text=self._answer(prompt))
+
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        response = self.complete(prompt)
+        yield response
+
+    async def achat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        await asyncio.sleep(self.latency_s)
+        prompt = str(messages[-1].content or "")
+        return ChatResponse(message=ChatMessage(role=MessageRole.ASSISTANT, content=self._answer(prompt)))
+
+    async def astream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any):
+        words = self._answer(str(messages[-1].content or "")).split()
+        per_word = max(self.latency_s - self.first_token_s, 0.0) / max(len(words), 1)
+
+        async def gen():
+            await asyncio.sleep(self.first_token_s)
+            content = ""
+            for word in words:
+                delta = word + " "
+                content += delta
+                yield ChatResponse(message=ChatMessage(role=MessageRole.ASSISTANT, content=content), delta=delta)
+                if per_word:
+                    await asyncio.sleep(per_word)
+
+        return gen()
+
+
+class FakeLlamaParse:
+    """Remplace LlamaParse : `aload_data` rend une page markdown synthétique par page du PDF."""
+
+    latency_s = 1.0
+    words_per_page = 400
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+
+    async def aload_data(self, file_path: str) -> list[Document]:
+        from pypdf import PdfReader
+
+        await asyncio.sleep(self.latency_s)
+        n_pages = len(PdfReader(file_path).pages)
+        # Texte dérivé du contenu du PDF (comme un vrai parseur), pas de son chemin
+        with open(file_path, "rb") as f:
+            content_hash = hashlib.sha256(f.read()).hexdigest()
+        return [
+            Document(
+                text=synthetic_text(f"{content_hash}:{page}", self.words_per_page),
+                metadata={"page": page},
+            )
+            for page in range(1, n_pages + 1)
+        ]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class TavilyStubServer:
+    """
+    Serveur HTTP local imitant POST /search de Tavily (uvicorn dans un thread).
+    Usage : `with TavilyStubServer(latency_s=0.3) as server: ... server.url`
+    """
+
+    def __init__(self, latency_s: float = 0.3):
+        self.latency_s = latency_s
+        self.port = _free_port()
+        self.url = f"http://127.0.0.1:{self.port}/search"
+        self._server = None
+        self._thread: threading.Thread | None = None
+
+    def _app(self):
+        from starlette.applications import Starlette
+        from starlette.responses import JSONResponse
+        from starlette.routing import Route
+
+        async def search(request):
+            payload = await request.json()
+            await asyncio.sleep(self.latency_s)
+            query = payload.get("query", "")
+            return JSONResponse({"results": [
+                {
+                    "title": f"Étude {i + 1} : {query[:40]}",
+                    "url": f"https://example.org/article/{abs(hash((query, i))) % 10 ** 6}",
+                    "content": synthetic_text(f"{query}:{i}", 150),
+                    "score": round(0.9 - 0.1 * i, 2),
+                    "published_date": "2024-01-01",
+                }
+                for i in range(payload.get("max_results", 3))
+            ]})
+
+        return Starlette(routes=[Route("/search", search, methods=["POST"])])
+
+    def __enter__(self) -> "TavilyStubServer":
+        import uvicorn
+
+        config = uvicorn.Config(self._app(), host="127.0.0.1", port=self.port, log_level="warning")
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.should_exit = True
+        self._thread.join(timeout=5)
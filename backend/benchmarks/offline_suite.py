@@ -0,0 +1,345 @@
+"""
+Suite de benchmarks hors ligne de l'API et de l'ingestion, avec doublures
+locales (fakes.py) à latence configurable pour OpenAI (embeddings, LLM),
+Tavily (serveur HTTP local) et LlamaParse.
+
+Mesures :
+    - /chat par mode (internal, hybrid, science) à concurrence croissante :
+      latences p50/p95/p99 et débit (requêtes/s), cache de réponses désactivé
+    - ingestion (ingest_documents, processus séparé) : fichiers/min
+    - /export/gdb par format : Mo/s (taille du corps GeoJSON envoyé)
+
+Les résultats sont comparés à une baseline JSON : toute régression au-delà
+de la tolérance fait échouer le run (code de sortie 1). Une baseline n'a de
+sens que sur la machine et avec les paramètres qui l'ont produite.
+
+Usage (depuis backend/) :
+    python benchmarks/offline_suite.py --save-baseline     # enregistre la référence
+    python benchmarks/offline_suite.py                     # compare à la référence
+    python benchmarks/offline_suite.py --concurrency 1,8,32 --llm-latency-ms 800 --tolerance 0.3
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+MODES = ("internal", "hybrid", "science")
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    """Percentile par rang le plus proche (valeurs déjà triées)."""
+    if not sorted_values:
+        return float("nan")
+    rank = max(math.ceil(p / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+# --- Environnement isolé ---
+
+def setup_environment(work_dir: str) -> None:
+    """Variables lues par main.py / ingest.py à l'import : tout dans `work_dir`, aucun service réel."""
+    os.environ.update({
+        "DATA_DIR": os.path.join(work_dir, "data"),
+        "CHROMA_DB_DIR": os.path.join(work_dir, "chroma_db"),
+        "EMBEDDING_CACHE_PATH": os.path.join(work_dir, "embedding_cache.sqlite"),
+        "PDF_PAGE_CACHE_DIR": os.path.join(work_dir, "pdf_page_cache"),
+        "OPENAI_API_KEY": "sk-bench",
+        "LLAMA_CLOUD_API_KEY": "llx-bench",
+        "TAVILY_API_KEY": "tvly-bench",
+        "AUTH_USERNAME": "bench",
+        "AUTH_PASSWORD": "bench",
+        "AUTH_TOKEN_SECRET": "bench-secret",
+        "AUTH_REVOCATION_DB": "",
+        "ANSWER_CACHE_ENABLED": "false",
+        "RERANK_MODEL_DIR": "",
+    })
+
+
+def write_corpus(data_dir: str, n_files: int, pages: int) -> None:
+    """
+    PDF de `pages` pages blanches, de contenus distincts (titre) : le texte est
+    fourni par FakeLlamaParse à partir du contenu, deux fichiers identiques
+    donneraient le même texte.
+    """
+    from pypdf import PdfWriter
+
+    os.makedirs(data_dir, exist_ok=True)
+    for i in range(n_files):
+        name = f"rapport_Zone_{chr(65 + i % 26)}_{i:04d}"
+        writer = PdfWriter()
+        for _ in range(pages):
+            writer.add_blank_page(612, 792)
+        writer.add_metadata({"/Title": name})
+        with open(os.path.join(data_dir, f"{name}.pdf"), "wb") as f:
+            writer.write(f)
+
+
+# --- Ingestion (processus séparé : ingest.py applique nest_asyncio à la boucle) ---
+
+def run_ingestion(parse_latency_s: float, embed_latency_s: float) -> dict:
+    import ingest
+    from fakes import FakeEmbedding, FakeLLM, FakeLlamaParse
+
+    FakeLlamaParse.latency_s = parse_latency_s
+    ingest.LlamaParse = FakeLlamaParse
+    ingest.OpenAIEmbedding = lambda model: FakeEmbedding(latency_s=embed_latency_s)
+    ingest.OpenAI = lambda **kwargs: FakeLLM()
+
+    files = [f for f in os.listdir(ingest.DATA_DIR) if f.endswith(".pdf")]
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        ingest.ingest_documents(force=True)
+    elapsed = time.perf_counter() - start
+    return {"files": len(files), "seconds": round(elapsed, 3), "files_per_min": round(len(files) / elapsed * 60, 2)}
+
+
+# --- API ---
+
+async def load_chat(client, headers: dict, mode: str, concurrency: int, n_requests: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    errors = 0
+    rng = random.Random(f"{mode}:{concurrency}")
+    from fakes import synthetic_text
+
+    async def one(i: int) -> None:
+        nonlocal errors
+        query = f"{synthetic_text(f'{mode}:{i}:{rng.random()}', 8)} ?"
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post("/chat", json={"query": query, "mode": mode}, headers=headers)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n_requests)))
+    wall = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": n_requests,
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+        "throughput_rps": round(n_requests / wall, 2),
+    }
+
+
+def export_body(n_layers: int, n_features: int) -> bytes:
+    """Corps ExportRequest : couches de polygones (20 sommets) en GeoJSON."""
+    rng = random.Random(0)
+    layers = []
+    for layer in range(n_layers):
+        features = []
+        for i in range(n_features):
+            x, y, r = rng.uniform(-80, -60), rng.uniform(45, 60), rng.uniform(0.001, 0.05)
+            ring = [[x + r * math.cos(a / 10 * math.pi), y + r * math.sin(a / 10 * math.pi)] for a in range(20)]
+            ring.append(ring[0])
+            features.append({
+                "type": "Feature",
+                "geometry": {"type": "Polygon", "coordinates": [ring]},
+                "properties": {"id": i, "classe": rng.choice(["A", "B", "C"]), "surface": rng.random() * 1000},
+            })
+        layers.append({
+            "id": f"Bench/couche_{layer}.geojson",
+            "name": f"couche_{layer}.geojson",
+            "geojson": {"type": "FeatureCollection", "features": features},
+        })
+    return json.dumps({"layers": layers}).encode("utf-8")
+
+
+async def bench_export(client, headers: dict, export_format: str, body: bytes) -> dict:
+    start = time.perf_counter()
+    response = await client.post(
+        f"/export/gdb?format={export_format}", content=body,
+        headers={**headers, "Content-Type": "application/json"},
+    )
+    elapsed = time.perf_counter() - start
+    if response.status_code != 200:
+        return {"error": f"HTTP {response.status_code}: {response.text[:200]}"}
+    mb = len(body) / 1e6
+    return {"mb": round(mb, 2), "seconds": round(elapsed, 3), "mb_per_s": round(mb / elapsed, 2)}
+
+
+async def run_api_benchmarks(args, tavily_url: str) -> tuple[dict, dict]:
+    import httpx
+
+    os.environ["TAVILY_SEARCH_URL"] = tavily_url
+    import main
+    from fakes import FakeEmbedding, FakeLLM
+
+    main.configure_models(
+        embed_model=FakeEmbedding(latency_s=args.embed_latency_ms / 1000),
+        llm=FakeLLM(latency_s=args.llm_latency_ms / 1000, first_token_s=args.llm_latency_ms / 4000),
+    )
+
+    chat: dict[str, dict] = {}
+    export: dict[str, dict] = {}
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app):
+        if await main.aget_index() is None:
+            raise RuntimeError(f"Index non chargé : {main.index_load_error}")
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+            login = await client.post("/login", json={"username": "bench", "password": "bench"})
+            headers = {"Authorization": f"Bearer {login.json()['token']}"}
+
+            # Échauffement (tokenizer, pool de connexions) hors mesure
+            for mode in args.modes:
+                await client.post("/chat", json={"query": "échauffement", "mode": mode}, headers=headers)
+
+            for mode in args.modes:
+                for concurrency in args.concurrency:
+                    n_requests = max(args.requests, concurrency * 2)
+                    key = f"{mode}@{concurrency}"
+                    chat[key] = await load_chat(client, headers, mode, concurrency, n_requests)
+                    r = chat[key]
+                    print(f"   - /chat {key:<14} p50 {r['p50_ms']:8.1f} ms  p95 {r['p95_ms']:8.1f} ms  "
+                          f"p99 {r['p99_ms']:8.1f} ms  {r['throughput_rps']:7.2f} req/s  erreurs {r['errors']}")
+
+            if args.export_formats:
+                body = export_body(args.export_layers, args.export_features)
+                # Démarrage du pool de processus d'export hors mesure
+                await bench_export(client, headers, args.export_formats[0], export_body(1, 10))
+                for export_format in args.export_formats:
+                    export[export_format] = r = await bench_export(client, headers, export_format, body)
+                    if "error" in r:
+                        print(f"   - export {export_format:<8} ❌ {r['error']}")
+                    else:
+                        print(f"   - export {export_format:<8} {r['mb']:.1f} Mo en {r['seconds']:.2f} s → {r['mb_per_s']:.2f} Mo/s")
+    return chat, export
+
+
+# --- Baseline ---
+
+def compare_to_baseline(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Régressions au-delà de `tolerance` (0.2 = 20 %) par rapport à la baseline."""
+    regressions = []
+    for key, base in baseline.get("chat", {}).items():
+        current = results["chat"].get(key)
+        if current is None:
+            continue
+        if current["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"/chat {key} : p95 {current['p95_ms']} ms > {base['p95_ms']} ms")
+        if current["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"/chat {key} : débit {current['throughput_rps']} < {base['throughput_rps']} req/s")
+        if current["errors"] > base["errors"]:
+            regressions.append(f"/chat {key} : {current['errors']} erreur(s) (baseline {base['errors']})")
+
+    base_ingest, ingest = baseline.get("ingest"), results.get("ingest")
+    if base_ingest and ingest and ingest["files_per_min"] < base_ingest["files_per_min"] * (1 - tolerance):
+        regressions.append(f"ingestion : {ingest['files_per_min']} < {base_ingest['files_per_min']} fichiers/min")
+
+    for export_format, base in baseline.get("export", {}).items():
+        current = results["export"].get(export_format)
+        if current is None or "mb_per_s" not in base:
+            continue
+        if "error" in current:
+            regressions.append(f"export {export_format} : {current['error']}")
+        elif current["mb_per_s"] < base["mb_per_s"] * (1 - tolerance):
+            regressions.append(f"export {export_format} : {current['mb_per_s']} < {base['mb_per_s']} Mo/s")
+    return regressions
+
+
+def _int_list(value: str) -> list[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def _str_list(value: str) -> list[str]:
+    return [v.strip() for v in value.split(",") if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks hors ligne (chat, ingestion, export)")
+    parser.add_argument("--modes", type=_str_list, default=list(MODES))
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=40, help="requêtes par mode et niveau de concurrence")
+    parser.add_argument("--files", type=int, default=40, help="PDF du corpus synthétique")
+    parser.add_argument("--pages", type=int, default=10, help="pages par PDF")
+    parser.add_argument("--export-formats", type=_str_list, default=["gpkg", "fgb"])
+    parser.add_argument("--export-layers", type=int, default=5)
+    parser.add_argument("--export-features", type=int, default=5000)
+    parser.add_argument("--embed-latency-ms", type=float, default=20)
+    parser.add_argument("--llm-latency-ms", type=float, default=500)
+    parser.add_argument("--tavily-latency-ms", type=float, default=300)
+    parser.add_argument("--parse-latency-ms", type=float, default=1000)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    config = {
+        key: getattr(args, key) for key in (
+            "modes", "concurrency", "requests", "files", "pages", "export_formats", "export_layers",
+            "export_features", "embed_latency_ms", "llm_latency_ms", "tavily_latency_ms", "parse_latency_ms",
+        )
+    }
+    work_dir = tempfile.mkdtemp(prefix="rag_bench_")
+    setup_environment(work_dir)
+    results: dict = {"config": config, "chat": {}, "ingest": None, "export": {}}
+
+    try:
+        print(f"📊 Benchmarks hors ligne (répertoire de travail : {work_dir})")
+        write_corpus(os.environ["DATA_DIR"], args.files, args.pages)
+
+        # Processus « spawn » : ingest.py importé dans un interpréteur neuf
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            ingest_result = pool.submit(
+                run_ingestion, args.parse_latency_ms / 1000, args.embed_latency_ms / 1000
+            ).result()
+        results["ingest"] = ingest_result
+        print(f"   - ingestion     {ingest_result['files']} fichiers en {ingest_result['seconds']:.1f} s "
+              f"→ {ingest_result['files_per_min']:.1f} fichiers/min")
+
+        from fakes import TavilyStubServer
+
+        with TavilyStubServer(latency_s=args.tavily_latency_ms / 1000) as tavily:
+            results["chat"], results["export"] = asyncio.run(run_api_benchmarks(args, tavily.url))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"✅ Baseline enregistrée : {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"ℹ️  Pas de baseline ({args.baseline}) : relancer avec --save-baseline pour en créer une")
+        return
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("config") != config:
+        print("❌ Paramètres différents de la baseline : comparaison impossible (relancer avec --save-baseline)")
+        sys.exit(2)
+
+    regressions = compare_to_baseline(results, baseline, args.tolerance)
+    if regressions:
+        print(f"❌ {len(regressions)} régression(s) (tolérance {args.tolerance:.0%}) :")
+        for regression in regressions:
+            print(f"   - {regression}")
+        sys.exit(1)
+    print(f"✅ Aucune régression par rapport à la baseline (tolérance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Temps d'import de l'API (`import main`) mesuré par `python -X importtime`,
+avec budget : code de sortie 1 si le médian dépasse le budget, ce qui permet de
+l'utiliser comme garde en CI.
+
+Les dépendances lourdes (HEAVY_MODULES : llama_index, openai, chromadb, numpy,
+geopandas...) ne doivent pas être importées par `import main` : elles sont
+chargées au premier usage (warm-up de l'index, premier export). Le même
+contrôle tourne dans les tests (tests/test_startup.py).
+
+Usage (depuis backend/) :
+    python benchmarks/startup_time.py [--budget-ms 800] [--runs 5] [--top 10]
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BUDGET_MS = int(os.getenv("STARTUP_IMPORT_BUDGET_MS", "800"))
+HEAVY_MODULES = (
+    "llama_index.core", "llama_parse", "chromadb", "openai", "numpy", "tiktoken",
+    "geopandas", "shapely", "pyogrio", "pandas", "pyarrow", "pypdf", "onnxruntime", "tokenizers",
+)
+
+_LINE_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s+)(\S+)$")
+
+
+def measure_import() -> dict[str, int]:
+    """Temps cumulé (µs) de chaque module importé par `import main`, dans un processus neuf."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        sys.exit(f"❌ import main a échoué :\n{result.stderr[-2000:]}")
+
+    cumulative: dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        match = _LINE_RE.match(line)
+        if match:
+            cumulative[match.group(4)] = int(match.group(2))
+    return cumulative
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Budget de temps d'import de l'API")
+    parser.add_argument("--budget-ms", type=int, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    runs = [measure_import() for _ in range(args.runs)]
+    totals_ms = [run["main"] / 1000 for run in runs]
+    median_ms = statistics.median(totals_ms)
+    last = runs[-1]
+
+    print(f"📊 import main : médian {median_ms:.0f} ms sur {args.runs} run(s) "
+          f"(min {min(totals_ms):.0f}, max {max(totals_ms):.0f}), budget {args.budget_ms} ms")
+    print("   Modules les plus coûteux (cumulé, dernier run) :")
+    top = sorted((m for m in last if m != "main" and "." not in m), key=last.get, reverse=True)
+    for module in top[:args.top]:
+        print(f"   - {module:<30} {last[module] / 1000:8.1f} ms")
+
+    loaded_heavy = [m for m in HEAVY_MODULES if m in last]
+    if loaded_heavy:
+        print(f"⚠️  Dépendances lourdes importées au démarrage : {', '.join(loaded_heavy)}")
+
+    if median_ms > args.budget_ms:
+        print(f"❌ Budget dépassé ({median_ms:.0f} ms > {args.budget_ms} ms)")
+        sys.exit(1)
+    print("✅ Budget respecté")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Construction du contexte des prompts sous budget de tokens.
+
+Les extraits sont ajoutés dans l'ordre de pertinence, entiers de préférence :
+un extrait qui ne tient plus dans le budget est écarté (les suivants, plus
+courts, peuvent encore tenir) plutôt que coupé — seul un premier extrait
+plus grand que tout le budget est tronqué. Les extraits d'une même page
+(file_name, page_label) sont dédoublonnés : un extrait déjà contenu dans un
+autre est écarté, le recouvrement entre chunks consécutifs est retiré. Sans
+file_name ou page_label connus, aucun dédoublonnage.
+
+Comptage local avec tiktoken ; à défaut (encodage non disponible hors
+ligne), estimation à 4 caractères par token.
+"""
+
+from __future__ import annotations
+
+import functools
+import logging
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+CHARS_PER_TOKEN_ESTIMATE = 4
+MIN_OVERLAP_CHARS = 40
+
+
+@functools.lru_cache(maxsize=None)
+def _get_encoding(model: str):
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logger.warning(f"Tokenizer indisponible pour {model} ({e}) : estimation à {CHARS_PER_TOKEN_ESTIMATE} car./token")
+        return None
+
+
+def count_tokens(text: str, model: str) -> int:
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN_ESTIMATE)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str) -> str:
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return text[:max_tokens * CHARS_PER_TOKEN_ESTIMATE]
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+
+
+@dataclass
+class ContextItem:
+    text: str
+    title: str | None = None        # préfixe "titre: " (sources web)
+    page_key: tuple | None = None   # (file_name, page_label) pour le dédoublonnage (ignoré si incomplet)
+
+
+@dataclass
+class PackedContext:
+    text: str
+    tokens: int
+    kept: list[int] = field(default_factory=list)  # indices des items retenus, numérotés [1..n] dans cet ordre
+    dropped: int = 0                                # écartés faute de budget
+    deduplicated: int = 0                           # écartés car déjà présents
+
+
+def _strip_overlap(previous: str, text: str) -> str:
+    """Retire de `text` le recouvrement avec la fin ou le début de `previous`."""
+    # Fin de previous == début de text (chunk suivant)
+    pos = previous.find(text[:MIN_OVERLAP_CHARS])
+    if pos >= 0 and text.startswith(previous[pos:]):
+        return text[len(previous) - pos:]
+    # Fin de text == début de previous (chunk précédent)
+    pos = text.find(previous[:MIN_OVERLAP_CHARS])
+    if pos >= 0 and previous.startswith(text[pos:]):
+        return text[:pos]
+    return text
+
+
+def pack_context(
+    sections: list[tuple[str, list[ContextItem]]],
+    budget_tokens: int,
+    model: str,
+) -> PackedContext:
+    """
+    Assemble les sections (en-tête, items) en un seul texte numéroté [1], [2]...
+    (numérotation continue entre sections) sans dépasser `budget_tokens`.
+    """
+    parts: list[str] = []
+    kept: list[int] = []
+    used = 0
+    dropped = deduplicated = 0
+    seen_by_page: dict[tuple, list[str]] = {}
+    offset = 0
+
+    for header, items in sections:
+        header_tokens = count_tokens(header, model)
+        header_added = False
+        for i, item in enumerate(items):
+            text = item.text.strip()
+            # (None, None) est vrai : seules les clés complètes identifient une page
+            page_key = item.page_key if item.page_key and all(item.page_key) else None
+            previous = seen_by_page.get(page_key, []) if page_key else []
+            if any(text in p for p in previous):
+                deduplicated += 1
+                continue
+            for p in previous:
+                text = _strip_overlap(p, text).strip()
+            if not text:
+                deduplicated += 1
+                continue
+
+            label = f"[{len(kept) + 1}] {item.title}: " if item.title else f"[{len(kept) + 1}] "
+            block = label + text
+            # +1 : séparateur entre blocs
+            extra_tokens = 1 + (0 if header_added else header_tokens)
+            block_tokens = count_tokens(block, model) + extra_tokens
+            if used + block_tokens > budget_tokens:
+                if kept:
+                    dropped += 1
+                    continue
+                # Premier extrait plus grand que le budget : tronqué plutôt que rien
+                block = truncate_to_tokens(block, max(budget_tokens - used - extra_tokens, 0), model)
+                block_tokens = count_tokens(block, model) + extra_tokens
+
+            if not header_added:
+                if header:
+                    parts.append(header)
+                header_added = True
+            parts.append(block)
+            used += block_tokens
+            kept.append(offset + i)
+            if page_key:
+                seen_by_page.setdefault(page_key, []).append(text)
+        offset += len(items)
+
+    return PackedContext(
+        text="\n\n".join(parts),
+        tokens=used,
+        kept=kept,
+        dropped=dropped,
+        deduplicated=deduplicated,
+    )
@@ -0,0 +1,77 @@
+"""
+Index en mémoire groupe → fichiers pour le filtre spatial.
+
+Convention (inchangée) : un groupe GeoJSON correspond à un PDF si le nom du
+groupe, en minuscules, est CONTENU dans le stem du fichier en minuscules.
+
+Au lieu de parcourir tous les stems pour chaque groupe, l'index associe chaque
+trigramme de stem aux fichiers qui le contiennent : les candidats d'un groupe
+sont l'intersection des listes de ses trigrammes (la plus courte d'abord),
+puis la sous-chaîne est vérifiée sur ces seuls candidats. Les résolutions sont
+mémorisées par groupe (LRU de MEMO_SIZE groupes : les noms de groupes viennent
+des requêtes) jusqu'à la reconstruction suivante de l'index.
+"""
+
+from __future__ import annotations
+
+from collections import OrderedDict
+from pathlib import Path
+
+NGRAM = 3
+MEMO_SIZE = 1024
+
+
+def _ngrams(text: str) -> set[str]:
+    return {text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1)}
+
+
+class DocumentFilterIndex:
+    """Résolution groupe → `file_name` par index de trigrammes des stems."""
+
+    def __init__(self, file_names: list[str]):
+        self.file_names = sorted(set(file_names))
+        self._stems = [Path(name).stem.lower() for name in self.file_names]
+        self._postings: dict[str, list[int]] = {}
+        for file_id, stem in enumerate(self._stems):
+            for gram in _ngrams(stem):
+                self._postings.setdefault(gram, []).append(file_id)
+        self._memo: OrderedDict[str, tuple[int, ...]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.file_names)
+
+    def _match_group(self, group: str) -> tuple[int, ...]:
+        matches = self._memo.get(group)
+        if matches is not None:
+            self._memo.move_to_end(group)
+            return matches
+
+        if len(group) < NGRAM:
+            # Groupe trop court pour l'index : parcours des stems
+            candidates = range(len(self._stems))
+        else:
+            postings = sorted(
+                (self._postings.get(gram, ()) for gram in _ngrams(group)), key=len
+            )
+            if not postings[0]:
+                candidates = ()
+            else:
+                candidate_set = set(postings[0])
+                for posting in postings[1:]:
+                    candidate_set.intersection_update(posting)
+                    if not candidate_set:
+                        break
+                candidates = candidate_set
+
+        matches = tuple(i for i in candidates if group in self._stems[i])
+        self._memo[group] = matches
+        if len(self._memo) > MEMO_SIZE:
+            self._memo.popitem(last=False)
+        return matches
+
+    def resolve(self, groups: list[str]) -> list[str]:
+        """`file_name` triés dont le stem contient au moins un des groupes."""
+        file_ids: set[int] = set()
+        for group in groups:
+            file_ids.update(self._match_group(group.lower()))
+        return [self.file_names[i] for i in sorted(file_ids)]
@@ -0,0 +1,159 @@
+"""
+Cache persistant d'embeddings (SQLite) : sha256(modèle, type, texte) → vecteur.
+
+`CachedEmbedding` enveloppe le modèle d'embedding de LlamaIndex : ingestion et
+requêtes consultent d'abord le cache, puis n'envoient à l'API que les textes
+absents (en un seul lot). Une réingestion --force d'un corpus inchangé ne
+fait donc aucun appel d'embedding.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import threading
+from array import array
+
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from pydantic import PrivateAttr
+
+from telemetry import CACHE_REQUESTS
+
+
+class EmbeddingStore:
+    """Table SQLite clé de contenu → vecteur float32."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        # WAL : l'API peut lire pendant qu'ingest.py écrit
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get_many(self, keys: list[str]) -> dict[str, list[float]]:
+        found: dict[str, list[float]] = {}
+        with self._lock:
+            # Par tranches pour rester sous la limite de paramètres SQLite
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+        return found
+
+    def put_many(self, items: dict[str, list[float]]) -> None:
+        if not items:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, array("f", vector).tobytes()) for key, vector in items.items()],
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class CachedEmbedding(BaseEmbedding):
+    """Modèle d'embedding avec cache persistant devant un modèle `inner`."""
+
+    _inner: BaseEmbedding = PrivateAttr()
+    _store: EmbeddingStore = PrivateAttr()
+    _api_calls: int = PrivateAttr(default=0)
+
+    def __init__(self, inner: BaseEmbedding, cache_path: str, **kwargs):
+        super().__init__(
+            model_name=inner.model_name,
+            embed_batch_size=inner.embed_batch_size,
+            **kwargs,
+        )
+        self._inner = inner
+        self._store = EmbeddingStore(cache_path)
+        self._api_calls = 0
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def api_calls(self) -> int:
+        """Nombre d'appels (lots) transmis au modèle sous-jacent."""
+        return self._api_calls
+
+    def _key(self, kind: str, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{kind}\0{text}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, kind: str, texts: list[str]) -> tuple[list[str], dict[str, list[float]], list[int]]:
+        keys = [self._key(kind, t) for t in texts]
+        cached = self._store.get_many(list(dict.fromkeys(keys)))
+        # Une seule occurrence par texte manquant (les doublons sont servis par _merge)
+        missing: list[int] = []
+        seen: set[str] = set()
+        for i, key in enumerate(keys):
+            if key not in cached and key not in seen:
+                seen.add(key)
+                missing.append(i)
+        CACHE_REQUESTS.inc("embedding", "hit", amount=len(keys) - len(missing))
+        CACHE_REQUESTS.inc("embedding", "miss", amount=len(missing))
+        return keys, cached, missing
+
+    def _merge(
+        self,
+        keys: list[str],
+        cached: dict[str, list[float]],
+        missing: list[int],
+        new_vectors: list[list[float]],
+    ) -> list[Embedding]:
+        fresh = {keys[i]: vector for i, vector in zip(missing, new_vectors)}
+        self._store.put_many(fresh)
+        cached.update(fresh)
+        return [cached[key] for key in keys]
+
+    # --- Requêtes ---
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        keys, cached, missing = self._lookup("query", [query])
+        if not missing:
+            return cached[keys[0]]
+        self._api_calls += 1
+        return self._merge(keys, cached, missing, [self._inner.get_query_embedding(query)])[0]
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        keys, cached, missing = self._lookup("query", [query])
+        if not missing:
+            return cached[keys[0]]
+        self._api_calls += 1
+        return self._merge(keys, cached, missing, [await self._inner.aget_query_embedding(query)])[0]
+
+    # --- Textes (ingestion) ---
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[Embedding]:
+        keys, cached, missing = self._lookup("text", texts)
+        new_vectors: list[list[float]] = []
+        if missing:
+            self._api_calls += 1
+            new_vectors = self._inner.get_text_embedding_batch([texts[i] for i in missing])
+        return self._merge(keys, cached, missing, new_vectors)
+
+    async def _aget_text_embeddings(self, texts: list[str]) -> list[Embedding]:
+        keys, cached, missing = self._lookup("text", texts)
+        new_vectors: list[list[float]] = []
+        if missing:
+            self._api_calls += 1
+            new_vectors = await self._inner.aget_text_embedding_batch([texts[i] for i in missing])
+        return self._merge(keys, cached, missing, new_vectors)
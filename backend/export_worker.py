@@ -0,0 +1,176 @@
+"""
+Conversion d'une couche d'export en GeoDataFrame, exécutée dans les processus
+du pool d'export (main.get_export_executor).
+
+Module volontairement léger (pas de FastAPI ni de LlamaIndex) : les processus
+du pool ne chargent que geopandas/pyogrio. Les fonctions d'écriture
+(write_export_layer, finalize_export) sont appelées côté API, dans le thread
+du job d'export.
+"""
+
+from __future__ import annotations
+
+import os
+import shutil
+import zipfile
+
+
+def resolve_layer_path(geojson_dir: str, layer_id: str) -> str:
+    """
+    Chemin d'une couche `Groupe/fichier.geojson` sous `geojson_dir`
+    (mêmes règles que l'API layers du frontend).
+
+    Raises:
+        PermissionError: chemin hors de `geojson_dir`
+        ValueError: extension autre que .geojson/.json
+        FileNotFoundError: fichier absent
+    """
+    root = os.path.abspath(geojson_dir)
+    layer_path = os.path.abspath(os.path.join(root, layer_id))
+
+    if not layer_path.startswith(root + os.sep):
+        raise PermissionError("Access denied")
+
+    if not layer_path.endswith(('.geojson', '.json')):
+        raise ValueError(f"Type de fichier invalide : {layer_id}")
+
+    if not os.path.exists(layer_path):
+        raise FileNotFoundError(f"Couche introuvable : {layer_id}")
+
+    return layer_path
+
+
+def load_export_layer(layer: dict, bbox: list[float] | None, geojson_dir: str):
+    """
+    GeoDataFrame d'une couche à exporter (`layer` = GeoJSONLayer sérialisé) :
+    GeoJSON fourni dans la requête, ou à défaut lecture directe du fichier
+    source avec pyogrio (Arrow si pyarrow est installé, filtre bbox appliqué à
+    la lecture). Si `bbox` est fourni, les géométries sont découpées à l'emprise.
+    Les couches sources sont supposées en EPSG:4326 (RFC 7946).
+
+    Returns:
+        GeoDataFrame, ou None si la couche est vide.
+
+    Raises:
+        PermissionError, FileNotFoundError: voir resolve_layer_path
+        ValueError: GeoJSON ou fichier source invalide (géométrie inconnue,
+            coordonnées mal formées...), quelle que soit l'exception levée par
+            shapely/pyogrio — l'API la traduit en 422.
+    """
+    import geopandas as gpd
+
+    if layer.get("geojson") is not None:
+        features = layer["geojson"].get("features", [])
+        if not features:
+            return None
+        try:
+            gdf = gpd.GeoDataFrame.from_features(features, crs="EPSG:4326")
+        except Exception as e:
+            raise ValueError(f"GeoJSON invalide ({type(e).__name__}: {e})") from e
+    else:
+        from pyogrio import read_dataframe
+        try:
+            import pyarrow  # noqa: F401 — lecture vectorisée via Arrow
+            use_arrow = True
+        except ImportError:
+            use_arrow = False
+        layer_path = resolve_layer_path(geojson_dir, layer["id"])
+        try:
+            gdf = read_dataframe(layer_path, bbox=tuple(bbox) if bbox else None, use_arrow=use_arrow)
+        except Exception as e:
+            raise ValueError(f"Couche illisible ({type(e).__name__}: {e})") from e
+        if gdf.crs is None:
+            gdf = gdf.set_crs("EPSG:4326")
+
+    if bbox is not None and not gdf.empty:
+        try:
+            gdf = gdf.clip(bbox)
+        except Exception as e:
+            raise ValueError(f"Découpage impossible ({type(e).__name__}: {e})") from e
+
+    if gdf.empty or gdf.geometry.isna().all():
+        return None
+    return gdf
+
+
+def unique_layer_name(base_name: str, used_names: set[str]) -> str:
+    """`base_name`, suffixé `_1`, `_2`... s'il est déjà pris ; réservé dans `used_names`."""
+    fc_name = base_name
+    suffix = 1
+    while fc_name in used_names:
+        fc_name = f"{base_name}_{suffix}"
+        suffix += 1
+    used_names.add(fc_name)
+    return fc_name
+
+
+# Sans cette option, le driver OpenFileGDB écrit les champs Integer64 en Float64
+# (perte de précision au-delà de 2^53) : les entiers 64 bits exigent ArcGIS Pro 3.2+
+GDB_LAYER_OPTIONS = {"TARGET_ARCGIS_VERSION": "ARCGIS_PRO_3_2_OR_LATER"}
+
+
+def write_export_layer(
+    gdf, export_format: str, work_dir: str, fc_name: str, append: bool, used_names: set[str] | None = None
+) -> None:
+    """
+    Écrit une couche dans le format demandé :
+    - gpkg / gdb : un seul conteneur multi-couches (append des couches suivantes)
+    - fgb / parquet : un fichier par couche (zippés à la fin par finalize_export)
+
+    `used_names` : noms de couches déjà attribués dans l'export ; les feature
+    classes issues d'une couche GDB mixte y sont rendues uniques.
+    """
+    from pyogrio import write_dataframe as pyogrio_write
+
+    if export_format == "gpkg":
+        # GeoPackage : pyogrio respecte parfaitement layer= pour le nommage
+        # append=False (1re couche) → crée le GPKG ; append=True (suivantes) → ajoute une couche
+        pyogrio_write(gdf, os.path.join(work_dir, "export.gpkg"), layer=fc_name, driver="GPKG", append=append)
+    elif export_format == "gdb":
+        # Une feature class n'a qu'un type de géométrie : Polygon/MultiPolygon sont
+        # promus en Multi*, et une couche mixte (points + polygones...) est scindée
+        # en une feature class par famille de géométrie.
+        gdb_path = os.path.join(work_dir, "export_couches.gdb")
+        families = gdf.geometry.geom_type.str.replace("Multi", "", regex=False)
+        if families.nunique(dropna=True) <= 1:
+            pyogrio_write(
+                gdf, gdb_path, layer=fc_name, driver="OpenFileGDB", append=append,
+                promote_to_multi=True, layer_options=GDB_LAYER_OPTIONS,
+            )
+        else:
+            used_names = used_names if used_names is not None else {fc_name}
+            for family, part in gdf.groupby(families):
+                # 50 + 1 + "linestring" + suffixe d'unicité : sous la limite de 64 caractères
+                part_name = unique_layer_name(f"{fc_name[:50]}_{family.lower()}", used_names)
+                pyogrio_write(
+                    part, gdb_path, layer=part_name, driver="OpenFileGDB", append=append,
+                    promote_to_multi=True, layer_options=GDB_LAYER_OPTIONS,
+                )
+                append = True
+    elif export_format == "fgb":
+        # FlatGeobuf avec index spatial (R-tree packé) : lecture en streaming par emprise
+        pyogrio_write(gdf, os.path.join(work_dir, "layers", f"{fc_name}.fgb"), driver="FlatGeobuf", SPATIAL_INDEX="YES")
+    elif export_format == "parquet":
+        gdf.to_parquet(os.path.join(work_dir, "layers", f"{fc_name}.parquet"), compression="zstd")
+    else:
+        raise ValueError(f"Format d'export inconnu : {export_format}")
+
+
+def finalize_export(work_dir: str, export_format: str, zip_name: str) -> str:
+    """Chemin du fichier à télécharger : le GPKG tel quel, sinon une archive zip."""
+    if export_format == "gpkg":
+        return os.path.join(work_dir, "export.gpkg")
+
+    source_dir = os.path.join(work_dir, "export_couches.gdb" if export_format == "gdb" else "layers")
+    # GeoParquet est déjà compressé (zstd) : stockage sans recompression
+    compression = zipfile.ZIP_STORED if export_format == "parquet" else zipfile.ZIP_DEFLATED
+    zip_path = os.path.join(work_dir, zip_name)
+    with zipfile.ZipFile(zip_path, "w", compression=compression) as zf:
+        for root, _, files in os.walk(source_dir):
+            for file_name in sorted(files):
+                file_path = os.path.join(root, file_name)
+                # .gdb : le répertoire lui-même est conservé dans l'archive
+                arcname = os.path.relpath(file_path, work_dir if export_format == "gdb" else source_dir)
+                zf.write(file_path, arcname)
+    shutil.rmtree(source_dir, ignore_errors=True)
+    return zip_path
@@ -1,15 +1,29 @@
 import os
 import sys
+import time
+import asyncio
+from dataclasses import dataclass, field
 import nest_asyncio
 from dotenv import load_dotenv
 from llama_parse import LlamaParse
-from llama_index.core import VectorStoreIndex, SimpleDirectoryReader, StorageContext, Settings, Document
+from llama_index.core import Settings, Document
+from llama_index.core.ingestion import run_transformations
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import MetadataMode
 from llama_index.vector_stores.chroma import ChromaVectorStore
 from llama_index.embeddings.openai import OpenAIEmbedding
 from llama_index.llms.openai import OpenAI
 import chromadb
 from pypdf import PdfReader
 import json
+import hashlib
+import uuid
+
+from answer_cache import touch_ingest_stamp
+from embedding_cache import CachedEmbedding
+from ingest_manifest import IngestManifest, file_sha256, manifest_path
+from lexical_index import build_lexical_index, lexical_index_dir
+from retrieval import collection_embedding_model, set_collection_embedding_model
 
 # Apply nest_asyncio to allow nested event loops (useful for LlamaParse)
 nest_asyncio.apply()
@@ -22,6 +36,17 @@ DATA_DIR = os.getenv("DATA_DIR", "./data")
 CHROMA_DB_DIR = os.getenv("CHROMA_DB_DIR", "./chroma_db")
 LLAMA_CLOUD_API_KEY = os.getenv("LLAMA_CLOUD_API_KEY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache.sqlite")
+
+# Cache disque du markdown LlamaParse (clé : sha256 du PDF) — permet la reprise sans reparser
+PARSE_CACHE_DIR = os.getenv("PARSE_CACHE_DIR", os.path.join(CHROMA_DB_DIR, "parse_cache"))
+
+# Pipeline d'ingestion : concurrence par étage et taille des files entre étages
+PARSE_CONCURRENCY = int(os.getenv("INGEST_PARSE_CONCURRENCY", "4"))
+EMBED_CONCURRENCY = int(os.getenv("INGEST_EMBED_CONCURRENCY", "2"))
+UPSERT_CONCURRENCY = int(os.getenv("INGEST_UPSERT_CONCURRENCY", "1"))
+PIPELINE_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "4"))
 
 def check_env_vars():
     missing = []
@@ -37,22 +62,20 @@ def check_env_vars():
     return True
 
 
-def parse_pdf_with_pages(pdf_path, parser):
-    """Parse PDF using LlamaParse and extract page information"""
-    print(f"   Parsing {os.path.basename(pdf_path)}...")
-
-    # Parse with LlamaParse
-    documents = parser.load_data(pdf_path)
-
-    # Get page count from PDF
+def count_pdf_pages(pdf_path):
+    """Nombre de pages du PDF (None si illisible)"""
     try:
         pdf_reader = PdfReader(pdf_path)
         total_pages = len(pdf_reader.pages)
-        print(f"   PDF has {total_pages} pages")
+        print(f"   {os.path.basename(pdf_path)}: {total_pages} pages")
+        return total_pages
     except Exception as e:
-        print(f"   Warning: Could not read page count: {e}")
-        total_pages = None
+        print(f"   Warning: Could not read page count for {os.path.basename(pdf_path)}: {e}")
+        return None
+
 
+def enrich_documents(documents, pdf_path, total_pages):
+    """Ajoute file_name, page_label et content_type aux documents LlamaParse"""
     # LlamaParse returns documents but may not have page info
     # Try to get page info from LlamaParse JSON result
     enriched_docs = []
@@ -82,10 +105,275 @@ def parse_pdf_with_pages(pdf_path, parser):
                 page_num = idx + 1
 
         doc.metadata["page_label"] = str(page_num)
+
+        # Check if content contains markdown tables
+        if "|" in doc.text and "---" in doc.text:
+            doc.metadata["content_type"] = "table"
+        else:
+            doc.metadata["content_type"] = "text"
+
         enriched_docs.append(doc)
 
     return enriched_docs
 
+
+def parse_cache_file(sha256):
+    """Chemin du markdown LlamaParse mis en cache pour un contenu de PDF donné"""
+    return os.path.join(PARSE_CACHE_DIR, f"{sha256}.json")
+
+
+def load_parse_cache(cache_file):
+    """Documents LlamaParse depuis le cache disque (None si absent ou illisible)"""
+    try:
+        with open(cache_file, "r", encoding="utf-8") as f:
+            return [Document(text=d["text"], metadata=d["metadata"]) for d in json.load(f)]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def save_parse_cache(cache_file, documents):
+    """Écriture atomique (tmp + rename) : un arrêt brutal ne laisse pas de cache tronqué"""
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    # Nom temporaire unique : deux PDFs identiques partagent la même entrée de cache
+    tmp_file = f"{cache_file}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump([{"text": doc.text, "metadata": doc.metadata} for doc in documents], f, ensure_ascii=False)
+    os.replace(tmp_file, cache_file)
+
+
+def remove_parse_cache(sha256):
+    try:
+        os.remove(parse_cache_file(sha256))
+    except OSError:
+        pass
+
+
+async def parse_pdf_with_pages(pdf_path, parser, sha256=None):
+    """
+    Parse PDF using LlamaParse and extract page information.
+    Si `sha256` est fourni, le résultat LlamaParse est lu/écrit dans le cache
+    disque : une reprise après interruption ne reparse pas le fichier.
+    """
+    cache_file = parse_cache_file(sha256) if sha256 else None
+    cached = load_parse_cache(cache_file) if cache_file else None
+
+    if cached is not None:
+        print(f"   {os.path.basename(pdf_path)}: parsing repris du cache")
+        documents, total_pages = cached, await asyncio.to_thread(count_pdf_pages, pdf_path)
+    else:
+        print(f"   Parsing {os.path.basename(pdf_path)}...")
+        # Parsing LlamaParse et comptage des pages en parallèle
+        documents, total_pages = await asyncio.gather(
+            parser.aload_data(pdf_path),
+            asyncio.to_thread(count_pdf_pages, pdf_path),
+        )
+        if cache_file:
+            save_parse_cache(cache_file, documents)
+
+    # Ids déterministes par fichier : une reprise réécrit exactement les mêmes chunks
+    # (le sha256 ne sert qu'à détecter les modifications et au cache de parsing)
+    key = document_key(pdf_path)
+    for idx, doc in enumerate(documents):
+        doc.id_ = f"{key}-{idx}"
+    return enrich_documents(documents, pdf_path, total_pages)
+
+
+def document_key(pdf_path):
+    """
+    Clé d'un fichier dans les ids de documents et de chunks, dérivée de son
+    chemin relatif à DATA_DIR : deux PDFs identiques sous des noms différents
+    ont chacun leurs chunks.
+    """
+    rel_path = os.path.relpath(pdf_path, DATA_DIR).replace(os.sep, "/")
+    return hashlib.sha256(rel_path.encode("utf-8")).hexdigest()[:32]
+
+
+def deterministic_chunk_id(i, doc):
+    """id_func du découpage : id de chunk dérivé de l'id (déterministe) du document"""
+    return f"{doc.id_}-{i}"
+
+
+@dataclass
+class IngestJob:
+    """Un fichier PDF traversant le pipeline parse → embed → upsert"""
+    pdf_file: str
+    sha256: str = ""
+    size: int = 0
+    mtime: float = 0.0
+    documents: list = field(default_factory=list)
+    nodes: list = field(default_factory=list)
+
+
+_STAGE_DONE = object()
+
+
+async def run_pipeline(items, stages, queue_size):
+    """
+    Pipeline asynchrone à étages. `stages` est une liste de
+    (nom, coroutine(item) -> item | None, concurrence). Chaque étage a sa
+    propre file bornée (`queue_size`) : un étage lent bloque l'amont
+    (backpressure mémoire) au lieu d'accumuler les résultats.
+    Un item en erreur ou renvoyant None est abandonné sans bloquer les autres.
+    """
+    queues = [asyncio.Queue(maxsize=queue_size) for _ in stages]
+
+    async def feed():
+        for item in items:
+            await queues[0].put(item)
+        for _ in range(stages[0][2]):
+            await queues[0].put(_STAGE_DONE)
+
+    async def worker(i):
+        name, fn, _ = stages[i]
+        while True:
+            item = await queues[i].get()
+            if item is _STAGE_DONE:
+                return
+            try:
+                result = await fn(item)
+            except Exception as e:
+                print(f"❌ Error ({name}) {getattr(item, 'pdf_file', item)}: {e}")
+                continue
+            if result is not None and i + 1 < len(stages):
+                await queues[i + 1].put(result)
+
+    async def run_stage(i):
+        await asyncio.gather(*(worker(i) for _ in range(stages[i][2])))
+        if i + 1 < len(stages):
+            for _ in range(stages[i + 1][2]):
+                await queues[i + 1].put(_STAGE_DONE)
+
+    await asyncio.gather(feed(), *(run_stage(i) for i in range(len(stages))))
+
+
+async def ingest_files(jobs, parser, embed_model, vector_store, manifest):
+    """
+    Ingestion pipelinée : parsing LlamaParse (PARSE_CONCURRENCY jobs), puis
+    découpage + embedding (EMBED_CONCURRENCY), puis upsert Chroma
+    (UPSERT_CONCURRENCY). Chaque fichier est indexé dès que son parsing est
+    terminé, sans attendre le reste du corpus.
+
+    Après l'upsert d'un fichier modifié, ses anciens chunks sont supprimés
+    puis le manifeste est mis à jour (sha256, taille, mtime, ids des chunks).
+
+    Returns:
+        Liste des IngestJob indexés avec succès.
+    """
+    completed = []
+
+    async def parse_stage(job):
+        job.documents = await parse_pdf_with_pages(os.path.join(DATA_DIR, job.pdf_file), parser, job.sha256)
+        if not job.documents:
+            # Ex: PDF scanné sans couche texte. Enregistré quand même (0 chunk) :
+            # il ne sera pas reparsé à chaque exécution
+            print(f"⚠️  {job.pdf_file}: aucun contenu extrait")
+        return job
+
+    async def embed_stage(job):
+        if not job.documents:
+            job.nodes = []
+            return job
+        job.nodes = await asyncio.to_thread(run_transformations, job.documents, Settings.transformations)
+        embeddings = await embed_model.aget_text_embedding_batch(
+            [node.get_content(metadata_mode=MetadataMode.EMBED) for node in job.nodes]
+        )
+        for node, embedding in zip(job.nodes, embeddings):
+            node.embedding = embedding
+        job.documents = []  # libère le texte parsé, seuls les nœuds restent nécessaires
+        return job
+
+    async def upsert_stage(job):
+        chunk_ids = []
+        if job.nodes:  # Chroma refuse une liste d'ids vide
+            # Upsert idempotent : les ids étant déterministes, on retire d'abord
+            # d'éventuels chunks écrits par une exécution interrompue
+            await asyncio.to_thread(vector_store.delete_nodes, [node.node_id for node in job.nodes])
+            chunk_ids = await asyncio.to_thread(vector_store.add, job.nodes)
+        previous = manifest.get(job.pdf_file)
+        if previous:
+            # Fichier modifié : remplace ses anciens chunks
+            stale_ids = [chunk_id for chunk_id in previous.chunk_ids if chunk_id not in set(chunk_ids)]
+            if stale_ids:
+                await asyncio.to_thread(vector_store.delete_nodes, stale_ids)
+            if previous.sha256 and previous.sha256 != job.sha256:
+                remove_parse_cache(previous.sha256)
+        # Point de reprise : le fichier n'est marqué ingéré qu'une fois ses chunks écrits
+        manifest.put(job.pdf_file, job.sha256, job.size, job.mtime, chunk_ids)
+        print(f"   ✅ {job.pdf_file}: {len(job.nodes)} chunks indexés")
+        completed.append(job)
+        job.nodes = []
+        return None
+
+    await run_pipeline(
+        jobs,
+        [
+            ("parse", parse_stage, PARSE_CONCURRENCY),
+            ("embed", embed_stage, EMBED_CONCURRENCY),
+            ("upsert", upsert_stage, UPSERT_CONCURRENCY),
+        ],
+        queue_size=PIPELINE_QUEUE_SIZE,
+    )
+    return completed
+
+
+def bootstrap_manifest(chroma_collection, manifest):
+    """Construit le manifeste à partir des chunks existants (migration, O(chunks) une seule fois)."""
+    print("   Manifeste absent : reconstruction depuis la collection existante...")
+    existing = chroma_collection.get(include=["metadatas"])
+    chunk_ids_by_file: dict[str, list[str]] = {}
+    for chunk_id, meta in zip(existing["ids"], existing["metadatas"]):
+        if meta and "file_name" in meta:
+            chunk_ids_by_file.setdefault(meta["file_name"], []).append(chunk_id)
+
+    for file_name, chunk_ids in chunk_ids_by_file.items():
+        pdf_path = os.path.join(DATA_DIR, file_name)
+        if os.path.exists(pdf_path):
+            stat = os.stat(pdf_path)
+            manifest.put(file_name, file_sha256(pdf_path), stat.st_size, stat.st_mtime, chunk_ids)
+        else:
+            # Fichier disparu : entrée sans empreinte, ses chunks seront retirés
+            manifest.put(file_name, "", 0, 0.0, chunk_ids)
+    print(f"   {len(chunk_ids_by_file)} fichier(s) repris dans le manifeste")
+
+
+def plan_ingestion(pdf_files, manifest):
+    """
+    Compare les PDFs au manifeste : taille + mtime identiques → inchangé sans
+    relire le fichier ; sinon sha256, et réingestion seulement si le contenu
+    a changé.
+
+    Returns:
+        (jobs à ingérer, nombre de fichiers inchangés)
+    """
+    jobs = []
+    unchanged = 0
+    for pdf_file in pdf_files:
+        pdf_path = os.path.join(DATA_DIR, pdf_file)
+        stat = os.stat(pdf_path)
+        entry = manifest.get(pdf_file)
+        if entry and entry.size == stat.st_size and entry.mtime == stat.st_mtime:
+            unchanged += 1
+            continue
+
+        sha256 = file_sha256(pdf_path)
+        if entry and entry.sha256 == sha256:
+            manifest.update_stat(pdf_file, stat.st_size, stat.st_mtime)
+            unchanged += 1
+            continue
+
+        jobs.append(IngestJob(pdf_file=pdf_file, sha256=sha256, size=stat.st_size, mtime=stat.st_mtime))
+    return jobs, unchanged
+
+
+def publish_index_update(chroma_collection) -> None:
+    """Reconstruit l'index BM25 depuis la collection puis signale la mise à jour à l'API."""
+    start = time.perf_counter()
+    indexed = build_lexical_index(chroma_collection, lexical_index_dir(CHROMA_DB_DIR))
+    print(f"🔤 Index BM25 reconstruit : {indexed} chunks en {time.perf_counter() - start:.1f}s")
+    # L'API recharge ses index et vide le cache de réponses au changement de ce fichier
+    touch_ingest_stamp(os.path.join(CHROMA_DB_DIR, "ingest_stamp"))
+
+
 def ingest_documents(force: bool = False):
     if not check_env_vars():
         return
@@ -93,17 +381,29 @@ def ingest_documents(force: bool = False):
     print(f"🚀 Starting ingestion process...")
     print(f"   - Data Directory: {DATA_DIR}")
     print(f"   - ChromaDB Directory: {CHROMA_DB_DIR}")
+    print(f"   - Concurrency: parse={PARSE_CONCURRENCY}, embed={EMBED_CONCURRENCY}, upsert={UPSERT_CONCURRENCY}")
     if force:
         print("   - Mode: FORCE (réingestion complète)")
 
     # 1. Setup Global Settings
-    Settings.embedding = OpenAIEmbedding(model="text-embedding-3-small")
+    # Embeddings via le cache persistant : seuls les chunks inédits partent à l'API
+    embed_model = CachedEmbedding(OpenAIEmbedding(model=EMBEDDING_MODEL), cache_path=EMBEDDING_CACHE_PATH)
+    Settings.embed_model = embed_model
     Settings.llm = OpenAI(model="gpt-4o", temperature=0)
+    Settings.node_parser = SentenceSplitter(id_func=deterministic_chunk_id)
 
-    # 2. Setup Vector Database (Chroma) — avant le parsing pour filtrer
+    # 2. Setup Vector Database (Chroma) et manifeste — avant le parsing pour filtrer
     print(f"💾 Connecting to ChromaDB...")
     db = chromadb.PersistentClient(path=CHROMA_DB_DIR)
 
+    if not force:
+        # Vecteurs d'un autre modèle (même dimension, autre espace) : le manifeste
+        # les jugerait à jour, seule une réingestion complète les remplace
+        stored_model = collection_embedding_model(db.get_or_create_collection("rag_collection"))
+        if stored_model not in (None, EMBEDDING_MODEL):
+            print(f"   Collection indexée avec {stored_model}, EMBEDDING_MODEL={EMBEDDING_MODEL} : réingestion complète")
+            force = True
+
     if force:
         # Mode --force : supprimer et recréer la collection
         try:
@@ -113,31 +413,45 @@ def ingest_documents(force: bool = False):
             pass
 
     chroma_collection = db.get_or_create_collection("rag_collection")
+    set_collection_embedding_model(chroma_collection, EMBEDDING_MODEL)
+    vector_store = ChromaVectorStore(chroma_collection=chroma_collection)
 
-    # Identifier les fichiers déjà ingérés
-    already_ingested: set[str] = set()
-    if not force:
-        existing_metadata = chroma_collection.get(include=["metadatas"])
-        for meta in existing_metadata["metadatas"]:
-            if "file_name" in meta:
-                already_ingested.add(meta["file_name"])
-        if already_ingested:
-            print(f"   Fichiers déjà indexés : {', '.join(sorted(already_ingested))}")
-
-    # 3. Lister et filtrer les PDFs
-    pdf_files = [f for f in os.listdir(DATA_DIR) if f.endswith('.pdf')]
-
-    if not pdf_files:
+    manifest = IngestManifest(manifest_path(CHROMA_DB_DIR))
+    if force:
+        manifest.clear()
+    elif len(manifest) == 0 and chroma_collection.count() > 0:
+        # Collection antérieure au manifeste : reconstruction unique depuis Chroma
+        bootstrap_manifest(chroma_collection, manifest)
+
+    # 3. Lister les PDFs et comparer au manifeste
+    pdf_files = sorted(f for f in os.listdir(DATA_DIR) if f.endswith('.pdf'))
+    jobs, unchanged = plan_ingestion(pdf_files, manifest)
+
+    # Fichiers supprimés du répertoire : retirer leurs chunks
+    on_disk = set(pdf_files)
+    removed = [entry for name, entry in manifest.entries().items() if name not in on_disk]
+    for entry in removed:
+        if entry.chunk_ids:
+            vector_store.delete_nodes(entry.chunk_ids)
+        manifest.delete(entry.file_name)
+        if entry.sha256:
+            remove_parse_cache(entry.sha256)
+        print(f"   🗑️  {entry.file_name}: supprimé ({len(entry.chunk_ids)} chunks retirés)")
+
+    if not pdf_files and not removed:
         print("⚠️  No PDF documents found to ingest.")
         return
 
-    new_pdf_files = [f for f in pdf_files if f not in already_ingested]
-
-    if not new_pdf_files:
+    if not jobs:
+        if removed or not os.path.exists(lexical_index_dir(CHROMA_DB_DIR)):
+            publish_index_update(chroma_collection)
         print("✅ Aucun nouveau document à ingérer. La base est à jour.")
         return
 
-    print(f"   {len(new_pdf_files)} nouveau(x) fichier(s) à ingérer (sur {len(pdf_files)} total)")
+    print(f"   {len(jobs)} fichier(s) nouveau(x) ou modifié(s) à ingérer (sur {len(pdf_files)} total, {unchanged} inchangé(s))")
+    resumable = sum(1 for job in jobs if os.path.exists(parse_cache_file(job.sha256)))
+    if resumable:
+        print(f"   Reprise : {resumable} fichier(s) déjà parsé(s), lus depuis {PARSE_CACHE_DIR}")
 
     # 4. Setup LlamaParse for text and tables
     print("📄 Parsing documents with LlamaParse (this may take a moment)...")
@@ -148,51 +462,27 @@ def ingest_documents(force: bool = False):
         num_workers=4
     )
 
-    # 5. Load Documents with page information
-    documents = []
-    for pdf_file in new_pdf_files:
-        pdf_path = os.path.join(DATA_DIR, pdf_file)
-        try:
-            pdf_docs = parse_pdf_with_pages(pdf_path, parser)
-            documents.extend(pdf_docs)
-        except Exception as e:
-            print(f"❌ Error parsing {pdf_file}: {e}")
-            continue
+    # 5. Pipeline parse → embed → upsert (ajoute à la collection existante)
+    print("⚙️  Parsing, embedding & storing (pipeline)...")
+    start = time.perf_counter()
+    completed = asyncio.run(ingest_files(jobs, parser, embed_model, vector_store, manifest))
+    elapsed = time.perf_counter() - start
 
-    if not documents:
+    if not completed:
+        if removed:
+            publish_index_update(chroma_collection)
         print("⚠️  No documents were successfully parsed.")
         return
 
-    print(f"✅ Successfully parsed {len(documents)} document chunks.")
-
-    # 6. Add content type metadata
-    print("🏷️  Adding content type metadata...")
-    for doc in documents:
-        # Check if content contains markdown tables
-        if "|" in doc.text and "---" in doc.text:
-            doc.metadata["content_type"] = "table"
-        else:
-            doc.metadata["content_type"] = "text"
-
-        print(f"   Page {doc.metadata.get('page_label', '?')}: {doc.metadata.get('content_type', 'unknown')}")
-
-    print(f"📚 Total documents to index: {len(documents)} (text/table chunks)")
-
-    # 7. Indexing (ajoute à la collection existante)
-    vector_store = ChromaVectorStore(chroma_collection=chroma_collection)
-    storage_context = StorageContext.from_defaults(vector_store=vector_store)
-
-    print("⚙️  Creating Vector Index (Embedding & Storing)...")
-    index = VectorStoreIndex.from_documents(
-        documents,
-        storage_context=storage_context,
-        show_progress=True
-    )
+    # Index BM25 à jour, puis signal à l'API (rechargement des index, cache de réponses vidé)
+    publish_index_update(chroma_collection)
 
     print("🎉 Ingestion complete! Data is ready for RAG.")
-    print(f"   - New text/table chunks: {len(documents)}")
-    print(f"   - Already indexed files: {len(already_ingested)}")
+    print(f"   - Files indexed: {len(completed)}/{len(jobs)} in {elapsed:.1f}s")
+    print(f"   - Unchanged files: {unchanged}")
+    print(f"   - Removed files: {len(removed)}")
+    print(f"   - Embedding API calls: {embed_model.api_calls}")
 
 if __name__ == "__main__":
     force_mode = "--force" in sys.argv
-    ingest_documents(force=force_mode)
\ No newline at end of file
+    ingest_documents(force=force_mode)
@@ -0,0 +1,116 @@
+"""
+Manifeste d'ingestion (SQLite) : fichier → sha256, taille, mtime, ids des chunks.
+
+Permet à ingest.py de décider en O(fichiers) ce qui doit être (ré)ingéré ou
+supprimé, sans relire les métadonnées de tous les chunks dans Chroma.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from typing import NamedTuple
+
+
+class ManifestEntry(NamedTuple):
+    file_name: str
+    sha256: str
+    size: int
+    mtime: float
+    chunk_ids: list[str]
+
+
+def file_sha256(path: str) -> str:
+    """Empreinte sha256 du contenu d'un fichier (lecture par blocs)."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IngestManifest:
+    """Table SQLite des fichiers ingérés, mise à jour fichier par fichier."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS files (
+                file_name TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                chunk_ids TEXT NOT NULL
+            )"""
+        )
+        self._conn.commit()
+
+    def get(self, file_name: str) -> ManifestEntry | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT file_name, sha256, size, mtime, chunk_ids FROM files WHERE file_name = ?",
+                (file_name,),
+            ).fetchone()
+        return _to_entry(row) if row else None
+
+    def entries(self) -> dict[str, ManifestEntry]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT file_name, sha256, size, mtime, chunk_ids FROM files"
+            ).fetchall()
+        return {row[0]: _to_entry(row) for row in rows}
+
+    def file_names(self) -> list[str]:
+        with self._lock:
+            rows = self._conn.execute("SELECT file_name FROM files ORDER BY file_name").fetchall()
+        return [row[0] for row in rows]
+
+    def put(self, file_name: str, sha256: str, size: int, mtime: float, chunk_ids: list[str]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (file_name, sha256, size, mtime, chunk_ids) VALUES (?, ?, ?, ?, ?)",
+                (file_name, sha256, size, mtime, json.dumps(chunk_ids)),
+            )
+            self._conn.commit()
+
+    def update_stat(self, file_name: str, size: int, mtime: float) -> None:
+        """Contenu inchangé mais fichier touché : met à jour taille/mtime seulement."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE files SET size = ?, mtime = ? WHERE file_name = ?",
+                (size, mtime, file_name),
+            )
+            self._conn.commit()
+
+    def delete(self, file_name: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM files WHERE file_name = ?", (file_name,))
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM files")
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def _to_entry(row) -> ManifestEntry:
+    file_name, sha256, size, mtime, chunk_ids = row
+    return ManifestEntry(file_name, sha256, size, mtime, json.loads(chunk_ids))
+
+
+def manifest_path(chroma_db_dir: str) -> str:
+    return os.path.join(chroma_db_dir, "ingest_manifest.sqlite")
@@ -0,0 +1,210 @@
+"""
+Index lexical BM25 persistant des chunks, construit par ingest.py à côté de la
+collection Chroma (CHROMA_DB_DIR/bm25) et chargé par l'API.
+
+Complète la recherche vectorielle sur les identifiants exacts (numéros de lot,
+codes de station, noms d'espèces, articles de règlement) : tout est local, sans
+appel d'API. Les tableaux (vocabulaire trié, postings, longueurs) sont des
+fichiers .npy ouverts en mmap : le chargement ne lit que meta.json, les pages
+utiles sont lues à la demande par les requêtes.
+
+Fichiers :
+    meta.json         paramètres BM25, nombre de chunks, longueur moyenne, noms de fichiers
+    terms.npy         vocabulaire trié (octets UTF-8, recherche par dichotomie)
+    offsets.npy       début des postings de chaque terme (len = termes + 1)
+    postings_doc.npy  chunks (int32) des postings, par terme
+    postings_tf.npy   fréquences (float32) des postings
+    doc_len.npy       longueur de chaque chunk (en tokens)
+    doc_file.npy      indice du file_name de chaque chunk dans meta.json
+    doc_ids.npy       id Chroma de chaque chunk
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+import shutil
+import unicodedata
+from collections import Counter
+
+import numpy as np
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+MAX_TERM_BYTES = 64
+
+# Identifiants composés (PZ-12, 2.3.1, art.22) conservés entiers, en plus de leurs parties
+_TOKEN_RE = re.compile(r"\w+(?:[-./]\w+)*")
+
+
+def tokenize(text: str) -> list[str]:
+    """Tokens en minuscules sans accents ; un identifiant composé donne aussi ses parties."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    tokens: list[str] = []
+    for match in _TOKEN_RE.finditer(text):
+        token = match.group(0)
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(re.findall(r"\w+", token))
+    return tokens
+
+
+def lexical_index_dir(chroma_db_dir: str) -> str:
+    return os.path.join(chroma_db_dir, "bm25")
+
+
+def build_lexical_index(chroma_collection, index_dir: str, batch_size: int = 1000) -> int:
+    """
+    Reconstruit l'index BM25 depuis les chunks de la collection Chroma, par
+    lots, puis remplace atomiquement `index_dir`.
+
+    Returns:
+        Nombre de chunks indexés.
+    """
+    postings: dict[bytes, list[tuple[int, int]]] = {}
+    doc_ids: list[str] = []
+    doc_len: list[int] = []
+    doc_file: list[int] = []
+    file_index: dict[str, int] = {}
+
+    offset = 0
+    while True:
+        batch = chroma_collection.get(
+            include=["documents", "metadatas"], limit=batch_size, offset=offset
+        )
+        if not batch["ids"]:
+            break
+        for chunk_id, text, meta in zip(batch["ids"], batch["documents"], batch["metadatas"]):
+            doc = len(doc_ids)
+            counts = Counter(tokenize(text or ""))
+            for term, tf in counts.items():
+                postings.setdefault(term.encode("utf-8")[:MAX_TERM_BYTES], []).append((doc, tf))
+            file_name = str((meta or {}).get("file_name", ""))
+            doc_ids.append(chunk_id)
+            doc_len.append(sum(counts.values()))
+            doc_file.append(file_index.setdefault(file_name, len(file_index)))
+        offset += len(batch["ids"])
+
+    terms = sorted(postings)
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(postings[t]) for t in terms])
+    postings_doc = np.empty(offsets[-1], dtype=np.int32)
+    postings_tf = np.empty(offsets[-1], dtype=np.float32)
+    for i, term in enumerate(terms):
+        # Un terme tronqué à MAX_TERM_BYTES peut regrouper plusieurs tokens d'un même chunk
+        merged: dict[int, int] = {}
+        for doc, tf in postings[term]:
+            merged[doc] = merged.get(doc, 0) + tf
+        start = offsets[i]
+        postings_doc[start:start + len(merged)] = list(merged)
+        postings_tf[start:start + len(merged)] = list(merged.values())
+        offsets[i + 1] = start + len(merged)
+    postings_doc = postings_doc[:offsets[-1]]
+    postings_tf = postings_tf[:offsets[-1]]
+
+    tmp_dir = index_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    np.save(os.path.join(tmp_dir, "terms.npy"), np.array(terms, dtype=f"S{MAX_TERM_BYTES}"))
+    np.save(os.path.join(tmp_dir, "offsets.npy"), offsets)
+    np.save(os.path.join(tmp_dir, "postings_doc.npy"), postings_doc)
+    np.save(os.path.join(tmp_dir, "postings_tf.npy"), postings_tf)
+    np.save(os.path.join(tmp_dir, "doc_len.npy"), np.array(doc_len, dtype=np.float32))
+    np.save(os.path.join(tmp_dir, "doc_file.npy"), np.array(doc_file, dtype=np.int32))
+    np.save(os.path.join(tmp_dir, "doc_ids.npy"), np.array(doc_ids, dtype=np.str_))
+    with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "k1": BM25_K1,
+            "b": BM25_B,
+            "n_docs": len(doc_ids),
+            "avg_doc_len": float(np.mean(doc_len)) if doc_len else 0.0,
+            "file_names": list(file_index),
+        }, f, ensure_ascii=False)
+
+    # Remplacement : l'API garde ses mmaps sur les anciens fichiers jusqu'à rechargement
+    old_dir = index_dir + ".old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(index_dir):
+        os.replace(index_dir, old_dir)
+    os.replace(tmp_dir, index_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return len(doc_ids)
+
+
+class LexicalIndex:
+    """Lecture de l'index BM25 (tableaux en mmap)."""
+
+    def __init__(self, index_dir: str):
+        with open(os.path.join(index_dir, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        self.k1 = meta["k1"]
+        self.b = meta["b"]
+        self.n_docs = meta["n_docs"]
+        self.avg_doc_len = meta["avg_doc_len"] or 1.0
+        self._file_index = {name: i for i, name in enumerate(meta["file_names"])}
+
+        def load(name: str) -> np.ndarray:
+            return np.load(os.path.join(index_dir, name), mmap_mode="r")
+
+        self._terms = load("terms.npy")
+        self._offsets = load("offsets.npy")
+        self._postings_doc = load("postings_doc.npy")
+        self._postings_tf = load("postings_tf.npy")
+        self._doc_len = load("doc_len.npy")
+        self._doc_file = load("doc_file.npy")
+        self._doc_ids = load("doc_ids.npy")
+
+    def __len__(self) -> int:
+        return self.n_docs
+
+    def _term_slice(self, term: str) -> tuple[int, int] | None:
+        key = term.encode("utf-8")[:MAX_TERM_BYTES]
+        pos = int(np.searchsorted(self._terms, key))
+        if pos < len(self._terms) and self._terms[pos] == key:
+            return int(self._offsets[pos]), int(self._offsets[pos + 1])
+        return None
+
+    def search(self, query: str, top_k: int, file_names: list[str] | None = None) -> list[tuple[str, float]]:
+        """
+        Les `top_k` chunks de meilleur score BM25 pour `query`, éventuellement
+        restreints aux chunks des `file_names` donnés.
+
+        Returns:
+            [(id du chunk, score)] par score décroissant (scores > 0 uniquement).
+        """
+        if self.n_docs == 0:
+            return []
+
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for term in set(tokenize(query)):
+            bounds = self._term_slice(term)
+            if bounds is None:
+                continue
+            start, end = bounds
+            docs = self._postings_doc[start:end]
+            tf = self._postings_tf[start:end]
+            df = end - start
+            idf = np.log(1.0 + (self.n_docs - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1.0 - self.b + self.b * self._doc_len[docs] / self.avg_doc_len)
+            scores[docs] += idf * tf * (self.k1 + 1.0) / (tf + norm)
+
+        if file_names is not None:
+            allowed = [self._file_index[name] for name in file_names if name in self._file_index]
+            scores[~np.isin(self._doc_file, allowed)] = 0.0
+
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(str(self._doc_ids[i]), float(scores[i])) for i in candidates]
+
+
+def reciprocal_rank_fusion(rankings: list[list[str]], k: int = 60) -> list[tuple[str, float]]:
+    """Fusion RRF : score(id) = somme sur les classements de 1 / (k + rang)."""
+    fused: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, start=1):
+            fused[item_id] = fused.get(item_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
@@ -1,27 +1,46 @@
 from __future__ import annotations
 
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
-from fastapi.responses import Response as FastAPIResponse
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr, ValidationError
+from starlette.background import BackgroundTask
 from dotenv import load_dotenv
 import os
 import re
 from pathlib import Path
 import io
+import json
+import threading
 import zipfile
 import tempfile
+import shutil
 import secrets
-import chromadb
-import httpx
+import asyncio
+import multiprocessing
+import time
+import uuid
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import quote
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
 import logging
-from llama_index.core import VectorStoreIndex, StorageContext, Settings
-from llama_index.core.llms import ChatMessage, MessageRole
-from llama_index.vector_stores.chroma import ChromaVectorStore
-from llama_index.embeddings.openai import OpenAIEmbedding
-from llama_index.llms.openai import OpenAI
+from contextlib import asynccontextmanager
+
+# Dépendances lourdes (llama_index, openai, chromadb, httpx, numpy) importées
+# à la demande : un worker répond à / et /login sans les charger.
+from answer_cache import AnswerCache
+from ingest_manifest import IngestManifest, manifest_path
+from document_index import DocumentFilterIndex
+from context_packer import ContextItem, PackedContext, count_tokens, pack_context
+from session_tokens import RevocationList, TokenSigner, load_or_create_secret
+from pdf_pages import PageCache
+from single_flight import SingleFlight
+from telemetry import (
+    CACHE_REQUESTS, LLM_TOKENS, REGISTRY, ServerTimingMiddleware, add_request_timings, record_stage, request_timings, span,
+)
+from export_worker import finalize_export, load_export_layer, unique_layer_name, write_export_layer
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -29,7 +48,37 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-app = FastAPI(title="RAG Environnemental API")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Ressources partagées sur la durée de vie de l'application (client HTTP
+    Tavily, pool d'export) et chargement de l'index en arrière-plan dès le
+    démarrage : /readyz reste en 503 tant qu'il n'est pas prêt.
+    """
+    global tavily_client, export_executor, warmup_task, token_signer, revocation_list
+    get_token_signer()
+    tavily_client = create_tavily_client()
+    warmup_task = asyncio.create_task(warm_up())
+    try:
+        yield
+    finally:
+        warmup_task.cancel()
+        warmup_task = None
+        await tavily_client.aclose()
+        tavily_client = None
+        if export_executor is not None:
+            export_executor.shutdown(wait=False, cancel_futures=True)
+            export_executor = None
+        for job_id in list(export_jobs):
+            remove_export_job(job_id)
+        if revocation_list is not None:
+            revocation_list.close()
+            revocation_list = None
+        token_signer = None
+
+
+app = FastAPI(title="RAG Environnemental API", lifespan=lifespan)
 
 # Allow CORS for local development and production
 app.add_middleware(
@@ -38,48 +87,397 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Lecture partielle des PDF (Range) et taille depuis le frontend (autre origine)
+    expose_headers=["Server-Timing", "Accept-Ranges", "Content-Range", "Content-Length", "ETag", "X-Page-Count"],
 )
+# Durée par endpoint (/metrics) et en-tête Server-Timing par étape
+app.add_middleware(ServerTimingMiddleware)
 
 # Configuration (must match ingest.py)
 CHROMA_DB_DIR = os.getenv("CHROMA_DB_DIR", "./chroma_db")
 DATA_DIR = os.getenv("DATA_DIR", "./data")
+GEOJSON_DIR = os.getenv("GEOJSON_DIR", "../mpk_to_geojson/geojson_dir")  # même arborescence que GEOJSON_PATH (frontend)
 AUTH_USERNAME = os.getenv("AUTH_USERNAME")
 AUTH_PASSWORD = os.getenv("AUTH_PASSWORD")
+# Tokens signés : même secret sur tous les workers / répliques (AUTH_TOKEN_SECRET,
+# sinon fichier partagé créé au premier démarrage), révocation /logout en SQLite
+AUTH_TOKEN_SECRET = os.getenv("AUTH_TOKEN_SECRET", "")
+AUTH_TOKEN_SECRET_PATH = os.getenv("AUTH_TOKEN_SECRET_PATH", "./.auth_secret")
+AUTH_TOKEN_TTL = int(os.getenv("AUTH_TOKEN_TTL", "43200"))  # 12 h
+AUTH_REVOCATION_DB = os.getenv("AUTH_REVOCATION_DB", "./auth_revocations.sqlite")  # vide = pas de révocation
+RETRIEVAL_THREADS = int(os.getenv("RETRIEVAL_THREADS", "8"))
+
+# Pages PDF extraites pour /pdf/{filename}/page/{n} (cache disque borné, éviction LRU)
+PDF_PAGE_CACHE_DIR = os.getenv("PDF_PAGE_CACHE_DIR", "./pdf_page_cache")
+PDF_PAGE_CACHE_MAX_MB = int(os.getenv("PDF_PAGE_CACHE_MAX_MB", "512"))
+
+# Recherche hybride : BM25 (index construit par ingest.py) + vecteurs, fusion RRF
+LEXICAL_SEARCH_ENABLED = os.getenv("LEXICAL_SEARCH_ENABLED", "true").lower() == "true"
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "20"))  # candidats par classement avant fusion
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# Reranking local par cross-encoder ONNX (désactivé si RERANK_MODEL_DIR est vide)
+RERANK_MODEL_DIR = os.getenv("RERANK_MODEL_DIR", "")
+RERANK_MODES = {m.strip() for m in os.getenv("RERANK_MODES", "internal,hybrid").split(",") if m.strip()}
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "50"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+RERANK_THREADS = int(os.getenv("RERANK_THREADS", "2"))  # threads ONNX Runtime par inférence
+
+# Budget de tokens du contexte (extraits) des prompts, par défaut et par modèle ("gpt-4o=8000,gpt-4o-mini=4000")
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+CONTEXT_TOKEN_BUDGETS = {
+    model.strip(): int(budget)
+    for model, budget in (
+        entry.split("=", 1) for entry in os.getenv("CONTEXT_TOKEN_BUDGETS", "").split(",") if "=" in entry
+    )
+}
+
+# Cache de réponses /chat
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "512"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_MAX_DISTANCE = float(os.getenv("ANSWER_CACHE_MAX_DISTANCE", "0.05"))
+INGEST_STAMP_FILE = os.path.join(CHROMA_DB_DIR, "ingest_stamp")  # mis à jour par ingest.py
+
+# Export géospatial : processus de conversion, jobs simultanés, rétention des résultats
+EXPORT_PROCESSES = int(os.getenv("EXPORT_PROCESSES", str(os.cpu_count() or 2)))
+EXPORT_MAX_CONCURRENT = int(os.getenv("EXPORT_MAX_CONCURRENT", "2"))
+EXPORT_JOB_TTL = float(os.getenv("EXPORT_JOB_TTL", "3600"))
+
+# Client HTTP Tavily (pool de connexions partagé)
+TAVILY_SEARCH_URL = os.getenv("TAVILY_SEARCH_URL", "https://api.tavily.com/search")
+TAVILY_MAX_CONNECTIONS = int(os.getenv("TAVILY_MAX_CONNECTIONS", "20"))
+TAVILY_MAX_KEEPALIVE = int(os.getenv("TAVILY_MAX_KEEPALIVE", "10"))
+TAVILY_KEEPALIVE_EXPIRY = float(os.getenv("TAVILY_KEEPALIVE_EXPIRY", "30"))
+TAVILY_MAX_RETRIES = int(os.getenv("TAVILY_MAX_RETRIES", "2"))
+TAVILY_RETRY_BACKOFF = float(os.getenv("TAVILY_RETRY_BACKOFF", "0.5"))
+TAVILY_MAX_BACKOFF = float(os.getenv("TAVILY_MAX_BACKOFF", "4"))  # plafond d'une attente (Retry-After compris)
+TAVILY_RETRY_DEADLINE = float(os.getenv("TAVILY_RETRY_DEADLINE", "20"))  # durée max de l'appel, essais compris
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache.sqlite")
+
+models_lock = threading.Lock()
+models_configured = False
+
+
+def configure_models(embed_model=None, llm=None) -> None:
+    """
+    Configure les modèles LlamaIndex (LLM, embeddings) au premier usage.
+    `embed_model` / `llm` remplacent les modèles OpenAI (ex: doublures des
+    benchmarks) ; l'embedding passe toujours par le cache persistant.
+    """
+    global models_configured
+    if models_configured:
+        return
+    with models_lock:
+        if not models_configured:
+            from llama_index.core import Settings
+            from embedding_cache import CachedEmbedding
+
+            if embed_model is None:
+                from llama_index.embeddings.openai import OpenAIEmbedding
+                embed_model = OpenAIEmbedding(model=EMBEDDING_MODEL)
+            if llm is None:
+                from llama_index.llms.openai import OpenAI
+                llm = OpenAI(model="gpt-4o", temperature=0)
+
+            Settings.embed_model = CachedEmbedding(embed_model, cache_path=EMBEDDING_CACHE_PATH)
+            Settings.llm = llm
+            models_configured = True
+
 
-Settings.embedding = OpenAIEmbedding(model="text-embedding-3-small")
-Settings.llm = OpenAI(model="gpt-4o", temperature=0)
+def get_llm():
+    configure_models()
+    from llama_index.core import Settings
+    return Settings.llm
 
-# Token store (in-memory, invalidated on server restart)
-valid_tokens: set[str] = set()
+
+def get_embed_model():
+    configure_models()
+    from llama_index.core import Settings
+    return Settings.embed_model
+
+# Tokens de session signés, vérifiés sans état partagé entre workers
+token_signer: TokenSigner | None = None
+revocation_list: RevocationList | None = None
 
 security = HTTPBearer()
 
-# Global Index Variable
+# Calculs /chat en cours, partagés entre requêtes identiques (aucune rétention après la réponse)
+chat_flights = SingleFlight()
+
+# Pool borné pour les appels bloquants sans variante async (recherche Chroma, BM25, rerank)
+retrieval_executor = ThreadPoolExecutor(max_workers=RETRIEVAL_THREADS, thread_name_prefix="retrieval")
+
+
+# Global Index Variable (singleton protégé par index_lock : un seul chargement)
 index = None
+index_lock = threading.Lock()
+index_load_error: str | None = None
+warmup_task: asyncio.Task | None = None
+
+# Cache de réponses (exact + sémantique), invalidé à chaque ingestion
+answer_cache: AnswerCache | None = (
+    AnswerCache(
+        max_entries=ANSWER_CACHE_MAX_ENTRIES,
+        ttl_seconds=ANSWER_CACHE_TTL,
+        max_distance=ANSWER_CACHE_MAX_DISTANCE,
+        stamp_path=INGEST_STAMP_FILE,
+    )
+    if ANSWER_CACHE_ENABLED else None
+)
+
+# Jobs d'export (en mémoire) et pool de processus de conversion
+export_jobs: dict[str, dict] = {}
+export_semaphore = asyncio.Semaphore(EXPORT_MAX_CONCURRENT)
+export_executor: ProcessPoolExecutor | None = None
+export_executor_lock = threading.Lock()
+
+# Client HTTP Tavily partagé (créé au démarrage par le lifespan)
+tavily_client: httpx.AsyncClient | None = None
+
+# Index groupe → fichiers ingérés (filtre spatial) et index BM25, chargés
+# avec l'index et rechargés quand ingest.py met à jour INGEST_STAMP_FILE
+document_index = DocumentFilterIndex([])
+lexical_index: LexicalIndex | None = None
+ingest_indexes_stamp: float | None = None
+ingest_indexes_lock = threading.Lock()
+ingest_refresh_task: asyncio.Task | None = None  # rechargement en cours (un seul à la fois)
+chroma_collection = None
 
 def _normalize_for_lang_comparison(text: str) -> str:
     """Retire la ponctuation et met en minuscule pour comparaison langue-neutre."""
     return re.sub(r'[^\w\s]', '', text.strip().lower())
 
 def get_index():
-    global index
-    if index is None:
-        if not os.path.exists(CHROMA_DB_DIR):
-            print("⚠️ Warning: ChromaDB directory not found. Have you run ingest.py?")
-            return None
-
-        print("Loading Vector Index...")
-        db = chromadb.PersistentClient(path=CHROMA_DB_DIR)
-        chroma_collection = db.get_or_create_collection("rag_collection")
-        vector_store = ChromaVectorStore(chroma_collection=chroma_collection)
-        storage_context = StorageContext.from_defaults(vector_store=vector_store)
-        index = VectorStoreIndex.from_vector_store(
-            vector_store,
-            storage_context=storage_context,
-        )
+    """
+    Index vectoriel (chargé une seule fois). Bloquant pendant le chargement :
+    depuis la boucle d'événements, utiliser `aget_index`.
+    """
+    global index, chroma_collection, index_load_error
+    if index is not None:
+        return index
+    with index_lock:
+        if index is None:
+            if not os.path.exists(CHROMA_DB_DIR):
+                print("⚠️ Warning: ChromaDB directory not found. Have you run ingest.py?")
+                index_load_error = "ChromaDB directory not found"
+                return None
+
+            print("Loading Vector Index...")
+            start = time.perf_counter()
+            configure_models()
+            from retrieval import open_vector_index
+            loaded_index, collection = open_vector_index(CHROMA_DB_DIR, retrieval_executor, EMBEDDING_MODEL)
+            chroma_collection = collection
+            load_ingest_indexes()
+            # Publié en dernier : les autres threads ne voient qu'un index complet
+            index = loaded_index
+            index_load_error = None
+            elapsed = time.perf_counter() - start
+            record_stage("index_load", elapsed)
+            logger.info(f"Index chargé en {elapsed:.1f}s")
     return index
 
 
+async def aget_index():
+    """
+    `get_index` sans bloquer la boucle d'événements (chargement dans un thread).
+    Recharge aussi les index dérivés si une ingestion a eu lieu depuis.
+    """
+    if index is not None:
+        await arefresh_ingest_indexes()
+        return index
+    return await asyncio.to_thread(get_index)
+
+
+async def warm_up() -> None:
+    """Tâche de démarrage : index, index dérivés, tokenizer et reranker chargés avant le premier utilisateur."""
+    global index_load_error
+    try:
+        await asyncio.to_thread(get_index)
+        await asyncio.to_thread(count_tokens, "", _llm_model_name())
+        if RERANK_MODES:
+            await asyncio.to_thread(get_reranker)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        index_load_error = str(e)
+        logger.error(f"Chargement de l'index au démarrage impossible : {e}")
+
+
+def _read_ingest_stamp() -> float | None:
+    try:
+        return os.path.getmtime(INGEST_STAMP_FILE)
+    except OSError:
+        return None
+
+
+def load_ingest_indexes() -> None:
+    """
+    Charge les index dérivés de l'ingestion : fichiers ingérés et BM25.
+    Bloquant : les nouveaux index sont construits à côté puis publiés ensemble,
+    les requêtes en cours gardent les précédents.
+    """
+    global document_index, lexical_index, ingest_indexes_stamp
+    with ingest_indexes_lock:
+        stamp = _read_ingest_stamp()
+        new_document_index = read_ingested_file_names(chroma_collection)
+        new_lexical_index = open_lexical_index()
+        document_index, lexical_index, ingest_indexes_stamp = new_document_index, new_lexical_index, stamp
+
+
+def read_ingested_file_names(chroma_collection) -> DocumentFilterIndex:
+    """
+    Construit l'index des noms de fichiers ingérés (utilisé pour résoudre le filtre spatial),
+    depuis le manifeste d'ingestion (O(fichiers)) ou à défaut depuis les métadonnées Chroma.
+    """
+    manifest_file = manifest_path(CHROMA_DB_DIR)
+    file_names: list[str] = []
+    if os.path.exists(manifest_file):
+        manifest = IngestManifest(manifest_file)
+        file_names = manifest.file_names()
+        manifest.close()
+
+    if not file_names:
+        existing_metadata = chroma_collection.get(include=["metadatas"])
+        file_names = sorted({
+            str(meta["file_name"])
+            for meta in existing_metadata["metadatas"]
+            if meta and "file_name" in meta
+        })
+
+    logger.info(f"Index des fichiers ingérés : {len(file_names)} fichier(s)")
+    return DocumentFilterIndex(file_names)
+
+
+def open_lexical_index() -> LexicalIndex | None:
+    """Ouvre l'index BM25 (mmap) s'il a été construit par ingest.py."""
+    from lexical_index import LexicalIndex, lexical_index_dir
+
+    index_dir = lexical_index_dir(CHROMA_DB_DIR)
+    if not LEXICAL_SEARCH_ENABLED or not os.path.exists(os.path.join(index_dir, "meta.json")):
+        if LEXICAL_SEARCH_ENABLED:
+            logger.warning("Index BM25 absent : recherche vectorielle seule. Relancez ingest.py.")
+        return None
+    opened = LexicalIndex(index_dir)
+    logger.info(f"Index BM25 : {len(opened)} chunk(s)")
+    return opened
+
+
+def ingest_indexes_stale() -> bool:
+    return chroma_collection is not None and _read_ingest_stamp() != ingest_indexes_stamp
+
+
+async def arefresh_ingest_indexes() -> None:
+    """
+    Recharge les index dérivés si une ingestion a eu lieu depuis leur chargement,
+    dans un thread. Un seul rechargement à la fois : les requêtes concurrentes
+    attendent celui en cours au lieu d'en lancer un autre.
+    """
+    global ingest_refresh_task
+    if not ingest_indexes_stale():
+        return
+    if ingest_refresh_task is None or ingest_refresh_task.done():
+        ingest_refresh_task = asyncio.create_task(asyncio.to_thread(load_ingest_indexes))
+    try:
+        await asyncio.shield(ingest_refresh_task)
+    except Exception as e:
+        logger.error(f"Rechargement des index d'ingestion impossible : {e}")
+
+
+reranker: CrossEncoderReranker | None = None
+reranker_failed = False
+
+
+def get_reranker() -> CrossEncoderReranker | None:
+    """Cross-encoder chargé une seule fois ; None si non configuré ou chargement impossible."""
+    global reranker, reranker_failed
+    if reranker is None and RERANK_MODEL_DIR and not reranker_failed:
+        try:
+            from reranker import CrossEncoderReranker
+            reranker = CrossEncoderReranker(
+                RERANK_MODEL_DIR, batch_size=RERANK_BATCH_SIZE, threads=RERANK_THREADS
+            )
+            logger.info(f"Reranker chargé : {RERANK_MODEL_DIR}")
+        except Exception as e:
+            reranker_failed = True
+            logger.warning(f"Reranker indisponible ({e}) : résultats non rerankés")
+    return reranker
+
+
+async def retrieve_nodes(
+    index,
+    query: str,
+    similarity_top_k: int,
+    filters: MetadataFilters | None,
+    mode: str,
+) -> list[NodeWithScore]:
+    """
+    Retrieval des `similarity_top_k` meilleurs chunks. Si le reranking est
+    actif pour ce mode, RERANK_CANDIDATES candidats sont récupérés puis
+    rerankés par le cross-encoder (dans retrieval_executor).
+
+    Étapes mesurées : `embed` (embedding de la requête, appel d'API) puis
+    `search` (Chroma, et BM25 si l'index lexical est chargé).
+    """
+    from llama_index.core.schema import QueryBundle
+
+    model = get_reranker() if mode in RERANK_MODES else None
+    candidates_k = max(similarity_top_k, RERANK_CANDIDATES) if model else similarity_top_k
+
+    start = time.perf_counter()
+    with span("embed"):
+        query_embedding = await get_embed_model().aget_query_embedding(query)
+    with span("search"):
+        nodes = await get_retriever(index, candidates_k, filters).aretrieve(
+            QueryBundle(query_str=query, embedding=query_embedding)
+        )
+    retrieval_ms = (time.perf_counter() - start) * 1000
+    if model is None or len(nodes) <= 1:
+        logger.info(f"Retrieval ({mode}) : {len(nodes)} chunk(s) en {retrieval_ms:.0f} ms")
+        return nodes[:similarity_top_k]
+
+    start = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    scores = await loop.run_in_executor(
+        retrieval_executor,
+        model.score, query, [n.node.get_content() for n in nodes],
+    )
+    rerank_ms = (time.perf_counter() - start) * 1000
+    record_stage("rerank", rerank_ms / 1000)
+    from retrieval import rescored
+    ranked = rescored(nodes, scores)[:similarity_top_k]
+    logger.info(
+        f"Retrieval ({mode}) : {len(nodes)} candidat(s) en {retrieval_ms:.0f} ms, "
+        f"rerank → {len(ranked)} en {rerank_ms:.0f} ms"
+    )
+    return ranked
+
+
+def get_retriever(index, similarity_top_k: int, filters: MetadataFilters | None = None):
+    """Retriever hybride BM25 + vecteurs si l'index BM25 est disponible, sinon vectoriel seul."""
+    if lexical_index is None:
+        return index.as_retriever(similarity_top_k=similarity_top_k, filters=filters)
+
+    from retrieval import FusionRetriever
+
+    # Le filtre spatial (file_name $in [...]) s'applique aux deux classements
+    file_names = list(filters.filters[0].value) if filters else None
+    candidates = max(similarity_top_k, RETRIEVAL_CANDIDATES)
+    return FusionRetriever(
+        index.as_retriever(similarity_top_k=candidates, filters=filters),
+        lexical_index,
+        index.vector_store,
+        similarity_top_k,
+        candidates,
+        file_names,
+        retrieval_executor,
+        rrf_k=RRF_K,
+    )
+
+
 # --- Auth models ---
 
 class LoginRequest(BaseModel):
@@ -88,12 +486,32 @@ class LoginRequest(BaseModel):
 
 class LoginResponse(BaseModel):
     token: str
+    expires_in: int  # secondes
 
 
 # --- Auth dependency ---
 
+def get_token_signer() -> TokenSigner:
+    """Signataire des tokens, avec le secret partagé (créé au premier appel si besoin)."""
+    global token_signer, revocation_list
+    if token_signer is None:
+        secret = AUTH_TOKEN_SECRET.encode("utf-8") if AUTH_TOKEN_SECRET else load_or_create_secret(AUTH_TOKEN_SECRET_PATH)
+        if AUTH_REVOCATION_DB:
+            revocation_list = RevocationList(AUTH_REVOCATION_DB)
+        token_signer = TokenSigner(secret, AUTH_TOKEN_TTL)
+    return token_signer
+
+
+def decode_token(token: str) -> dict | None:
+    """Claims d'un token valide, non expiré et non révoqué ; None sinon."""
+    claims = get_token_signer().verify(token)
+    if claims is None or (revocation_list and revocation_list.is_revoked(claims.get("jti", ""))):
+        return None
+    return claims
+
+
 async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
-    if credentials.credentials not in valid_tokens:
+    if decode_token(credentials.credentials) is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Token invalide ou expiré",
@@ -109,7 +527,7 @@ class QueryRequest(BaseModel):
     document_filter: list[str] | None = None  # Stems PDF pour filtre spatial (ex: ["Zone_A", "Zone_B"])
 
 class SourceNode(BaseModel):
-    text: str
+    text: str  # extrait affiché (tronqué) ; le contexte du LLM utilise le contenu complet
     score: float
     page_label: str = "N/A"
     file_name: str = "N/A"
@@ -119,64 +537,79 @@ class SourceNode(BaseModel):
     url: str | None = None
     title: str | None = None
     publication_info: str | None = None
+    # Contenu complet d'une source web, pour pack_context (non sérialisé)
+    _full_text: str | None = PrivateAttr(default=None)
 
 class QueryResponse(BaseModel):
     answer: str
     sources: list[SourceNode]
     english_query: str | None = None
     spatial_filter_active: bool = False
+    prompt_tokens: int | None = None  # tokens du prompt de synthèse (comptage local)
 
 
 # --- Export models ---
 
 class GeoJSONLayer(BaseModel):
-    id: str          # ex: "Zones/parcelles.geojson"
-    name: str        # ex: "parcelles.geojson"
-    geojson: dict    # FeatureCollection GeoJSON
+    id: str                     # ex: "Zones/parcelles.geojson"
+    name: str                   # ex: "parcelles.geojson"
+    geojson: dict | None = None # FeatureCollection GeoJSON ; None → lu côté serveur depuis GEOJSON_DIR/id
 
 class ExportRequest(BaseModel):
     layers: list[GeoJSONLayer]
+    bbox: list[float] | None = None  # [minx, miny, maxx, maxy] EPSG:4326 — découpage optionnel (ROI)
 
 
-def filter_nodes_by_document_stems(
-    nodes: list,
-    document_filter: list[str] | None,
-) -> tuple[list, bool]:
+def resolve_document_filter(document_filter: list[str] | None) -> list[str]:
     """
-    Filtre les nœuds ChromaDB par stems de fichiers PDF correspondant
-    aux couches GeoJSON intersectant la ROI dessinée.
+    Résout les stems de fichiers PDF correspondant aux couches GeoJSON
+    intersectant la ROI dessinée en une liste de `file_name` ingérés.
 
-    Convention de correspondance :
-        Path(file_name).stem.lower() ∈ {s.lower() for s in document_filter}
+    Convention de correspondance (partielle) : le nom du groupe doit être
+    CONTENU dans le stem du fichier PDF.
+    Ex: groupe "Zone_A" → correspond à "rapport_env_Zone_A_2024.pdf"
 
-    Fallback silencieux : si le filtre éliminerait TOUS les nœuds, retourne
-    tous les nœuds avec filter_active=False pour garantir une réponse utile.
+    Returns:
+        Liste triée des `file_name` correspondants (vide si aucun).
+    """
+    if not document_filter:
+        return []
+
+    return document_index.resolve(document_filter)
+
+
+def build_document_filters(
+    document_filter: list[str] | None,
+) -> tuple[MetadataFilters | None, bool]:
+    """
+    Construit le filtre de métadonnées Chroma (`file_name $in [...]`) à partir
+    du filtre spatial, pour que la recherche vectorielle ne porte que sur les
+    documents de la zone sélectionnée.
+
+    Fallback silencieux : si aucun document ingéré ne correspond, retourne
+    (None, False) pour effectuer une recherche non filtrée et garantir une
+    réponse utile.
 
     Returns:
-        (filtered_nodes, filter_active)
+        (filters, filter_active)
     """
     if not document_filter:
-        return nodes, False
-
-    # Correspondance partielle : le nom du groupe doit être CONTENU dans le stem du fichier PDF.
-    # Ex: groupe "Zone_A" → correspond à "rapport_env_Zone_A_2024.pdf"
-    lower_groups = [s.lower() for s in document_filter]
-    filtered = [
-        node for node in nodes
-        if any(
-            group in Path(str(node.node.metadata.get("file_name", ""))).stem.lower()
-            for group in lower_groups
-        )
-    ]
+        return None, False
 
-    if not filtered:
+    file_names = resolve_document_filter(document_filter)
+    if not file_names:
         logger.warning(
-            f"Filtre spatial : aucun nœud dont le stem contient {lower_groups}. "
+            f"Filtre spatial : aucun document dont le stem contient {[s.lower() for s in document_filter]}. "
             "Fallback vers résultats non filtrés."
         )
-        return nodes, False
+        return None, False
+
+    from llama_index.core.vector_stores import MetadataFilter, MetadataFilters, FilterOperator
 
-    return filtered, True
+    filters = MetadataFilters(filters=[
+        MetadataFilter(key="file_name", value=file_names, operator=FilterOperator.IN),
+    ])
+    return filters, True
 
 
 def _sanitize_gdb_name(name: str, index: int) -> str:
@@ -207,20 +640,94 @@ async def login(request: LoginRequest):
             detail="Identifiants incorrects",
         )
 
-    token = secrets.token_urlsafe(32)
-    valid_tokens.add(token)
+    signer = get_token_signer()
+    token = signer.issue(request.username)
     logger.info(f"Login successful for user: {request.username}")
-    return LoginResponse(token=token)
+    return LoginResponse(token=token, expires_in=signer.ttl_seconds)
 
 
 @app.post("/logout")
 async def logout(token: str = Depends(verify_token)):
-    valid_tokens.discard(token)
+    # Sans liste de révocation, le token reste valide jusqu'à son expiration
+    claims = decode_token(token)
+    if revocation_list is not None and claims is not None:
+        revocation_list.revoke(claims["jti"], claims["exp"])
     return {"message": "Déconnecté"}
 
 
 # --- Utility functions ---
 
+def create_tavily_client(transport: httpx.AsyncBaseTransport | None = None) -> httpx.AsyncClient:
+    """
+    Crée le client HTTP partagé pour Tavily : keep-alive, pool borné et HTTP/2
+    si le paquet `h2` est disponible. `transport` permet d'injecter un transport
+    de test (ex: httpx.MockTransport).
+    """
+    import httpx
+
+    try:
+        import h2  # noqa: F401 — requis par httpx pour HTTP/2
+        http2 = True
+    except ImportError:
+        logger.warning("Paquet h2 absent : client Tavily en HTTP/1.1 (pip install 'httpx[http2]')")
+        http2 = False
+
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=TAVILY_MAX_CONNECTIONS,
+            max_keepalive_connections=TAVILY_MAX_KEEPALIVE,
+            keepalive_expiry=TAVILY_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(10.0, connect=5.0),
+        transport=transport,
+    )
+
+
+def get_tavily_client() -> httpx.AsyncClient:
+    """Retourne le client Tavily partagé (créé à la volée hors lifespan, ex: scripts)."""
+    global tavily_client
+    if tavily_client is None:
+        tavily_client = create_tavily_client()
+    return tavily_client
+
+
+async def post_with_retry(client: httpx.AsyncClient, url: str, payload: dict) -> httpx.Response:
+    """
+    POST JSON avec retry et backoff exponentiel sur 429/5xx et erreurs de transport.
+    L'en-tête Retry-After est respecté s'il est fourni, dans la limite de
+    TAVILY_MAX_BACKOFF ; aucun essai n'est relancé s'il finirait après
+    TAVILY_RETRY_DEADLINE (la requête /chat ne reste pas bloquée).
+    """
+    import httpx
+
+    deadline = time.monotonic() + TAVILY_RETRY_DEADLINE
+    for attempt in range(TAVILY_MAX_RETRIES + 1):
+        backoff = min(TAVILY_RETRY_BACKOFF * (2 ** attempt), TAVILY_MAX_BACKOFF)
+        try:
+            response = await client.post(url, json=payload)
+        except httpx.TransportError as e:
+            if attempt == TAVILY_MAX_RETRIES or time.monotonic() + backoff >= deadline:
+                raise
+            logger.warning(f"Tavily: erreur réseau ({e}), nouvel essai dans {backoff:.1f}s")
+            await asyncio.sleep(backoff)
+            continue
+
+        if response.status_code != 429 and response.status_code < 500:
+            return response
+        if attempt == TAVILY_MAX_RETRIES:
+            return response
+
+        retry_after = response.headers.get("Retry-After", "")
+        delay = min(float(retry_after), TAVILY_MAX_BACKOFF) if retry_after.isdigit() else backoff
+        if time.monotonic() + delay >= deadline:
+            return response
+        logger.warning(f"Tavily: HTTP {response.status_code}, nouvel essai dans {delay:.1f}s")
+        await asyncio.sleep(delay)
+
+    return response
+
+
 async def search_web_agent(query: str, max_results: int = 3, use_domain_filters: bool = True) -> list[SourceNode]:
     """
     Recherche web via Tavily API.
@@ -262,44 +769,35 @@ async def search_web_agent(query: str, max_results: int = 3, use_domain_filters:
         else:
             logger.info("Web Agent: Recherche web complète (sans filtres de domaines)")
 
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "https://api.tavily.com/search",
-                json=payload,
-                timeout=10.0
+        with span("web_search"):
+            response = await post_with_retry(get_tavily_client(), TAVILY_SEARCH_URL, payload)
+        response.raise_for_status()
+        data = response.json()
+
+        sources = []
+        for result in data.get("results", []):
+            content = result.get("content", "")
+            source = SourceNode(
+                text=content[:500] + "..." if len(content) > 500 else content,
+                score=result.get("score", 0.0),
+                source_type="external",
+                url=result.get("url"),
+                title=result.get("title"),
+                publication_info=result.get("published_date", ""),
+                page_label="N/A",
+                file_name="N/A",
+                content_type="text"
             )
-            response.raise_for_status()
-            data = response.json()
-
-            sources = []
-            for result in data.get("results", []):
-                sources.append(SourceNode(
-                    text=result.get("content", "")[:500] + "...",
-                    score=result.get("score", 0.0),
-                    source_type="external",
-                    url=result.get("url"),
-                    title=result.get("title"),
-                    publication_info=result.get("published_date", ""),
-                    page_label="N/A",
-                    file_name="N/A",
-                    content_type="text"
-                ))
-            logger.info(f"Web Agent: Found {len(sources)} external sources")
-            return sources
+            source._full_text = content  # le budget de contexte s'applique au texte complet
+            sources.append(source)
+        logger.info(f"Web Agent: Found {len(sources)} external sources")
+        return sources
 
     except Exception as e:
         logger.error(f"Erreur Web Agent: {e}")
         return []  # Dégradation gracieuse
 
-async def synthesize_hybrid_response(
-    query: str,
-    internal_sources: list[SourceNode],
-    external_sources: list[SourceNode]
-) -> str:
-    """
-    Génère réponse comparative avec distinction claire des sources.
-    """
-    system_prompt = """
+HYBRID_SYSTEM_PROMPT = """
 Vous êtes un assistant scientifique expert. L'utilisateur vous a fourni deux types de sources:
 
 1. DONNÉES INTERNES (source primaire de vérité)
@@ -320,25 +818,277 @@ RÈGLES ANTI-HALLUCINATION:
 - Ne pas extrapoler au-delà des données fournies
 """
 
-    # Construire contexte
-    context = "Sources internes:\n"
-    for i, src in enumerate(internal_sources, 1):
-        context += f"[{i}] {src.text}\n\n"
+SCIENCE_SYSTEM_PROMPT = """You are an expert scientific assistant. Analyze the provided scientific articles and answer the user's question.
 
-    context += "\nSources externes:\n"
-    for i, src in enumerate(external_sources, len(internal_sources) + 1):
-        context += f"[{i}] {src.title}: {src.text}\n\n"
+RULES:
+- Base your response ONLY on the provided scientific articles
+- Systematically cite sources with [number]
+- Mention authors, journals or dates when relevant
+- If articles don't contain the information, say so explicitly
+- Do not invent or extrapolate beyond the provided data
+- Structure the response clearly and academically
 
-    # Appel LLM asynchrone
-    messages = [
+RESPONSE FORMAT — follow this structure strictly:
+1. Write the complete answer in FRENCH (the user's language)
+2. Add this exact separator on its own line: ---
+3. Add this label on its own line: **Version originale (anglais) :**
+4. Write the complete answer in ENGLISH, prefixing every paragraph with "> " (markdown blockquote)
+"""
+
+NO_SCIENCE_SOURCES_ANSWER = "Aucun article scientifique trouvé pour cette requête dans les revues indexées."
+
+
+def node_to_source(node) -> SourceNode:
+    """Convertit un nœud récupéré (NodeWithScore) en SourceNode interne."""
+    metadata = node.node.metadata or {}
+    return SourceNode(
+        text=node.node.get_content()[:500] + "...",
+        score=node.score or 0.0,
+        page_label=str(metadata.get("page_label", "N/A")),
+        file_name=str(metadata.get("file_name", "N/A")),
+        content_type=str(metadata.get("content_type", "text")),
+        source_type="internal"
+    )
+
+
+def _llm_model_name() -> str:
+    return getattr(get_llm().metadata, "model_name", "") or ""
+
+
+def context_budget() -> int:
+    """Budget de tokens du contexte pour le LLM configuré."""
+    return CONTEXT_TOKEN_BUDGETS.get(_llm_model_name(), CONTEXT_TOKEN_BUDGET)
+
+
+def _node_context_item(node) -> ContextItem:
+    metadata = node.node.metadata or {}
+    return ContextItem(
+        text=node.node.get_content(),
+        page_key=(metadata.get("file_name"), metadata.get("page_label")),
+    )
+
+
+def _web_context_item(src: SourceNode) -> ContextItem:
+    return ContextItem(text=src._full_text or src.text, title=src.title)
+
+
+def report_context_usage(mode: str, messages: list[ChatMessage], packed: PackedContext) -> int:
+    """Journalise l'usage du budget de contexte et retourne le nombre de tokens du prompt."""
+    model = _llm_model_name()
+    prompt_tokens = sum(count_tokens(str(m.content or ""), model) for m in messages)
+    LLM_TOKENS.inc(mode, "prompt", amount=prompt_tokens)
+    logger.info(
+        f"Contexte ({mode}) : {packed.tokens}/{context_budget()} tokens, {len(packed.kept)} extrait(s), "
+        f"{packed.dropped} hors budget, {packed.deduplicated} doublon(s) — prompt {prompt_tokens} tokens"
+    )
+    return prompt_tokens
+
+
+def record_completion_tokens(mode: str, answer: str) -> None:
+    LLM_TOKENS.inc(mode, "completion", amount=count_tokens(answer, _llm_model_name()))
+
+
+def build_internal_messages(query: str, nodes: list, filter_active: bool) -> tuple[list[ChatMessage], PackedContext]:
+    """
+    Construit le prompt de synthèse du mode interne à partir des nœuds récupérés.
+    Les citations [n] suivent `packed.kept` (indices des nœuds retenus).
+    """
+    from llama_index.core.llms import ChatMessage, MessageRole
+
+    packed = pack_context(
+        [("", [_node_context_item(n) for n in nodes])],
+        context_budget(),
+        _llm_model_name(),
+    )
+    spatial_note = (
+        "\n\nNote : La recherche a été filtrée géographiquement — seuls les documents "
+        "correspondant à la zone sélectionnée sur la carte ont été consultés."
+        if filter_active else ""
+    )
+    system_prompt = (
+        "Tu es un assistant expert en environnement. Réponds à la question de l'utilisateur "
+        "en te basant UNIQUEMENT sur les documents fournis. Cite les sources avec [n]. "
+        "Si les documents ne contiennent pas l'information, dis-le explicitement. "
+        "Ne jamais inventer ni extrapoler au-delà des données fournies. Réponds en français."
+        + spatial_note
+    )
+    return [
         ChatMessage(role=MessageRole.SYSTEM, content=system_prompt),
-        ChatMessage(role=MessageRole.USER, content=f"Question: {query}\n\n{context}")
+        ChatMessage(
+            role=MessageRole.USER,
+            content=f"Question : {query}\n\nContexte :\n{packed.text}"
+        ),
+    ], packed
+
+
+def build_hybrid_messages(
+    query: str,
+    internal_nodes: list,
+    external_sources: list[SourceNode]
+) -> tuple[list[ChatMessage], PackedContext]:
+    """
+    Construit le prompt de synthèse comparative (sources internes + externes).
+    `packed.kept` indexe la liste internes puis externes.
+    """
+    from llama_index.core.llms import ChatMessage, MessageRole
+
+    packed = pack_context(
+        [
+            ("Sources internes:", [_node_context_item(n) for n in internal_nodes]),
+            ("Sources externes:", [_web_context_item(src) for src in external_sources]),
+        ],
+        context_budget(),
+        _llm_model_name(),
+    )
+    return [
+        ChatMessage(role=MessageRole.SYSTEM, content=HYBRID_SYSTEM_PROMPT),
+        ChatMessage(role=MessageRole.USER, content=f"Question: {query}\n\n{packed.text}")
+    ], packed
+
+
+def build_science_messages(
+    query: str,
+    english_query: str,
+    external_sources: list[SourceNode]
+) -> tuple[list[ChatMessage], PackedContext]:
+    """Construit le prompt de réponse bilingue (FR puis EN) du mode science."""
+    from llama_index.core.llms import ChatMessage, MessageRole
+
+    packed = pack_context(
+        [("Scientific sources:", [_web_context_item(src) for src in external_sources])],
+        context_budget(),
+        _llm_model_name(),
+    )
+    return [
+        ChatMessage(role=MessageRole.SYSTEM, content=SCIENCE_SYSTEM_PROMPT),
+        ChatMessage(
+            role=MessageRole.USER,
+            content=f"Question (FR): {query}\nQuestion (EN): {english_query}\n\n{packed.text}"
+        )
+    ], packed
+
+
+async def translate_query_to_english(query: str) -> str:
+    """Traduit la requête FR → EN pour maximiser les résultats de la recherche scientifique."""
+    from llama_index.core.llms import ChatMessage, MessageRole
+
+    tr_messages = [
+        ChatMessage(
+            role=MessageRole.SYSTEM,
+            content="Translate the following French text to English. Return only the translation, nothing else."
+        ),
+        ChatMessage(role=MessageRole.USER, content=query)
     ]
+    with span("translate"):
+        tr_response = await get_llm().achat(tr_messages)
+    english_query = str(tr_response.message.content).strip()
+    model = _llm_model_name()
+    LLM_TOKENS.inc("translate", "prompt", amount=sum(count_tokens(str(m.content), model) for m in tr_messages))
+    record_completion_tokens("translate", english_query)
+    logger.info(f"Science - query translated: '{query}' → '{english_query}'")
+    return english_query
 
-    llm = Settings.llm
-    response = await llm.achat(messages)
 
-    return str(response.message.content)
+def returned_english_query(query: str, english_query: str) -> str | None:
+    """Retourne la traduction seulement si la requête était en français."""
+    if _normalize_for_lang_comparison(query) != _normalize_for_lang_comparison(english_query):
+        return english_query
+    return None
+
+
+async def retrieve_internal_nodes(
+    query: str,
+    document_filter: list[str] | None,
+    similarity_top_k: int = 3,
+    mode: str = "hybrid",
+) -> tuple[list, bool]:
+    """
+    Retrieval interne seul (sans synthèse LLM), avec filtre spatial poussé dans Chroma.
+    Retourne ([], False) si l'index n'est pas initialisé.
+
+    Returns:
+        (internal_nodes, filter_active)
+    """
+    index = await aget_index()
+    if not index:
+        return [], False
+
+    filters, filter_active = build_document_filters(document_filter)
+    nodes = await retrieve_nodes(index, query, similarity_top_k, filters, mode)
+    return nodes, filter_active
+
+
+def _sse_event(event: str, data) -> str:
+    """Formate un événement Server-Sent Events (payload JSON)."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def chat_request_key(request: QueryRequest) -> tuple:
+    """Clé (requête normalisée, mode, filtre spatial trié) commune au cache et aux requêtes en cours."""
+    normalized_query = " ".join(_normalize_for_lang_comparison(request.query).split())
+    return AnswerCache.make_key(normalized_query, request.mode, request.document_filter)
+
+
+async def lookup_answer_cache(
+    request: QueryRequest,
+) -> tuple[QueryResponse | None, tuple | None, list[float] | None]:
+    """
+    Cherche une réponse en cache : d'abord exacte, puis sémantique (embedding de la requête).
+
+    Returns:
+        (cached_response, cache_key, query_embedding) — l'embedding est réutilisé
+        pour stocker la réponse calculée en cas de miss.
+    """
+    if answer_cache is None:
+        return None, None, None
+
+    cache_key = chat_request_key(request)
+    cached = answer_cache.get_exact(cache_key)
+    if cached is not None:
+        logger.info("Cache réponses : hit exact")
+        CACHE_REQUESTS.inc("answer", "exact")
+        return cached, cache_key, None
+
+    try:
+        with span("embed_query"):
+            query_embedding = await get_embed_model().aget_query_embedding(request.query)
+    except Exception as e:
+        logger.warning(f"Cache réponses : embedding indisponible ({e}), recherche sémantique ignorée")
+        CACHE_REQUESTS.inc("answer", "miss")
+        return None, cache_key, None
+
+    cached = answer_cache.get_semantic(cache_key, query_embedding)
+    if cached is not None:
+        logger.info("Cache réponses : hit sémantique")
+    CACHE_REQUESTS.inc("answer", "miss" if cached is None else "semantic")
+    return cached, cache_key, query_embedding
+
+
+def is_cacheable_answer(request: QueryRequest, response: QueryResponse) -> bool:
+    """
+    Une réponse dégradée n'est pas mise en cache : recherche web en échec ou
+    sans résultat (search_web_agent rend alors []) en mode hybrid/science, ou
+    réponse de repli sans article. Elle serait resservie pendant tout le TTL
+    après une panne passagère de Tavily.
+    """
+    if response.answer == NO_SCIENCE_SOURCES_ANSWER:
+        return False
+    if request.mode in ("hybrid", "science"):
+        return any(src.source_type == "external" for src in response.sources)
+    return True
+
+
+def store_answer(
+    request: QueryRequest,
+    cache_key: tuple | None,
+    query_embedding: list[float] | None,
+    stamp: float | None,
+    response: QueryResponse,
+) -> None:
+    """Met la réponse en cache si elle est complète et que l'index n'a pas changé depuis `stamp`."""
+    if answer_cache is None or not is_cacheable_answer(request, response):
+        return
+    answer_cache.put(cache_key, query_embedding, response, stamp=stamp)
 
 
 # --- Main endpoints ---
@@ -347,193 +1097,308 @@ RÈGLES ANTI-HALLUCINATION:
 def read_root():
     return {"message": "RAG API is running"}
 
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness : le processus répond (ne dépend pas de l'index)."""
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readyz():
+    """
+    Readiness : 200 seulement quand l'index est chargé (collection ouverte,
+    index dérivés prêts) ; 503 pendant le chargement ou en cas d'échec.
+    """
+    if index is None:
+        loading = warmup_task is not None and not warmup_task.done()
+        return JSONResponse(
+            status_code=503,
+            content={
+                "status": "loading" if loading else "unavailable",
+                "index_loaded": False,
+                "error": None if loading else index_load_error,
+                "embedding_model": EMBEDDING_MODEL,
+            },
+        )
+
+    collection_size = await asyncio.to_thread(chroma_collection.count)
+    return {
+        "status": "ready",
+        "index_loaded": True,
+        "collection_size": collection_size,
+        "ingested_files": len(document_index),
+        "lexical_index": lexical_index is not None,
+        "reranker": reranker is not None,
+        "embedding_model": EMBEDDING_MODEL,
+    }
+
+@app.get("/metrics")
+def metrics():
+    """Métriques Prometheus (format texte) du processus : latences par étape, tokens, caches."""
+    return Response(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @app.post("/chat", response_model=QueryResponse)
 async def chat_endpoint(request: QueryRequest, token: str = Depends(verify_token)):
-    """Route la requête selon le mode sélectionné."""
+    """
+    Route la requête selon le mode sélectionné (avec cache de réponses).
+    Les requêtes identiques simultanées partagent un seul calcul (chat_flights) ;
+    leur Server-Timing porte l'attente (`coalesced`) et les étapes du calcul partagé.
+    """
     logger.info(f"Chat request - Mode: {request.mode}, Query: {request.query}")
 
+    key = chat_request_key(request)
+    joined = chat_flights.in_flight(key)
+    if joined:
+        logger.info("Requête identique en cours : réponse partagée")
+        CACHE_REQUESTS.inc("inflight", "joined")
+    else:
+        CACHE_REQUESTS.inc("inflight", "miss")
+
+    async def compute() -> tuple[QueryResponse, list[tuple[str, float]]]:
+        # Tâche partagée, dans le contexte de la première requête : étapes mesurées
+        # renvoyées avec la réponse pour le Server-Timing des requêtes qui la rejoignent
+        stamp = answer_cache.current_stamp() if answer_cache is not None else None
+        cached, cache_key, query_embedding = await lookup_answer_cache(request)
+        if cached is not None:
+            return cached, request_timings()
+
+        response = await answer_query(request)
+        store_answer(request, cache_key, query_embedding, stamp, response)
+        return response, request_timings()
+
+    if not joined:
+        response, _ = await chat_flights.run(key, compute)
+        return response
+
+    with span("coalesced"):
+        response, leader_timings = await chat_flights.run(key, compute)
+    add_request_timings(leader_timings)
+    return response
+
+
+async def answer_query(request: QueryRequest) -> QueryResponse:
+    """Calcule la réponse à une requête /chat selon son mode (sans cache)."""
     if request.mode == "internal":
-        index = get_index()
+        index = await aget_index()
         if not index:
             raise HTTPException(status_code=500, detail="Search index not initialized. Run ingestion first.")
 
-        if not request.document_filter:
-            # Chemin existant : pas de filtre spatial
-            query_engine = index.as_query_engine(similarity_top_k=5)
-            response = query_engine.query(request.query)
-
-            sources = []
-            for node in response.source_nodes:
-                metadata = node.node.metadata or {}
-                sources.append(SourceNode(
-                    text=node.node.get_content()[:500] + "...",
-                    score=node.score or 0.0,
-                    page_label=str(metadata.get("page_label", "N/A")),
-                    file_name=str(metadata.get("file_name", "N/A")),
-                    content_type=str(metadata.get("content_type", "text")),
-                    source_type="internal"
-                ))
-
-            return QueryResponse(answer=str(response), sources=sources)
-
-        else:
-            # Chemin filtré spatialement : retrieval séparé puis filtre puis synthèse LLM
-            retriever = index.as_retriever(similarity_top_k=5)
-            raw_nodes = retriever.retrieve(request.query)
-            filtered_nodes, filter_active = filter_nodes_by_document_stems(raw_nodes, request.document_filter)
-
-            sources = []
-            for node in filtered_nodes:
-                metadata = node.node.metadata or {}
-                sources.append(SourceNode(
-                    text=node.node.get_content()[:500] + "...",
-                    score=node.score or 0.0,
-                    page_label=str(metadata.get("page_label", "N/A")),
-                    file_name=str(metadata.get("file_name", "N/A")),
-                    content_type=str(metadata.get("content_type", "text")),
-                    source_type="internal"
-                ))
-
-            context_text = "\n\n".join(
-                f"[{i+1}] {n.node.get_content()[:800]}"
-                for i, n in enumerate(filtered_nodes)
-            )
-            spatial_note = (
-                "\n\nNote : La recherche a été filtrée géographiquement — seuls les documents "
-                "correspondant à la zone sélectionnée sur la carte ont été consultés."
-                if filter_active else ""
-            )
-            system_prompt = (
-                "Tu es un assistant expert en environnement. Réponds à la question de l'utilisateur "
-                "en te basant UNIQUEMENT sur les documents fournis. Cite les sources avec [n]. "
-                "Si les documents ne contiennent pas l'information, dis-le explicitement. "
-                "Ne jamais inventer ni extrapoler au-delà des données fournies. Réponds en français."
-                + spatial_note
-            )
-            messages_llm = [
-                ChatMessage(role=MessageRole.SYSTEM, content=system_prompt),
-                ChatMessage(
-                    role=MessageRole.USER,
-                    content=f"Question : {request.query}\n\nContexte :\n{context_text}"
-                ),
-            ]
-            llm_response = await Settings.llm.achat(messages_llm)
-            return QueryResponse(
-                answer=str(llm_response.message.content),
-                sources=sources,
-                spatial_filter_active=filter_active,
-            )
+        # Retrieval (restreint aux documents de la zone si filtre spatial) puis synthèse LLM
+        filters, filter_active = build_document_filters(request.document_filter)
+        nodes = await retrieve_nodes(index, request.query, 5, filters, request.mode)
+
+        with span("context"):
+            messages_llm, packed = build_internal_messages(request.query, nodes, filter_active)
+            prompt_tokens = report_context_usage(request.mode, messages_llm, packed)
+        sources = [node_to_source(nodes[i]) for i in packed.kept]
+
+        with span("llm"):
+            llm_response = await get_llm().achat(messages_llm)
+        answer = str(llm_response.message.content)
+        record_completion_tokens(request.mode, answer)
+        return QueryResponse(
+            answer=answer,
+            sources=sources,
+            spatial_filter_active=filter_active,
+            prompt_tokens=prompt_tokens,
+        )
 
     elif request.mode == "hybrid":
         # Mode Hybride: Interne + Web complet (SANS filtres de domaines)
-        internal_sources = []
-        external_sources = []
-        filter_active = False
-
-        # Requête interne
-        index = get_index()
-        if index:
-            query_engine = index.as_query_engine(similarity_top_k=3)
-            response_internal = query_engine.query(request.query)
-            raw_nodes = response_internal.source_nodes
-            filtered_internal, filter_active = filter_nodes_by_document_stems(raw_nodes, request.document_filter)
-            for node in filtered_internal:
-                metadata = node.node.metadata or {}
-                internal_sources.append(SourceNode(
-                    text=node.node.get_content()[:500] + "...",
-                    score=node.score or 0.0,
-                    page_label=str(metadata.get("page_label", "N/A")),
-                    file_name=str(metadata.get("file_name", "N/A")),
-                    content_type=str(metadata.get("content_type", "text")),
-                    source_type="internal"
-                ))
-
-        # Requête externe SANS filtres de domaines (web complet)
-        external_sources = await search_web_agent(request.query, max_results=2, use_domain_filters=False)
-
-        # Synthèse comparative (async)
-        answer = await synthesize_hybrid_response(
-            request.query,
-            internal_sources,
-            external_sources
+        # Retrieval interne (sans synthèse) et recherche web lancés en parallèle
+        (internal_nodes, filter_active), external_sources = await asyncio.gather(
+            retrieve_internal_nodes(request.query, request.document_filter, similarity_top_k=3),
+            search_web_agent(request.query, max_results=2, use_domain_filters=False),
         )
 
-        all_sources = internal_sources + external_sources
-        logger.info(f"Hybrid response - Internal: {len(internal_sources)}, External (web): {len(external_sources)}")
-        return QueryResponse(answer=answer, sources=all_sources, spatial_filter_active=filter_active)
+        # Synthèse comparative (async), distinction claire des sources
+        with span("context"):
+            messages, packed = build_hybrid_messages(request.query, internal_nodes, external_sources)
+            prompt_tokens = report_context_usage(request.mode, messages, packed)
+        candidates = [node_to_source(n) for n in internal_nodes] + external_sources
+        all_sources = [candidates[i] for i in packed.kept]
+
+        with span("llm"):
+            response = await get_llm().achat(messages)
+        answer = str(response.message.content)
+        record_completion_tokens(request.mode, answer)
+        logger.info(f"Hybrid response - Internal: {len(internal_nodes)}, External (web): {len(external_sources)}")
+        return QueryResponse(
+            answer=answer,
+            sources=all_sources,
+            spatial_filter_active=filter_active,
+            prompt_tokens=prompt_tokens,
+        )
 
     elif request.mode == "science":
         # Mode Science: Revues scientifiques UNIQUEMENT (AVEC filtres de domaines)
         # La requête est traduite FR→EN avant la recherche pour maximiser les résultats
 
-        llm = Settings.llm
-
         # 1. Traduire la requête FR → EN
-        tr_messages = [
-            ChatMessage(
-                role=MessageRole.SYSTEM,
-                content="Translate the following French text to English. Return only the translation, nothing else."
-            ),
-            ChatMessage(role=MessageRole.USER, content=request.query)
-        ]
-        tr_response = await llm.achat(tr_messages)
-        english_query = str(tr_response.message.content).strip()
-        logger.info(f"Science - query translated: '{request.query}' → '{english_query}'")
+        english_query = await translate_query_to_english(request.query)
 
         # 2. Recherche externe avec la requête EN (AVEC filtres de domaines scientifiques)
         external_sources = await search_web_agent(english_query, max_results=5, use_domain_filters=True)
 
         # 3. Générer réponse bilingue (FR d'abord, EN original en dessous)
+        prompt_tokens = None
         if external_sources:
-            context = "Scientific sources:\n"
-            for i, src in enumerate(external_sources, 1):
-                context += f"[{i}] {src.title}: {src.text}\n\n"
+            with span("context"):
+                messages, packed = build_science_messages(request.query, english_query, external_sources)
+                prompt_tokens = report_context_usage(request.mode, messages, packed)
+            external_sources = [external_sources[i] for i in packed.kept]
+            with span("llm"):
+                response = await get_llm().achat(messages)
+            answer = str(response.message.content)
+            record_completion_tokens(request.mode, answer)
+        else:
+            answer = NO_SCIENCE_SOURCES_ANSWER
+
+        english_query_out = returned_english_query(request.query, english_query)
+        logger.info(f"Science response - query EN: '{english_query}', sources: {len(external_sources)}, translated: {english_query_out is not None}")
+        return QueryResponse(
+            answer=answer,
+            sources=external_sources,
+            english_query=english_query_out,
+            prompt_tokens=prompt_tokens,
+        )
 
-            system_prompt = """You are an expert scientific assistant. Analyze the provided scientific articles and answer the user's question.
+    else:
+        raise HTTPException(status_code=400, detail=f"Mode invalide: {request.mode}. Modes disponibles: internal, hybrid, science")
 
-RULES:
-- Base your response ONLY on the provided scientific articles
-- Systematically cite sources with [number]
-- Mention authors, journals or dates when relevant
-- If articles don't contain the information, say so explicitly
-- Do not invent or extrapolate beyond the provided data
-- Structure the response clearly and academically
 
-RESPONSE FORMAT — follow this structure strictly:
-1. Write the complete answer in FRENCH (the user's language)
-2. Add this exact separator on its own line: ---
-3. Add this label on its own line: **Version originale (anglais) :**
-4. Write the complete answer in ENGLISH, prefixing every paragraph with "> " (markdown blockquote)
-"""
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: QueryRequest, token: str = Depends(verify_token)):
+    """
+    Variante streaming (SSE) de /chat.
+
+    Séquence d'événements :
+    1. `sources` : liste des SourceNode récupérés
+    2. `token`   : fragments de la réponse au fil de la génération LLM (`delta`)
+    3. `done`    : `english_query`, `spatial_filter_active` et `prompt_tokens`
+    En cas d'erreur après l'ouverture du flux (index non chargé compris), un
+    événement `error` est émis.
+    """
+    logger.info(f"Chat stream request - Mode: {request.mode}, Query: {request.query}")
+
+    if request.mode not in ("internal", "hybrid", "science"):
+        raise HTTPException(status_code=400, detail=f"Mode invalide: {request.mode}. Modes disponibles: internal, hybrid, science")
 
-            messages = [
-                ChatMessage(role=MessageRole.SYSTEM, content=system_prompt),
-                ChatMessage(
-                    role=MessageRole.USER,
-                    content=f"Question (FR): {request.query}\nQuestion (EN): {english_query}\n\n{context}"
+    async def event_stream():
+        # Commentaire SSE immédiat : envoie les en-têtes sans attendre le cache
+        # (embedding de la requête), le chargement de l'index ni le retrieval
+        yield ": stream ouvert\n\n"
+
+        try:
+            stamp = answer_cache.current_stamp() if answer_cache is not None else None
+            cached, cache_key, query_embedding = await lookup_answer_cache(request)
+            if cached is not None:
+                yield _sse_event("sources", [src.model_dump() for src in cached.sources])
+                yield _sse_event("token", {"delta": cached.answer})
+                yield _sse_event("done", {
+                    "english_query": cached.english_query,
+                    "spatial_filter_active": cached.spatial_filter_active,
+                    "prompt_tokens": cached.prompt_tokens,
+                })
+                return
+
+            index = await aget_index()
+            if request.mode == "internal" and not index:
+                yield _sse_event("error", {"detail": "Search index not initialized. Run ingestion first."})
+                return
+
+            sources: list[SourceNode] = []
+            messages: list[ChatMessage] | None = None
+            english_query_out: str | None = None
+            filter_active = False
+            fallback_answer = ""
+            prompt_tokens: int | None = None
+
+            if request.mode == "internal":
+                filters, filter_active = build_document_filters(request.document_filter)
+                nodes = await retrieve_nodes(index, request.query, 5, filters, request.mode)
+                messages, packed = build_internal_messages(request.query, nodes, filter_active)
+                sources = [node_to_source(nodes[i]) for i in packed.kept]
+
+            elif request.mode == "hybrid":
+                (internal_nodes, filter_active), external_sources = await asyncio.gather(
+                    retrieve_internal_nodes(request.query, request.document_filter, similarity_top_k=3),
+                    search_web_agent(request.query, max_results=2, use_domain_filters=False),
                 )
-            ]
+                messages, packed = build_hybrid_messages(request.query, internal_nodes, external_sources)
+                candidates = [node_to_source(n) for n in internal_nodes] + external_sources
+                sources = [candidates[i] for i in packed.kept]
+
+            else:  # science
+                english_query = await translate_query_to_english(request.query)
+                sources = await search_web_agent(english_query, max_results=5, use_domain_filters=True)
+                english_query_out = returned_english_query(request.query, english_query)
+                if sources:
+                    messages, packed = build_science_messages(request.query, english_query, sources)
+                    sources = [sources[i] for i in packed.kept]
+                else:
+                    fallback_answer = NO_SCIENCE_SOURCES_ANSWER
+
+            if messages is not None:
+                prompt_tokens = report_context_usage(request.mode, messages, packed)
+
+            yield _sse_event("sources", [src.model_dump() for src in sources])
+
+            answer_parts: list[str] = []
+            if messages is not None:
+                start = time.perf_counter()
+                stream = await get_llm().astream_chat(messages)
+                async for chunk in stream:
+                    if chunk.delta:
+                        if not answer_parts:
+                            record_stage("llm_first_token", time.perf_counter() - start)
+                        answer_parts.append(chunk.delta)
+                        yield _sse_event("token", {"delta": chunk.delta})
+                record_stage("llm", time.perf_counter() - start)
+                record_completion_tokens(request.mode, "".join(answer_parts))
+            else:
+                answer_parts.append(fallback_answer)
+                yield _sse_event("token", {"delta": fallback_answer})
+
+            yield _sse_event("done", {
+                "english_query": english_query_out,
+                "spatial_filter_active": filter_active,
+                "prompt_tokens": prompt_tokens,
+            })
+            logger.info(f"Chat stream complete - Mode: {request.mode}, sources: {len(sources)}")
+
+            store_answer(request, cache_key, query_embedding, stamp, QueryResponse(
+                answer="".join(answer_parts),
+                sources=sources,
+                english_query=english_query_out,
+                spatial_filter_active=filter_active,
+                prompt_tokens=prompt_tokens,
+            ))
 
-            response = await llm.achat(messages)
-            answer = str(response.message.content)
-        else:
-            answer = "Aucun article scientifique trouvé pour cette requête dans les revues indexées."
+        except Exception as e:
+            logger.error(f"Erreur chat stream: {e}")
+            yield _sse_event("error", {"detail": str(e)})
 
-        # Retourner la traduction seulement si la requête était en français
-        returned_english_query = (
-            english_query
-            if _normalize_for_lang_comparison(request.query) != _normalize_for_lang_comparison(english_query)
-            else None
-        )
-        logger.info(f"Science response - query EN: '{english_query}', sources: {len(external_sources)}, translated: {returned_english_query is not None}")
-        return QueryResponse(answer=answer, sources=external_sources, english_query=returned_english_query)
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-    else:
-        raise HTTPException(status_code=400, detail=f"Mode invalide: {request.mode}. Modes disponibles: internal, hybrid, science")
+pdf_page_cache: PageCache | None = None
 
-@app.get("/pdf/{filename:path}")
-def get_pdf(filename: str, token: str = Depends(verify_token)):
-    """Serve PDF files from the data directory"""
+
+def get_pdf_page_cache() -> PageCache:
+    global pdf_page_cache
+    if pdf_page_cache is None:
+        pdf_page_cache = PageCache(PDF_PAGE_CACHE_DIR, PDF_PAGE_CACHE_MAX_MB * 1024 * 1024)
+    return pdf_page_cache
+
+
+def resolve_pdf_path(filename: str) -> str:
+    """Chemin absolu d'un PDF de DATA_DIR (403 hors de DATA_DIR, 404 absent, 400 pas un PDF)."""
     pdf_path = os.path.join(DATA_DIR, filename)
 
     # Security: Ensure the requested file is within DATA_DIR
@@ -549,16 +1414,367 @@ def get_pdf(filename: str, token: str = Depends(verify_token)):
     if not pdf_path.endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Not a PDF file")
 
-    return FileResponse(
-        pdf_path,
-        media_type="application/pdf",
-        filename=filename
+    return pdf_path
+
+
+def _is_not_modified(request: Request, etag: str, mtime: float) -> bool:
+    """If-None-Match (prioritaire) ou If-Modified-Since satisfait : 304."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def pdf_response(
+    request: Request, etag: str, mtime: float, get_body, filename: str, get_extra_headers=None
+) -> Response:
+    """
+    Réponse PDF conditionnelle : 304 si le client a déjà cette version, sinon
+    `get_body()` (appelé seulement en l'absence de 304) : un chemin est servi
+    par FileResponse (Range / If-Range gérés par Starlette : 206 partiel), un
+    contenu en mémoire (page extraite) tel quel. `get_extra_headers()` n'est
+    lui aussi appelé qu'en l'absence de 304 : la copie en cache du client a
+    déjà ces en-têtes.
+    """
+    headers = {
+        "etag": etag,
+        "last-modified": formatdate(mtime, usegmt=True),
+        "cache-control": "private, no-cache",  # revalidation à chaque ouverture (304 sans corps)
+    }
+    if _is_not_modified(request, etag, mtime):
+        return Response(status_code=304, headers=headers)
+    if get_extra_headers is not None:
+        headers.update(get_extra_headers())
+    body = get_body()
+    if isinstance(body, bytes):
+        headers["content-disposition"] = f"attachment; filename*=utf-8''{quote(filename)}"
+        return Response(body, media_type="application/pdf", headers=headers)
+    return FileResponse(body, media_type="application/pdf", filename=filename, headers=headers)
+
+
+def _pdf_etag(pdf_path: str) -> tuple[str, float]:
+    stat = os.stat(pdf_path)
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"', stat.st_mtime
+
+
+# Déclarée avant /pdf/{filename:path}, qui capturerait aussi ".../page/{n}"
+@app.get("/pdf/{filename:path}/page/{page_number}")
+def get_pdf_page(filename: str, page_number: int, request: Request, token: str = Depends(verify_token)):
+    """
+    Une seule page (1-based) d'un PDF, extraite une fois puis servie depuis le
+    cache disque. X-Page-Count : nombre de pages du document (navigation).
+    Revalidation sur l'ETag du fichier (stat) : un 304 n'ouvre pas le PDF.
+    """
+    pdf_path = resolve_pdf_path(filename)
+    etag, mtime = _pdf_etag(pdf_path)
+
+    def page_content() -> bytes:
+        try:
+            return get_pdf_page_cache().get_page(pdf_path, page_number)
+        except IndexError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+
+    page_filename = f"{Path(filename).stem}_p{page_number}.pdf"
+    return pdf_response(
+        request, f'{etag[:-1]}-p{page_number}"', mtime, page_content, page_filename,
+        get_extra_headers=lambda: {"x-page-count": str(get_pdf_page_cache().page_count(pdf_path))},
     )
 
 
-@app.post("/export/gdb")
-async def export_gdb(request: ExportRequest, token: str = Depends(verify_token)):
-    """Convertit les couches GeoJSON sélectionnées en File Geodatabase zippé."""
+@app.get("/pdf/{filename:path}")
+def get_pdf(filename: str, request: Request, token: str = Depends(verify_token)):
+    """Serve PDF files from the data directory (Range, ETag / Last-Modified, 304)"""
+    pdf_path = resolve_pdf_path(filename)
+    etag, mtime = _pdf_etag(pdf_path)
+    return pdf_response(request, etag, mtime, lambda: pdf_path, filename)
+
+
+def iter_export_layers(body_path: str):
+    """
+    Itère sur les couches d'un corps ExportRequest stocké sur disque, une à la fois.
+    Avec ijson (parsing incrémental), seule la couche courante est en mémoire ;
+    sans ijson, repli sur json.load (tout le corps en mémoire).
+    """
+    try:
+        import ijson                     # lazy import — parsing JSON incrémental
+    except ImportError:
+        ijson = None
+
+    json_errors = (ValueError,) if ijson is None else (ValueError, ijson.JSONError)
+    with open(body_path, "rb") as f:
+        try:
+            if ijson is None:
+                items = json.load(f).get("layers", [])
+            else:
+                items = ijson.items(f, "layers.item", use_float=True)
+            for item in items:
+                yield GeoJSONLayer.model_validate(item)
+        except ValidationError:
+            raise
+        except json_errors as e:
+            raise ValueError(f"JSON invalide : {e}") from e
+
+
+def _unique_layer_name(name: str, index: int, used_names: set[str]) -> str:
+    """Nom de feature class assaini et unique dans l'export."""
+    return unique_layer_name(_sanitize_gdb_name(name, index), used_names)
+
+
+def read_export_bbox(body_path: str) -> list[float] | None:
+    """Lit le champ `bbox` du corps d'export (passe incrémentale dédiée avec ijson)."""
+    try:
+        import ijson
+    except ImportError:
+        ijson = None
+
+    with open(body_path, "rb") as f:
+        if ijson is None:
+            bbox = json.load(f).get("bbox")
+        else:
+            try:
+                bbox = next(ijson.items(f, "bbox", use_float=True), None)
+            except ijson.JSONError as e:
+                raise ValueError(f"JSON invalide : {e}") from e
+    if bbox is not None and (len(bbox) != 4 or bbox[0] > bbox[2] or bbox[1] > bbox[3]):
+        raise ValueError("bbox doit être [minx, miny, maxx, maxy]")
+    return bbox
+
+
+# --- Export jobs ---
+
+class ExportJobStatus(BaseModel):
+    job_id: str
+    status: str = "queued"  # "queued" | "running" | "done" | "error"
+    layers_written: int = 0
+    error: str | None = None
+
+
+def get_export_executor() -> ProcessPoolExecutor:
+    """Pool de processus pour la conversion des couches (créé au premier export)."""
+    global export_executor
+    with export_executor_lock:
+        if export_executor is None:
+            # spawn : les processus n'importent que export_worker (pas l'API ni LlamaIndex)
+            export_executor = ProcessPoolExecutor(
+                max_workers=EXPORT_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return export_executor
+
+
+def discard_export_executor(broken: ProcessPoolExecutor) -> None:
+    """
+    Abandonne un pool inutilisable (worker tué, ex: OOM sur une grosse couche) :
+    le prochain get_export_executor en crée un neuf au lieu d'échouer jusqu'au
+    redémarrage de l'API.
+    """
+    global export_executor
+    with export_executor_lock:
+        if export_executor is broken:
+            export_executor = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def _export_layer_error(e: Exception) -> HTTPException:
+    """Traduit une erreur de conversion de couche (processus du pool) en erreur HTTP."""
+    if isinstance(e, PermissionError):
+        return HTTPException(status_code=403, detail="Access denied")
+    if isinstance(e, FileNotFoundError):
+        return HTTPException(status_code=404, detail=str(e))
+    return HTTPException(status_code=422, detail=f"Couche invalide : {e}")
+
+
+def write_export_layers(body_path: str, work_dir: str, export_format: str, progress=None) -> tuple[int, int]:
+    """
+    Convertit les couches dans le pool de processus (au plus EXPORT_PROCESSES
+    en vol, pour borner la mémoire) et les écrit au fil de l'eau. Seul ce
+    thread écrit : les ajouts au conteneur (GPKG/GDB) sont sérialisés, la
+    conversion est parallèle.
+
+    Returns:
+        (layers_received, layers_written)
+
+    Raises:
+        BrokenProcessPool: un worker est mort ; le pool a été abandonné.
+    """
+    bbox = read_export_bbox(body_path)
+    executor = get_export_executor()
+    os.makedirs(os.path.join(work_dir, "layers"), exist_ok=True)
+    used_names: set[str] = set()
+    pending: dict = {}  # Future -> nom de couche
+    layers_received = 0
+    layers_written = 0
+
+    def write_completed():
+        nonlocal layers_written
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            fc_name = pending.pop(future)
+            try:
+                gdf = future.result()
+            except (PermissionError, FileNotFoundError, ValueError) as e:
+                raise _export_layer_error(e)
+            if gdf is None:
+                continue  # couche vide ignorée
+
+            write_export_layer(
+                gdf, export_format, work_dir, fc_name, append=(layers_written > 0), used_names=used_names
+            )
+            layers_written += 1
+            if progress:
+                progress(layers_written)
+
+    try:
+        for i, layer in enumerate(iter_export_layers(body_path)):
+            layers_received += 1
+            fc_name = _unique_layer_name(layer.name, i, used_names)
+            pending[executor.submit(load_export_layer, layer.model_dump(), bbox, GEOJSON_DIR)] = fc_name
+            del layer  # le GeoJSON brut n'est plus nécessaire
+            while len(pending) >= EXPORT_PROCESSES:
+                write_completed()
+        while pending:
+            write_completed()
+    except BrokenProcessPool:
+        discard_export_executor(executor)
+        raise
+    finally:
+        for future in pending:
+            future.cancel()
+
+    return layers_received, layers_written
+
+
+def reset_export_work_dir(work_dir: str, body_path: str) -> None:
+    """Supprime les sorties partielles d'un export (le corps de la requête est conservé)."""
+    for entry in os.scandir(work_dir):
+        if entry.path == body_path:
+            continue
+        if entry.is_dir():
+            shutil.rmtree(entry.path, ignore_errors=True)
+        else:
+            os.remove(entry.path)
+
+
+async def run_export_job(job_id: str) -> None:
+    """Exécute un job d'export ; au plus EXPORT_MAX_CONCURRENT jobs simultanés."""
+    job = export_jobs[job_id]
+    job_status: ExportJobStatus = job["status"]
+
+    async with export_semaphore:
+        job_status.status = "running"
+
+        def progress(layers_written: int) -> None:
+            job_status.layers_written = layers_written
+
+        try:
+            with span("export_convert"):
+                try:
+                    layers_received, layers_written = await asyncio.to_thread(
+                        write_export_layers, job["body_path"], job["tmpdir"], job["format"], progress
+                    )
+                except BrokenProcessPool:
+                    # Pool cassé (par ce job ou un autre) : un seul nouvel essai sur un pool neuf
+                    logger.warning(f"Export {job_id}: pool de conversion interrompu, nouvel essai")
+                    reset_export_work_dir(job["tmpdir"], job["body_path"])
+                    job_status.layers_written = 0
+                    try:
+                        layers_received, layers_written = await asyncio.to_thread(
+                            write_export_layers, job["body_path"], job["tmpdir"], job["format"], progress
+                        )
+                    except BrokenProcessPool:
+                        raise HTTPException(
+                            status_code=503,
+                            detail="Conversion interrompue (processus arrêté, mémoire insuffisante ?). Réessayez "
+                                   "avec moins de couches ou une emprise (bbox) plus petite.",
+                        )
+            if layers_received == 0:
+                raise HTTPException(status_code=400, detail="Aucune couche fournie")
+
+            if layers_written == 0:
+                raise HTTPException(status_code=422, detail="Aucune couche valide à exporter")
+
+            os.remove(job["body_path"])
+            with span("export_finalize"):
+                job["output_path"] = await asyncio.to_thread(
+                    finalize_export, job["tmpdir"], job["format"], EXPORT_FORMATS[job["format"]][1]
+                )
+            job_status.status = "done"
+        except HTTPException as e:
+            job["error_code"], job_status.error = e.status_code, str(e.detail)
+        except (ValueError, ValidationError) as e:
+            # JSON invalide (json/ijson) ou couche non conforme à GeoJSONLayer
+            job["error_code"], job_status.error = 422, f"Requête d'export invalide : {e}"
+        except Exception as e:
+            logger.error(f"Erreur export {job_id}: {e}")
+            job["error_code"], job_status.error = 500, "Erreur lors de l'export"
+        finally:
+            job["finished_at"] = time.monotonic()
+
+    if job_status.error is not None:
+        job_status.status = "error"
+        shutil.rmtree(job["tmpdir"], ignore_errors=True)
+    logger.info(f"Export {job_id}: {job_status.status} ({job_status.layers_written} couche(s))")
+
+
+def remove_export_job(job_id: str) -> None:
+    job = export_jobs.pop(job_id, None)
+    if job:
+        shutil.rmtree(job["tmpdir"], ignore_errors=True)
+
+
+def cleanup_export_jobs() -> None:
+    """Supprime les jobs terminés depuis plus de EXPORT_JOB_TTL secondes (et leurs fichiers)."""
+    now = time.monotonic()
+    expired = [
+        job_id for job_id, job in export_jobs.items()
+        if job["finished_at"] is not None and now - job["finished_at"] > EXPORT_JOB_TTL
+    ]
+    for job_id in expired:
+        remove_export_job(job_id)
+
+
+async def create_export_job(request: Request, export_format: str) -> str:
+    """Copie le corps (ExportRequest) sur disque au fil de la réception et lance le job d'export."""
+    cleanup_export_jobs()
+
+    tmpdir = tempfile.mkdtemp(prefix="export_")
+    body_path = os.path.join(tmpdir, "request.json")
+    try:
+        with span("export_upload"), open(body_path, "wb") as f:
+            async for chunk in request.stream():
+                f.write(chunk)
+    except BaseException:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+        raise
+
+    job_id = uuid.uuid4().hex
+    export_jobs[job_id] = {
+        "status": ExportJobStatus(job_id=job_id),
+        "tmpdir": tmpdir,
+        "body_path": body_path,
+        "format": export_format,
+        "output_path": None,
+        "error_code": None,
+        "finished_at": None,
+    }
+    export_jobs[job_id]["task"] = asyncio.create_task(run_export_job(job_id))
+    return job_id
+
+
+def _check_export_format(export_format: str) -> None:
+    """Valide le format demandé et la présence des dépendances nécessaires."""
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Format invalide: {export_format}. Formats disponibles: {', '.join(EXPORT_FORMATS)}"
+        )
     try:
         import geopandas as gpd          # lazy import — évite de crasher le backend si non installé
         from pyogrio import write_dataframe as pyogrio_write
@@ -567,52 +1783,101 @@ async def export_gdb(request: ExportRequest, token: str = Depends(verify_token))
             status_code=501,
             detail="geopandas/pyogrio non installé sur le serveur. Exécutez : pip install geopandas pyogrio"
         )
+    if export_format == "parquet":
+        try:
+            import pyarrow  # noqa: F401 — requis par GeoDataFrame.to_parquet
+        except ImportError:
+            raise HTTPException(
+                status_code=501,
+                detail="pyarrow non installé sur le serveur. Exécutez : pip install pyarrow"
+            )
 
-    if not request.layers:
-        raise HTTPException(status_code=400, detail="Aucune couche fournie")
 
-    with tempfile.TemporaryDirectory() as tmpdir:
-        gpkg_path = os.path.join(tmpdir, "export.gpkg")
-        used_names: set[str] = set()
-        layers_written = 0
+def _export_file_response(job: dict, background: BackgroundTask | None = None) -> FileResponse:
+    media_type, filename = EXPORT_FORMATS[job["format"]]
+    return FileResponse(job["output_path"], media_type=media_type, filename=filename, background=background)
 
-        for i, layer in enumerate(request.layers):
-            features = layer.geojson.get("features", [])
-            if not features:
-                continue  # couche vide ignorée
 
-            gdf = gpd.GeoDataFrame.from_features(features, crs="EPSG:4326")
-            if gdf.empty or gdf.geometry.isna().all():
-                continue
-
-            # Nom unique pour la couche
-            base_name = _sanitize_gdb_name(layer.name, i)
-            fc_name = base_name
-            suffix = 1
-            while fc_name in used_names:
-                fc_name = f"{base_name}_{suffix}"
-                suffix += 1
-            used_names.add(fc_name)
-
-            # GeoPackage : pyogrio respecte parfaitement layer= pour le nommage
-            # append=False (1re couche) → crée le GPKG ; append=True (suivantes) → ajoute une couche
-            pyogrio_write(
-                gdf,
-                gpkg_path,
-                layer=fc_name,
-                driver="GPKG",
-                append=(layers_written > 0),
-            )
-            layers_written += 1
+def _get_export_job(job_id: str) -> dict:
+    job = export_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job d'export introuvable")
+    return job
 
-        if layers_written == 0 or not os.path.exists(gpkg_path):
-            raise HTTPException(status_code=422, detail="Aucune couche valide à exporter")
 
-        with open(gpkg_path, "rb") as f:
-            content = f.read()
+# format → (media type, nom du fichier téléchargé)
+EXPORT_FORMATS = {
+    "gpkg": ("application/geopackage+sqlite3", "export_couches.gpkg"),
+    "fgb": ("application/zip", "export_couches_fgb.zip"),
+    "parquet": ("application/zip", "export_couches_parquet.zip"),
+    "gdb": ("application/zip", "export_couches.gdb.zip"),
+}
 
-        return FastAPIResponse(
-            content=content,
-            media_type="application/geopackage+sqlite3",
-            headers={"Content-Disposition": "attachment; filename=export_couches.gpkg"},
-        )
+EXPORT_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": ExportRequest.model_json_schema()}},
+    }
+}
+
+
+@app.post("/export/jobs", response_model=ExportJobStatus, status_code=202, openapi_extra=EXPORT_REQUEST_BODY)
+async def create_export_job_endpoint(request: Request, format: str = "gpkg", token: str = Depends(verify_token)):
+    """
+    Lance un export en arrière-plan (corps : ExportRequest ; `format` : gpkg, fgb, parquet, gdb).
+    Suivi via GET /export/jobs/{job_id}, fichier via GET /export/jobs/{job_id}/download.
+    """
+    _check_export_format(format)
+    job_id = await create_export_job(request, format)
+    return export_jobs[job_id]["status"]
+
+
+@app.get("/export/jobs/{job_id}", response_model=ExportJobStatus)
+async def get_export_job(job_id: str, token: str = Depends(verify_token)):
+    cleanup_export_jobs()
+    return _get_export_job(job_id)["status"]
+
+
+@app.get("/export/jobs/{job_id}/download")
+async def download_export_job(job_id: str, token: str = Depends(verify_token)):
+    job = _get_export_job(job_id)
+    job_status: ExportJobStatus = job["status"]
+    if job_status.status == "error":
+        raise HTTPException(status_code=job["error_code"] or 500, detail=job_status.error)
+    if job_status.status != "done":
+        raise HTTPException(status_code=409, detail=f"Export non terminé (statut : {job_status.status})")
+
+    return _export_file_response(job)
+
+
+@app.post("/export/gdb", openapi_extra=EXPORT_REQUEST_BODY)
+async def export_gdb(request: Request, format: str = "gpkg", token: str = Depends(verify_token)):
+    """
+    Convertit les couches GeoJSON sélectionnées dans le format demandé :
+    - gpkg (défaut) : GeoPackage
+    - fgb : FlatGeobuf avec index spatial, un fichier par couche (zip)
+    - parquet : GeoParquet compressé zstd, un fichier par couche (zip)
+    - gdb : File Geodatabase (driver OpenFileGDB), répertoire .gdb zippé ;
+      champs Integer64 conservés (lecture : ArcGIS Pro 3.2 ou plus récent)
+    Les noms de couches suivent _sanitize_gdb_name dans tous les formats.
+
+    Chaque couche est soit fournie en GeoJSON, soit référencée par son id
+    (`Groupe/fichier.geojson`) et lue côté serveur depuis GEOJSON_DIR ;
+    `bbox` (optionnel) découpe toutes les couches à l'emprise.
+
+    Variante synchrone des jobs d'export : même traitement (pool de
+    processus), réponse envoyée en streaming depuis le disque puis job
+    supprimé après l'envoi.
+    """
+    _check_export_format(format)
+    job_id = await create_export_job(request, format)
+    job = export_jobs[job_id]
+    # shield : une déconnexion du client n'interrompt pas l'export (nettoyé par TTL)
+    await asyncio.shield(job["task"])
+
+    job_status: ExportJobStatus = job["status"]
+    if job_status.status == "error":
+        remove_export_job(job_id)
+        raise HTTPException(status_code=job["error_code"] or 500, detail=job_status.error)
+
+    return _export_file_response(job, background=BackgroundTask(remove_export_job, job_id))
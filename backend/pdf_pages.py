@@ -0,0 +1,108 @@
+"""
+Extraction de pages PDF à la demande, avec cache disque.
+
+Une citation n'a besoin que d'une page d'un rapport de 50 à 200 Mo : la page
+est extraite une fois avec pypdf (seules les ressources qu'elle référence sont
+copiées) puis servie depuis le cache. La clé inclut la taille et le mtime du
+PDF source : un fichier remplacé produit de nouvelles entrées. Éviction LRU
+(date de dernier accès = mtime du fichier en cache) au-delà de `max_bytes`.
+
+Les pages sont renvoyées en mémoire (quelques centaines de Ko) plutôt que
+par chemin : une éviction concurrente peut supprimer le fichier en cache
+avant que la réponse ne l'ait lu.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import io
+import os
+import threading
+import uuid
+
+
+class PageCache:
+    """Pages PDF extraites, stockées dans `cache_dir` et bornées à `max_bytes`."""
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _key(self, pdf_path: str) -> str:
+        stat = os.stat(pdf_path)
+        return hashlib.sha256(f"{pdf_path}|{stat.st_size}|{stat.st_mtime_ns}".encode("utf-8")).hexdigest()[:32]
+
+    def _write_atomic(self, path: str, content: bytes) -> None:
+        # Deux requêtes simultanées produisent le même fichier
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def page_count(self, pdf_path: str) -> int:
+        """Nombre de pages de `pdf_path` (mémorisé à côté des pages, quelques octets)."""
+        count_path = os.path.join(self.cache_dir, f"{self._key(pdf_path)}.pages")
+        try:
+            with open(count_path, encoding="ascii") as f:
+                return int(f.read())
+        except (FileNotFoundError, ValueError):
+            pass
+
+        from pypdf import PdfReader
+
+        count = len(PdfReader(pdf_path).pages)
+        self._write_atomic(count_path, str(count).encode("ascii"))
+        return count
+
+    def get_page(self, pdf_path: str, page_number: int) -> bytes:
+        """
+        Contenu d'un PDF ne contenant que la page `page_number` (1-based) de `pdf_path`.
+
+        Raises:
+            IndexError: page hors du document.
+        """
+        entry_path = os.path.join(self.cache_dir, f"{self._key(pdf_path)}_p{page_number}.pdf")
+        try:
+            with open(entry_path, "rb") as f:
+                content = f.read()
+            os.utime(entry_path)  # accès récent : repoussé en fin de file LRU
+            return content
+        except FileNotFoundError:
+            pass  # absente, ou évincée entre la lecture et utime : réextraite
+
+        from pypdf import PdfReader, PdfWriter  # lazy import — inutile si la page est en cache
+
+        reader = PdfReader(pdf_path)
+        if not 1 <= page_number <= len(reader.pages):
+            raise IndexError(f"Page {page_number} hors du document ({len(reader.pages)} pages)")
+        writer = PdfWriter()
+        writer.add_page(reader.pages[page_number - 1])
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        content = buffer.getvalue()
+        self._write_atomic(entry_path, content)
+        self._evict(keep=entry_path)
+        return content
+
+    def _evict(self, keep: str) -> None:
+        with self._lock:
+            entries = []
+            total = 0
+            for entry in os.scandir(self.cache_dir):
+                if not entry.name.endswith(".pdf"):
+                    continue
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
@@ -0,0 +1,64 @@
+"""
+Reranking local par cross-encoder (ONNX Runtime, CPU).
+
+Le modèle est un cross-encoder exporté en ONNX (ex. ms-marco-MiniLM-L-6-v2,
+ou mmarco-mMiniLMv2-L12-H384-v1 pour le français) : le répertoire
+RERANK_MODEL_DIR doit contenir `model.onnx` et `tokenizer.json`. Chaque paire
+(requête, chunk) reçoit une probabilité de pertinence dans [0, 1] (sigmoïde
+du logit), comparable aux scores affichés pour les autres modes ;
+l'inférence est faite par lots, sans appel d'API.
+
+Dépendances optionnelles : requirements-rerank.txt.
+"""
+
+from __future__ import annotations
+
+import os
+
+import numpy as np
+
+
+class CrossEncoderReranker:
+    """Cross-encoder ONNX chargé une fois, appelé depuis un pool de threads."""
+
+    def __init__(self, model_dir: str, batch_size: int = 16, max_length: int = 512, threads: int = 2):
+        import onnxruntime as ort          # lazy import — dépendances optionnelles
+        from tokenizers import Tokenizer
+
+        self.batch_size = batch_size
+        self._tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self._tokenizer.enable_truncation(max_length)
+        pad_token = next(
+            (t for t in ("[PAD]", "<pad>") if self._tokenizer.token_to_id(t) is not None), "[PAD]"
+        )
+        self._tokenizer.enable_padding(pad_id=self._tokenizer.token_to_id(pad_token) or 0, pad_token=pad_token)
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        self._session = ort.InferenceSession(
+            os.path.join(model_dir, "model.onnx"),
+            sess_options=options,
+            providers=["CPUExecutionProvider"],
+        )
+        self._input_names = {i.name for i in self._session.get_inputs()}
+
+    def score(self, query: str, texts: list[str]) -> list[float]:
+        """Probabilité de pertinence de chaque texte pour la requête, dans [0, 1]."""
+        scores: list[float] = []
+        for start in range(0, len(texts), self.batch_size):
+            encodings = self._tokenizer.encode_batch(
+                [(query, text) for text in texts[start:start + self.batch_size]]
+            )
+            feeds = {
+                "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+                "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+            }
+            logits = self._session.run(None, {k: v for k, v in feeds.items() if k in self._input_names})[0]
+            # 1 logit (pertinence) ou 2 classes (non pertinent / pertinent) : softmax = sigmoïde de l'écart
+            if logits.ndim == 2 and logits.shape[1] == 2:
+                logits = logits[:, 1] - logits[:, 0]
+            elif logits.ndim == 2:
+                logits = logits[:, -1]
+            scores.extend((1.0 / (1.0 + np.exp(-logits))).tolist())
+        return scores
@@ -0,0 +1,176 @@
+"""
+Composants de recherche LlamaIndex / Chroma.
+
+Importé à la demande par main.py (chargement de l'index) : llama_index et
+chromadb ne ralentissent pas le démarrage des workers de l'API.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+from concurrent.futures import Executor
+
+import chromadb
+from llama_index.core import StorageContext, VectorStoreIndex
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle
+from llama_index.vector_stores.chroma import ChromaVectorStore
+from pydantic import PrivateAttr
+
+from lexical_index import reciprocal_rank_fusion
+
+
+class ThreadedChromaVectorStore(ChromaVectorStore):
+    """
+    ChromaVectorStore dont `aquery` exécute la recherche (synchrone côté Chroma)
+    dans un pool de threads, pour ne jamais bloquer la boucle d'événements.
+    """
+
+    _executor: Executor | None = PrivateAttr(default=None)
+
+    def __init__(self, executor: Executor, **kwargs):
+        super().__init__(**kwargs)
+        self._executor = executor
+
+    async def aquery(self, query, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor,
+            functools.partial(self.query, query, **kwargs),
+        )
+
+
+# Modèle d'embedding des vecteurs, en métadonnée de la collection (écrite par ingest.py).
+# Collection antérieure à cette métadonnée : modèle par défaut d'alors.
+EMBEDDING_MODEL_KEY = "embedding_model"
+LEGACY_EMBEDDING_MODEL = "text-embedding-ada-002"
+
+
+class EmbeddingModelMismatch(RuntimeError):
+    """Les vecteurs de la collection ne sont pas dans l'espace du modèle configuré."""
+
+
+def collection_embedding_model(collection) -> str | None:
+    """Modèle d'embedding des vecteurs de la collection ; None si elle est vide."""
+    model = (collection.metadata or {}).get(EMBEDDING_MODEL_KEY)
+    if model:
+        return str(model)
+    return LEGACY_EMBEDDING_MODEL if collection.count() > 0 else None
+
+
+def set_collection_embedding_model(collection, model: str) -> None:
+    if (collection.metadata or {}).get(EMBEDDING_MODEL_KEY) != model:
+        collection.modify(metadata={**(collection.metadata or {}), EMBEDDING_MODEL_KEY: model})
+
+
+def open_vector_index(chroma_db_dir: str, executor: Executor, embedding_model: str | None = None):
+    """
+    Ouvre la collection Chroma et l'index vectoriel associé.
+
+    Des vecteurs d'un autre modèle ont la même dimension (1536 pour
+    ada-002 et 3-small) : Chroma les accepterait sans erreur, mais les
+    résultats n'auraient plus de sens. Si `embedding_model` est fourni,
+    l'ouverture échoue donc quand la collection a été indexée avec un autre.
+
+    Returns:
+        (index, chroma_collection)
+
+    Raises:
+        EmbeddingModelMismatch: collection indexée avec un autre modèle.
+    """
+    db = chromadb.PersistentClient(path=chroma_db_dir)
+    collection = db.get_or_create_collection("rag_collection")
+    stored_model = collection_embedding_model(collection)
+    if embedding_model and stored_model not in (None, embedding_model):
+        raise EmbeddingModelMismatch(
+            f"Collection indexée avec {stored_model}, EMBEDDING_MODEL={embedding_model} : "
+            f"relancez `python ingest.py --force` ou définissez EMBEDDING_MODEL={stored_model}"
+        )
+    vector_store = ThreadedChromaVectorStore(executor, chroma_collection=collection)
+    storage_context = StorageContext.from_defaults(vector_store=vector_store)
+    index = VectorStoreIndex.from_vector_store(
+        vector_store,
+        storage_context=storage_context,
+    )
+    return index, collection
+
+
+class FusionRetriever(BaseRetriever):
+    """
+    Recherche vectorielle et BM25 en parallèle, classements fusionnés par
+    Reciprocal Rank Fusion. Les chunks trouvés seulement par BM25 sont relus
+    dans Chroma par id.
+
+    Score des nœuds : RRF rapporté à son maximum (chunk premier des deux
+    classements) ; le score RRF brut (~0,01-0,03) n'est pas lisible dans
+    l'interface, l'ordre est inchangé.
+    """
+
+    def __init__(
+        self,
+        vector_retriever,
+        lexical,
+        vector_store,
+        similarity_top_k: int,
+        candidates: int,
+        file_names: list[str] | None,
+        executor: Executor,
+        rrf_k: int = 60,
+    ):
+        super().__init__()
+        self._vector_retriever = vector_retriever
+        self._lexical = lexical
+        self._vector_store = vector_store
+        self._similarity_top_k = similarity_top_k
+        self._candidates = candidates
+        self._file_names = file_names
+        self._executor = executor
+        self._rrf_k = rrf_k
+
+    def _fuse(self, vector_nodes: list[NodeWithScore], lexical_hits: list[tuple[str, float]]):
+        fused = reciprocal_rank_fusion(
+            [[n.node.node_id for n in vector_nodes], [chunk_id for chunk_id, _ in lexical_hits]],
+            k=self._rrf_k,
+        )[:self._similarity_top_k]
+        known = {n.node.node_id: n.node for n in vector_nodes}
+        missing = [chunk_id for chunk_id, _ in fused if chunk_id not in known]
+        return fused, known, missing
+
+    def _with_scores(self, fused, known: dict) -> list[NodeWithScore]:
+        max_score = 2.0 / (self._rrf_k + 1)  # deux classements fusionnés
+        return [
+            NodeWithScore(node=known[chunk_id], score=score / max_score)
+            for chunk_id, score in fused if chunk_id in known
+        ]
+
+    def _retrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        vector_nodes = self._vector_retriever.retrieve(query_bundle)
+        lexical_hits = self._lexical.search(query_bundle.query_str, self._candidates, self._file_names)
+        fused, known, missing = self._fuse(vector_nodes, lexical_hits)
+        if missing:
+            known.update({node.node_id: node for node in self._vector_store.get_nodes(node_ids=missing)})
+        return self._with_scores(fused, known)
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        loop = asyncio.get_running_loop()
+        vector_nodes, lexical_hits = await asyncio.gather(
+            self._vector_retriever.aretrieve(query_bundle),
+            loop.run_in_executor(
+                self._executor,
+                self._lexical.search, query_bundle.query_str, self._candidates, self._file_names,
+            ),
+        )
+        fused, known, missing = self._fuse(vector_nodes, lexical_hits)
+        if missing:
+            nodes = await loop.run_in_executor(
+                self._executor, functools.partial(self._vector_store.get_nodes, node_ids=missing)
+            )
+            known.update({node.node_id: node for node in nodes})
+        return self._with_scores(fused, known)
+
+
+def rescored(nodes: list[NodeWithScore], scores: list[float]) -> list[NodeWithScore]:
+    """Nœuds triés par nouveau score décroissant (reranking)."""
+    ranked = sorted(zip(nodes, scores), key=lambda item: item[1], reverse=True)
+    return [NodeWithScore(node=n.node, score=float(score)) for n, score in ranked]
@@ -0,0 +1,127 @@
+"""
+Tokens de session signés (HMAC-SHA256), vérifiables sans état partagé.
+
+Format : `base64url(payload JSON).base64url(signature)`, le payload portant
+l'utilisateur (`sub`), l'expiration (`exp`) et un identifiant unique (`jti`).
+Tout worker ou toute réplique qui connaît le secret valide un token émis par
+un autre ; un redémarrage ne déconnecte personne.
+
+La révocation (/logout) est une petite table SQLite `jti → exp`, partagée par
+les workers d'un même hôte ; les entrées sont purgées à l'expiration du token.
+"""
+
+from __future__ import annotations
+
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SECRET_BYTES = 32
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def load_or_create_secret(path: str) -> bytes:
+    """
+    Secret de signature lu dans `path`, créé s'il n'existe pas. La création est
+    atomique (lien d'un fichier temporaire) : des workers qui démarrent en
+    même temps obtiennent tous le même secret.
+    """
+    try:
+        with open(path, "rb") as f:
+            return bytes.fromhex(f.read().decode("ascii").strip())
+    except FileNotFoundError:
+        pass
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="ascii") as f:
+        f.write(secrets.token_hex(SECRET_BYTES))
+    try:
+        os.link(tmp_path, path)
+        logger.info(f"Secret de signature des tokens créé : {path}")
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(tmp_path)
+    with open(path, "rb") as f:
+        return bytes.fromhex(f.read().decode("ascii").strip())
+
+
+class TokenSigner:
+    """Émission et vérification des tokens signés."""
+
+    def __init__(self, secret: bytes, ttl_seconds: int):
+        self._secret = secret
+        self.ttl_seconds = ttl_seconds
+
+    def _sign(self, payload: str) -> str:
+        return _b64encode(hmac.new(self._secret, payload.encode("ascii"), hashlib.sha256).digest())
+
+    def issue(self, subject: str) -> str:
+        now = int(time.time())
+        claims = {"sub": subject, "iat": now, "exp": now + self.ttl_seconds, "jti": secrets.token_urlsafe(12)}
+        payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+        return f"{payload}.{self._sign(payload)}"
+
+    def verify(self, token: str) -> dict | None:
+        """Claims du token si la signature est valide et le token non expiré, sinon None."""
+        if not token.isascii():
+            # Jamais émis par issue() ; hmac.compare_digest et encode("ascii") lèveraient
+            return None
+        payload, sep, signature = token.partition(".")
+        if not sep or not hmac.compare_digest(signature, self._sign(payload)):
+            return None
+        try:
+            claims = json.loads(_b64decode(payload))
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            return None
+        if not isinstance(claims, dict) or claims.get("exp", 0) <= time.time():
+            return None
+        return claims
+
+
+class RevocationList:
+    """Table SQLite des tokens révoqués (jti → exp), purgée au fil des révocations."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        # WAL : les autres workers lisent pendant qu'un /logout écrit
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS revoked (jti TEXT PRIMARY KEY, exp INTEGER NOT NULL)"
+        )
+        self._conn.commit()
+
+    def revoke(self, jti: str, exp: int) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM revoked WHERE exp <= ?", (int(time.time()),))
+            self._conn.execute("INSERT OR REPLACE INTO revoked (jti, exp) VALUES (?, ?)", (jti, exp))
+            self._conn.commit()
+
+    def is_revoked(self, jti: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM revoked WHERE jti = ?", (jti,)).fetchone()
+        return row is not None
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,63 @@
+"""
+Déduplication des calculs identiques en cours (« single-flight »).
+
+Le premier appel pour une clé lance le calcul dans une tâche partagée ; les
+appels suivants avec la même clé, tant qu'elle n'est pas terminée, attendent
+cette même tâche et reçoivent son résultat (ou son exception). Rien n'est
+conservé après la fin du calcul : ce n'est pas un cache.
+
+Annulation : chaque appelant attend la tâche derrière `asyncio.shield`. Si le
+client du premier appelant se déconnecte, le calcul continue pour les autres ;
+il n'est annulé que lorsque plus personne ne l'attend.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Calculs asynchrones en cours, partagés par clé."""
+
+    def __init__(self):
+        self._flights: dict[Hashable, _Flight] = {}
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._flights
+
+    def _forget(self, key: Hashable, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[T]]) -> T:
+        """Résultat de `factory()`, calculé une seule fois pour les appels simultanés de même clé."""
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(factory()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Plus aucun appelant : calcul abandonné, et une requête
+                # identique ultérieure ne doit pas rejoindre une tâche annulée
+                self._forget(key, flight)
+                flight.task.cancel()
@@ -0,0 +1,248 @@
+"""
+Mesures de latence par étape et métriques au format texte Prometheus.
+
+Sans dépendance : compteurs et histogrammes en mémoire (verrou + dichotomie
+sur les bornes, quelques µs par mesure), rendus par /metrics. Chaque `span`
+alimente l'histogramme `rag_stage_duration_seconds{stage}` et, s'il s'exécute
+pendant une requête HTTP, l'en-tête `Server-Timing` de la réponse
+(ServerTimingMiddleware). Les métriques sont propres à chaque processus :
+avec plusieurs workers, chacun expose les siennes.
+"""
+
+from __future__ import annotations
+
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Étapes mesurées pendant la requête HTTP courante : [(étape, durée en ms)]
+_request_timings: contextvars.ContextVar[list[tuple[str, float]] | None] = contextvars.ContextVar(
+    "request_timings", default=None
+)
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, label_names: tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values: dict[tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def items(self) -> list[tuple[tuple[str, ...], float]]:
+        with self._lock:
+            return list(self._values.items())
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        label_names: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = tuple(sorted(buckets))
+        # labels → [compte par intervalle (+Inf en dernier), somme]
+        self._series: dict[tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(labels, list(counts), total) for labels, (counts, total) in sorted(self._series.items())]
+        for labels, counts, total in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {total!r}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+class CallbackGauge:
+    """Jauge calculée au moment du rendu : `callback()` → {labels: valeur}."""
+
+    def __init__(self, name: str, help_text: str, label_names: tuple[str, ...], callback):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._callback = callback
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        for labels, value in sorted(self._callback().items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: list = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "rag_stage_duration_seconds", "Durée des étapes du pipeline (retrieval, LLM, web, export...)", ("stage",)
+))
+HTTP_SECONDS = REGISTRY.register(Histogram(
+    "rag_http_request_duration_seconds", "Durée des requêtes HTTP jusqu'aux en-têtes de réponse",
+    ("method", "endpoint", "status"),
+))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "rag_llm_tokens_total", "Tokens envoyés au LLM (prompt) et générés (completion)", ("mode", "kind")
+))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    "rag_cache_requests_total",
+    "Consultations des caches (answer : exact/semantic/miss, embedding : hit/miss, inflight : joined/miss)",
+    ("cache", "result"),
+))
+
+
+def _cache_hit_ratios() -> dict[tuple[str, ...], float]:
+    totals: dict[str, list[float]] = {}
+    for (cache, result), value in CACHE_REQUESTS.items():
+        hits_total = totals.setdefault(cache, [0.0, 0.0])
+        hits_total[1] += value
+        if result != "miss":
+            hits_total[0] += value
+    return {(cache,): hits / total for cache, (hits, total) in totals.items() if total}
+
+
+REGISTRY.register(CallbackGauge(
+    "rag_cache_hit_ratio", "Part des consultations servies par le cache depuis le démarrage", ("cache",),
+    _cache_hit_ratios,
+))
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    STAGE_SECONDS.observe(seconds, stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds * 1000))
+
+
+def request_timings() -> list[tuple[str, float]]:
+    """Étapes déjà mesurées pendant la requête HTTP courante (copie ; vide hors requête)."""
+    return list(_request_timings.get() or ())
+
+
+def add_request_timings(timings: list[tuple[str, float]]) -> None:
+    """
+    Ajoute à l'en-tête Server-Timing de la requête courante des étapes mesurées
+    par une autre requête (calcul partagé), sans les compter une seconde fois
+    dans les histogrammes.
+    """
+    current = _request_timings.get()
+    if current is not None:
+        current.extend(timings)
+
+
+@contextmanager
+def span(stage: str):
+    """Mesure le bloc (sync ou contenant des await) comme étape `stage`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+def server_timing_header(timings: list[tuple[str, float]], total_ms: float) -> str:
+    parts = [f"{stage};dur={ms:.1f}" for stage, ms in timings]
+    parts.append(f"total;dur={total_ms:.1f}")
+    return ", ".join(parts)
+
+
+class ServerTimingMiddleware:
+    """
+    Middleware ASGI : durée de chaque requête HTTP (histogramme par endpoint)
+    et en-tête `Server-Timing` avec les étapes mesurées avant l'envoi des
+    en-têtes (pour une réponse en streaming : celles qui précèdent le flux).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings: list[tuple[str, float]] = []
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                elapsed = time.perf_counter() - start
+                endpoint = getattr(scope.get("endpoint"), "__name__", "unmatched")
+                HTTP_SECONDS.observe(elapsed, scope["method"], endpoint, str(message["status"]))
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing_header(timings, elapsed * 1000).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(token)
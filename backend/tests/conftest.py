@@ -0,0 +1,86 @@
+"""
+Configuration commune des tests : environnement isolé (répertoire temporaire,
+aucun service réel) fixé AVANT l'import de main.py, qui lit ses réglages à
+l'import. Lancer depuis backend/ : python -m pytest tests
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.join(BACKEND_DIR, "benchmarks"))  # doublures (fakes.py)
+
+TEST_ROOT = tempfile.mkdtemp(prefix="rag_tests_")
+os.environ.update({
+    "DATA_DIR": os.path.join(TEST_ROOT, "data"),
+    "CHROMA_DB_DIR": os.path.join(TEST_ROOT, "chroma_db"),
+    "EMBEDDING_CACHE_PATH": os.path.join(TEST_ROOT, "embedding_cache.sqlite"),
+    "PDF_PAGE_CACHE_DIR": os.path.join(TEST_ROOT, "pdf_page_cache"),
+    "AUTH_USERNAME": "test",
+    "AUTH_PASSWORD": "test",
+    "AUTH_TOKEN_SECRET": "test-secret",
+    "AUTH_REVOCATION_DB": os.path.join(TEST_ROOT, "auth_revocations.sqlite"),
+    "ANSWER_CACHE_ENABLED": "false",
+    "RERANK_MODEL_DIR": "",
+    "OPENAI_API_KEY": "sk-test",
+    "LLAMA_CLOUD_API_KEY": "llx-test",
+    "TAVILY_API_KEY": "",
+})
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """Module main avec index et modèles réinitialisés (restaurés après le test)."""
+    import main
+
+    monkeypatch.setattr(main, "index", None)
+    monkeypatch.setattr(main, "chroma_collection", None)
+    monkeypatch.setattr(main, "lexical_index", None)
+    monkeypatch.setattr(main, "models_configured", False)
+    return main
+
+
+def _write_pdfs(data_dir: str, n_files: int, prefix: str = "rapport") -> list[str]:
+    """`n_files` PDFs d'une page blanche, de contenus distincts (titre) ; noms triés."""
+    from pypdf import PdfWriter
+
+    os.makedirs(data_dir, exist_ok=True)
+    names = []
+    for i in range(n_files):
+        writer = PdfWriter()
+        writer.add_blank_page(612, 792)
+        writer.add_metadata({"/Title": f"{prefix} {i}"})
+        name = f"{prefix}_{i:02d}.pdf"
+        with open(os.path.join(data_dir, name), "wb") as f:
+            writer.write(f)
+        names.append(name)
+    return names
+
+
+@pytest.fixture
+def write_pdfs():
+    return _write_pdfs
+
+
+@pytest.fixture
+def ingest_env(monkeypatch, tmp_path):
+    """Module ingest pointant sur des répertoires temporaires ; (ingest, vector_store, manifest)."""
+    import chromadb
+    import ingest
+    from llama_index.core import Settings
+    from llama_index.core.node_parser import SentenceSplitter
+    from llama_index.vector_stores.chroma import ChromaVectorStore
+    from ingest_manifest import IngestManifest
+
+    monkeypatch.setattr(ingest, "DATA_DIR", str(tmp_path / "data"))
+    monkeypatch.setattr(ingest, "PARSE_CACHE_DIR", str(tmp_path / "parse_cache"))
+    Settings.node_parser = SentenceSplitter(id_func=ingest.deterministic_chunk_id)
+
+    collection = chromadb.PersistentClient(path=str(tmp_path / "chroma")).get_or_create_collection("rag_collection")
+    manifest = IngestManifest(str(tmp_path / "manifest.sqlite"))
+    yield ingest, ChromaVectorStore(chroma_collection=collection), manifest
+    manifest.close()
@@ -0,0 +1,40 @@
+"""Cache de réponses : pas de réponse dégradée, pas de réponse construite sur un index périmé."""
+
+import os
+import time
+
+from answer_cache import AnswerCache, touch_ingest_stamp
+
+
+def test_put_dropped_when_ingest_happened_during_computation(tmp_path):
+    stamp_path = str(tmp_path / "ingest_stamp")
+    touch_ingest_stamp(stamp_path)
+    cache = AnswerCache(stamp_path=stamp_path)
+    key = AnswerCache.make_key("question", "internal", None)
+
+    stamp = cache.current_stamp()
+    os.utime(stamp_path, (time.time() + 5, time.time() + 5))  # ingestion publiée pendant le calcul
+    cache.put(key, None, "réponse sur l'ancien index", stamp=stamp)
+    assert cache.get_exact(key) is None
+
+    stamp = cache.current_stamp()
+    cache.put(key, None, "réponse à jour", stamp=stamp)
+    assert cache.get_exact(key) == "réponse à jour"
+
+
+def test_degraded_answers_are_not_cached(api, monkeypatch):
+    monkeypatch.setattr(api, "answer_cache", AnswerCache())
+    external = api.SourceNode(text="...", score=0.9, source_type="external", url="https://example.org")
+    internal = api.SourceNode(text="...", score=0.8)
+
+    def store(mode: str, answer: str, sources: list) -> bool:
+        request = api.QueryRequest(query=f"{mode} {answer}", mode=mode)
+        key = api.chat_request_key(request)
+        api.store_answer(request, key, None, api.answer_cache.current_stamp(),
+                         api.QueryResponse(answer=answer, sources=sources))
+        return api.answer_cache.get_exact(key) is not None
+
+    assert store("internal", "ok", [internal])
+    assert store("hybrid", "ok", [internal, external])
+    assert not store("hybrid", "web en panne", [internal])
+    assert not store("science", api.NO_SCIENCE_SOURCES_ANSWER, [])
@@ -0,0 +1,252 @@
+"""
+/chat ne bloque pas la boucle d'événements : chargement unique de l'index
+et rechargement unique des index d'ingestion sous accès concurrents, N
+requêtes parallèles servies en ~1 latence, Server-Timing des requêtes
+identiques regroupées, flux SSE ouvert avant le cache et l'index, et
+métriques /metrics après un appel /chat.
+"""
+
+import asyncio
+import re
+import threading
+import time
+import uuid
+
+import httpx
+
+from fakes import FakeEmbedding, FakeLLM
+
+
+def test_concurrent_aget_index_builds_once(api, monkeypatch, tmp_path):
+    import retrieval
+
+    builds = []
+    build_threads = set()
+
+    def fake_open_vector_index(chroma_dir, executor, embedding_model=None):
+        builds.append(chroma_dir)
+        build_threads.add(threading.get_ident())
+        time.sleep(0.2)  # chargement lent : les autres appels attendent le verrou
+        return object(), None
+
+    monkeypatch.setattr(api, "CHROMA_DB_DIR", str(tmp_path))
+    monkeypatch.setattr(api, "load_ingest_indexes", lambda: None)
+    monkeypatch.setattr(retrieval, "open_vector_index", fake_open_vector_index)
+    api.configure_models(embed_model=FakeEmbedding(latency_s=0), llm=FakeLLM(latency_s=0))
+
+    async def load_concurrently():
+        loop_thread = threading.get_ident()
+        results = await asyncio.gather(*(api.aget_index() for _ in range(16)))
+        return loop_thread, results
+
+    loop_thread, results = asyncio.run(load_concurrently())
+
+    assert len(builds) == 1
+    assert all(result is results[0] for result in results)
+    assert loop_thread not in build_threads  # chargé hors de la boucle d'événements
+
+
+def test_ingest_indexes_reload_once_off_loop(api, monkeypatch, tmp_path):
+    from document_index import DocumentFilterIndex
+
+    stamp_file = tmp_path / "ingest_stamp"
+    stamp_file.write_text("")
+    reloads = []
+
+    def slow_file_names(collection):
+        reloads.append(threading.get_ident())
+        time.sleep(0.3)  # manifeste volumineux
+        return DocumentFilterIndex(["rapport_Zone_A_2024.pdf"])
+
+    monkeypatch.setattr(api, "index", object())
+    monkeypatch.setattr(api, "chroma_collection", object())
+    monkeypatch.setattr(api, "document_index", DocumentFilterIndex([]))
+    monkeypatch.setattr(api, "ingest_indexes_stamp", None)
+    monkeypatch.setattr(api, "INGEST_STAMP_FILE", str(stamp_file))
+    monkeypatch.setattr(api, "read_ingested_file_names", slow_file_names)
+    monkeypatch.setattr(api, "open_lexical_index", lambda: None)
+
+    async def refresh_concurrently():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticking = asyncio.create_task(ticker())
+        await asyncio.gather(*(api.aget_index() for _ in range(16)))
+        ticking.cancel()
+        return threading.get_ident(), ticks
+
+    loop_thread, ticks = asyncio.run(refresh_concurrently())
+
+    assert len(reloads) == 1 and loop_thread not in reloads
+    assert ticks >= 10  # la boucle a continué de tourner pendant le rechargement
+    assert api.resolve_document_filter(["Zone_A"]) == ["rapport_Zone_A_2024.pdf"]
+    assert not api.ingest_indexes_stale()
+
+
+class SlowCollection:
+    """Collection Chroma dont `query` bloque (synchrone), comme une recherche sur un gros index."""
+
+    def __init__(self, collection, latency_s: float):
+        self._collection = collection
+        self.latency_s = latency_s
+
+    def query(self, *args, **kwargs):
+        time.sleep(self.latency_s)
+        return self._collection.query(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+
+def test_parallel_chat_requests_overlap(api):
+    import chromadb
+    from llama_index.core import Document, StorageContext, VectorStoreIndex
+    from retrieval import ThreadedChromaVectorStore
+
+    fake_embedding = FakeEmbedding(latency_s=0)
+    fake_llm = FakeLLM(latency_s=0.2, answer_words=20)
+    api.configure_models(embed_model=fake_embedding, llm=fake_llm)
+
+    # Même chemin que l'API : ThreadedChromaVectorStore (recherche Chroma dans retrieval_executor)
+    collection = chromadb.EphemeralClient().create_collection(f"test_{uuid.uuid4().hex}")
+    vector_store = ThreadedChromaVectorStore(api.retrieval_executor, chroma_collection=collection)
+    api.index = VectorStoreIndex.from_documents(
+        [Document(text=f"Rapport {i} : forage piézomètre nappe", metadata={"file_name": f"r{i}.pdf"}) for i in range(5)],
+        storage_context=StorageContext.from_defaults(vector_store=vector_store),
+        embed_model=api.get_embed_model(),
+    )
+    # Requête Chroma bloquante : sur la boucle d'événements, les requêtes seraient sérialisées
+    vector_store._collection = SlowCollection(collection, latency_s=0.4)
+    fake_embedding.latency_s = 0.05  # latence réseau simulée des requêtes
+
+    headers = {"Authorization": f"Bearer {api.get_token_signer().issue('test')}"}
+    n_requests = 8
+
+    async def run(n: int) -> float:
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            start = time.perf_counter()
+            responses = await asyncio.gather(*(
+                client.post("/chat", json={"query": f"question {n}-{i}", "mode": "internal"}, headers=headers)
+                for i in range(n)
+            ))
+            elapsed = time.perf_counter() - start
+        assert [r.status_code for r in responses] == [200] * n
+        return elapsed
+
+    single = asyncio.run(run(1))
+    parallel = asyncio.run(run(n_requests))
+
+    # Séquentiel : ~8 × 0,65 s ; concurrent : proche d'une seule requête
+    assert parallel < single * 2, f"{n_requests} requêtes en {parallel:.2f}s contre {single:.2f}s pour une"
+
+
+def test_coalesced_requests_report_shared_stages(api):
+    from llama_index.core import Document, VectorStoreIndex
+
+    api.configure_models(embed_model=FakeEmbedding(latency_s=0), llm=FakeLLM(latency_s=0.3, answer_words=20))
+    api.index = VectorStoreIndex.from_documents(
+        [Document(text="Rapport : forage piézomètre nappe", metadata={"file_name": "r.pdf"})],
+        embed_model=api.get_embed_model(),
+    )
+    headers = {"Authorization": f"Bearer {api.get_token_signer().issue('test')}"}
+
+    async def run():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*(
+                client.post("/chat", json={"query": "niveau de la nappe", "mode": "internal"}, headers=headers)
+                for _ in range(3)
+            ))
+
+    stages = [
+        [part.split(";")[0].strip() for part in r.headers["server-timing"].split(",")]
+        for r in asyncio.run(run())
+    ]
+    leader, followers = stages[0], stages[1:]
+    assert {"embed", "search"} <= set(leader) and "coalesced" not in leader
+    for follower in followers:
+        assert "coalesced" in follower and {"embed", "search"} <= set(follower)
+
+
+def test_stream_opens_before_cache_lookup_and_index(api, monkeypatch):
+    calls = []
+
+    async def slow_lookup(request):
+        calls.append("lookup")
+        await asyncio.sleep(0.3)  # embedding de la requête (miss du cache exact)
+        return None, None, None
+
+    async def slow_index():
+        calls.append("index")
+        await asyncio.sleep(0.3)
+        return None
+
+    monkeypatch.setattr(api, "lookup_answer_cache", slow_lookup)
+    monkeypatch.setattr(api, "aget_index", slow_index)
+
+    async def first_chunks():
+        start = time.perf_counter()
+        response = await api.chat_stream_endpoint(api.QueryRequest(query="nappe", mode="internal"), token="t")
+        chunks = response.body_iterator
+        first = await chunks.__anext__()
+        first_ms = (time.perf_counter() - start) * 1000
+        assert calls == []  # rien d'attendu avant le premier octet
+        rest = [chunk async for chunk in chunks]
+        return first, first_ms, rest
+
+    first, first_ms, rest = asyncio.run(first_chunks())
+    assert first.startswith(":") and first_ms < 100
+    assert calls == ["lookup", "index"]
+    assert len(rest) == 1 and rest[0].startswith("event: error")
+
+
+def scrape_metrics(client) -> dict[str, float]:
+    """Échantillons de /metrics ({nom{labels}: valeur}) ; vérifie le format d'exposition texte."""
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    samples = {}
+    for line in response.text.splitlines():
+        if line.startswith("#"):
+            assert re.fullmatch(r"# (HELP \w+ .+|TYPE \w+ (counter|histogram|gauge))", line), line
+            continue
+        match = re.fullmatch(r'(\w+(?:\{(?:\w+="[^"]*",?)*\})?) (\S+)', line)
+        assert match, line
+        samples[match.group(1)] = float(match.group(2))
+    return samples
+
+
+def test_metrics_after_chat(api):
+    from fastapi.testclient import TestClient
+    from llama_index.core import Document, VectorStoreIndex
+
+    api.configure_models(embed_model=FakeEmbedding(latency_s=0), llm=FakeLLM(latency_s=0, answer_words=20))
+    api.index = VectorStoreIndex.from_documents(
+        [Document(text="Rapport : forage piézomètre nappe", metadata={"file_name": "r.pdf"})],
+        embed_model=api.get_embed_model(),
+    )
+    client = TestClient(api.app)  # sans lifespan : index fourni par le test
+    before = scrape_metrics(client)
+    response = client.post(
+        "/chat",
+        json={"query": "niveau de la nappe", "mode": "internal"},
+        headers={"Authorization": f"Bearer {api.get_token_signer().issue('test')}"},
+    )
+    assert response.status_code == 200
+    after = scrape_metrics(client)
+
+    def delta(sample: str) -> float:
+        return after.get(sample, 0.0) - before.get(sample, 0.0)
+
+    for stage in ("embed", "search", "context", "llm"):
+        assert delta(f'rag_stage_duration_seconds_count{{stage="{stage}"}}') == 1, stage
+    assert delta('rag_http_request_duration_seconds_count{method="POST",endpoint="chat_endpoint",status="200"}') == 1
+    assert delta('rag_cache_requests_total{cache="inflight",result="miss"}') == 1
+    assert delta('rag_llm_tokens_total{mode="internal",kind="prompt"}') == response.json()["prompt_tokens"] > 0
+    assert delta('rag_llm_tokens_total{mode="internal",kind="completion"}') > 0
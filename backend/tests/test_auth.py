@@ -0,0 +1,88 @@
+"""
+Tokens multi-workers : deux processus API (uvicorn) partageant seulement le
+secret et le chemin de la liste de révocation SQLite. Un token émis par l'un
+est accepté par l'autre, et un /logout sur l'un le révoque pour les deux.
+Tokens mal formés (non ASCII) : 401, jamais 500.
+"""
+
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+import pytest
+
+from conftest import BACKEND_DIR
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_worker(env: dict) -> tuple[subprocess.Popen, str]:
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{url}/healthz").status_code == 200:
+                return process, url
+        except httpx.TransportError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("worker API non démarré")
+
+
+@pytest.fixture(params=["env", "file"])
+def workers(request, tmp_path):
+    """Deux processus : secret fourni par AUTH_TOKEN_SECRET, ou fichier partagé créé par le premier."""
+    env = {**os.environ, "AUTH_REVOCATION_DB": str(tmp_path / "revocations.sqlite")}
+    if request.param == "file":
+        env.update({"AUTH_TOKEN_SECRET": "", "AUTH_TOKEN_SECRET_PATH": str(tmp_path / ".auth_secret")})
+    started = []
+    try:
+        for _ in range(2):
+            started.append(start_worker(env))
+        yield [url for _, url in started]
+    finally:
+        for process, _ in started:
+            process.terminate()
+            process.wait(timeout=30)
+
+
+def test_token_and_revocation_shared_between_workers(workers):
+    url_a, url_b = workers
+    login = httpx.post(f"{url_a}/login", json={"username": "test", "password": "test"})
+    assert login.status_code == 200
+    headers = {"Authorization": f"Bearer {login.json()['token']}"}
+
+    # Route protégée : 404 une fois authentifié, 401 sinon
+    assert httpx.get(f"{url_b}/export/jobs/inconnu", headers=headers).status_code == 404
+    assert httpx.post(f"{url_b}/logout", headers=headers).status_code == 200
+    assert httpx.get(f"{url_a}/export/jobs/inconnu", headers=headers).status_code == 401
+    assert httpx.get(f"{url_b}/export/jobs/inconnu", headers=headers).status_code == 401
+
+
+def test_non_ascii_token_is_rejected(api):
+    from fastapi.testclient import TestClient
+
+    signer = api.get_token_signer()
+    assert signer.verify("abc.d\xe9f") is None
+    assert signer.verify(signer.issue("test") + "\xe9") is None
+
+    # En-tête HTTP brut en latin-1, comme envoyé par un client
+    response = TestClient(api.app).get(
+        "/export/jobs/inconnu", headers=[(b"authorization", "Bearer abc.d\xe9f".encode("latin-1"))]
+    )
+    assert response.status_code == 401
@@ -0,0 +1,76 @@
+"""
+Contexte des prompts sous budget de tokens : budget respecté, recouvrement
+entre chunks d'une même page retiré, doublons écartés, et sources web
+empaquetées avec leur contenu complet.
+"""
+
+import pytest
+
+import context_packer
+from context_packer import ContextItem, count_tokens, pack_context
+
+MODEL = "gpt-4o"
+
+
+@pytest.fixture(autouse=True)
+def estimated_tokens(monkeypatch):
+    """Estimation à 4 caractères par token : pas de téléchargement d'encodage tiktoken."""
+    monkeypatch.setattr(context_packer, "_get_encoding", lambda model: None)
+
+
+def words(prefix: str, n: int) -> str:
+    return " ".join(f"{prefix}{i:03d}" for i in range(n))
+
+
+def test_budget_is_enforced():
+    items = [ContextItem(text=words(f"d{k}_", 40)) for k in range(10)]  # ~70 tokens chacun
+    packed = pack_context([("Sources:", items)], 300, MODEL)
+
+    assert packed.tokens <= 300
+    assert count_tokens(packed.text, MODEL) <= 300
+    assert packed.kept == [0, 1, 2, 3]  # ordre de pertinence conservé
+    assert packed.dropped == 6
+
+
+def test_oversized_first_item_is_truncated():
+    packed = pack_context([("", [ContextItem(text=words("x", 500))])], 100, MODEL)
+    assert packed.kept == [0]
+    assert count_tokens(packed.text, MODEL) <= 100
+
+
+def test_overlap_between_chunks_of_a_page_is_stripped():
+    shared = words("commun", 15)
+    first = ContextItem(text=words("a", 15) + " " + shared, page_key=("rapport.pdf", "3"))
+    second = ContextItem(text=shared + " " + words("b", 15), page_key=("rapport.pdf", "3"))
+    packed = pack_context([("", [first, second])], 10_000, MODEL)
+
+    assert packed.text.count(shared) == 1
+    assert words("b", 15) in packed.text
+
+
+def test_duplicates_on_the_same_page_are_dropped():
+    text = words("piezo", 20)
+    items = [
+        ContextItem(text=text, page_key=("rapport.pdf", "3")),
+        ContextItem(text=text[:60], page_key=("rapport.pdf", "3")),  # contenu dans le premier
+        ContextItem(text=text, page_key=("rapport.pdf", "4")),       # autre page : conservé
+    ]
+    packed = pack_context([("", items)], 10_000, MODEL)
+    assert packed.kept == [0, 2] and packed.deduplicated == 1
+
+
+def test_items_without_page_metadata_are_not_deduplicated():
+    text = words("forage", 20)
+    items = [ContextItem(text=text, page_key=(None, None)), ContextItem(text=text, page_key=(None, None))]
+    packed = pack_context([("", items)], 10_000, MODEL)
+    assert packed.kept == [0, 1] and packed.deduplicated == 0
+
+
+def test_web_sources_are_packed_with_full_content(api):
+    content = words("article", 300)
+    source = api.SourceNode(text=content[:500] + "...", score=0.9, source_type="external", title="Étude")
+    source._full_text = content
+
+    packed = pack_context([("Sources externes:", [api._web_context_item(source)])], 10_000, MODEL)
+    assert content in packed.text and "..." not in packed.text
+    assert "_full_text" not in source.model_dump()
@@ -0,0 +1,135 @@
+"""
+Export des couches (/export/gdb et jobs /export/jobs) : erreurs de géométrie
+traduites en 422, reprise après la mort d'un processus du pool de
+conversion, et noms de feature classes uniques et entiers 64 bits conservés
+en GDB.
+"""
+
+import asyncio
+import io
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import pytest
+
+POINT_LAYER = {
+    "id": "Tests/points.geojson",
+    "name": "points.geojson",
+    "geojson": {
+        "type": "FeatureCollection",
+        "features": [{"type": "Feature", "geometry": {"type": "Point", "coordinates": [-72.0, 46.0]}, "properties": {}}],
+    },
+}
+
+
+def post_export(api, layers: list[dict], export_format: str = "gpkg") -> httpx.Response:
+    headers = {"Authorization": f"Bearer {api.get_token_signer().issue('test')}"}
+
+    async def run():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post(f"/export/gdb?format={export_format}", json={"layers": layers}, headers=headers)
+
+    return asyncio.run(run())
+
+
+@pytest.fixture
+def in_process_executor(api, monkeypatch):
+    """Conversion des couches dans des threads du processus de test (pas de pool spawn)."""
+    executor = ThreadPoolExecutor(max_workers=2)
+    monkeypatch.setattr(api, "get_export_executor", lambda: executor)
+    yield executor
+    executor.shutdown(wait=True)
+
+
+def run_export_job(api, layers: list[dict]) -> tuple[list[dict], httpx.Response]:
+    """POST /export/jobs, suivi du statut jusqu'à la fin, puis téléchargement ; (statuts, réponse)."""
+    headers = {"Authorization": f"Bearer {api.get_token_signer().issue('test')}"}
+
+    async def run():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", headers=headers) as client:
+            created = await client.post("/export/jobs?format=gpkg", json={"layers": layers})
+            assert created.status_code == 202, created.text
+            statuses = [created.json()]
+            job_id = statuses[0]["job_id"]
+            for _ in range(200):
+                statuses.append((await client.get(f"/export/jobs/{job_id}")).json())
+                if statuses[-1]["status"] in ("done", "error"):
+                    break
+                await asyncio.sleep(0.05)
+            return statuses, await client.get(f"/export/jobs/{job_id}/download")
+
+    return asyncio.run(run())
+
+
+def test_export_job_flow(api, in_process_executor, tmp_path):
+    from pyogrio import list_layers
+
+    statuses, download = run_export_job(api, [POINT_LAYER])
+    assert statuses[0]["status"] == "queued"
+    assert statuses[-1] == {**statuses[0], "status": "done", "layers_written": 1}
+
+    assert download.status_code == 200
+    (tmp_path / "export.gpkg").write_bytes(download.content)
+    assert [name for name, _ in list_layers(tmp_path / "export.gpkg")] == ["points"]
+
+
+def test_export_job_failure_is_reported(api, in_process_executor):
+    layer = {**POINT_LAYER, "geojson": {"type": "FeatureCollection", "features": [
+        {"type": "Feature", "geometry": {"type": "Pointy", "coordinates": [0, 0]}, "properties": {}},
+    ]}}
+    statuses, download = run_export_job(api, [layer])
+    assert statuses[-1]["status"] == "error"
+    assert "pointy" in statuses[-1]["error"].lower()
+    assert download.status_code == 422
+
+
+def test_malformed_geometry_is_rejected_with_422(api):
+    layer = {**POINT_LAYER, "geojson": {"type": "FeatureCollection", "features": [
+        {"type": "Feature", "geometry": {"type": "Pointy", "coordinates": [0, 0]}, "properties": {}},
+    ]}}
+    response = post_export(api, [layer])
+    assert response.status_code == 422, response.text
+    assert "pointy" in response.json()["detail"].lower()
+
+
+def test_export_recovers_from_broken_pool(api):
+    broken = api.get_export_executor()
+    try:
+        broken.submit(os._exit, 1).exception()  # worker tué : le pool est inutilisable
+    except Exception:
+        pass
+
+    response = post_export(api, [POINT_LAYER])
+    assert response.status_code == 200, response.text
+    assert api.export_executor is not broken
+    api.export_executor.shutdown(wait=True)
+    api.export_executor = None
+
+
+def test_gdb_split_layers_have_unique_names_and_keep_int64(api, tmp_path):
+    from pyogrio import list_layers, read_dataframe
+
+    def feature(geometry: dict) -> dict:
+        return {"type": "Feature", "geometry": geometry, "properties": {"ident": 2**53 + 1}}
+
+    point = {"type": "Point", "coordinates": [-72.0, 46.0]}
+    polygon = {"type": "Polygon", "coordinates": [[[-72, 46], [-71, 46], [-71, 47], [-72, 46]]]}
+    mixed = {"id": "Tests/sites.geojson", "name": "sites.geojson",
+             "geojson": {"type": "FeatureCollection", "features": [feature(point), feature(polygon)]}}
+    # Même nom que la feature class des points de la couche mixte
+    points = {"id": "Tests/sites_point.geojson", "name": "sites_point.geojson",
+              "geojson": {"type": "FeatureCollection", "features": [feature(point)]}}
+
+    response = post_export(api, [points, mixed], export_format="gdb")
+    assert response.status_code == 200, response.text
+    zipfile.ZipFile(io.BytesIO(response.content)).extractall(tmp_path)
+    gdb_path = tmp_path / "export_couches.gdb"
+
+    layers = sorted(name for name, _ in list_layers(gdb_path))
+    assert layers == ["sites_point", "sites_point_1", "sites_polygon"]
+    for name in layers:
+        assert read_dataframe(gdb_path, layer=name)["ident"].tolist() == [2**53 + 1]
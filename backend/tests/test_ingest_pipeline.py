@@ -0,0 +1,56 @@
+"""
+Pipeline d'ingestion parse → embed → upsert avec doublures à latence fixe
+(FakeLlamaParse, FakeEmbedding) et une collection Chroma temporaire.
+"""
+
+import asyncio
+import os
+import time
+
+from fakes import FakeEmbedding, FakeLlamaParse
+
+
+def test_wall_time_follows_slowest_stage(ingest_env, write_pdfs, monkeypatch):
+    ingest, vector_store, manifest = ingest_env
+    monkeypatch.setattr(ingest, "PARSE_CONCURRENCY", 4)
+    monkeypatch.setattr(ingest, "EMBED_CONCURRENCY", 2)
+    n_files, parse_s, embed_s = 8, 0.4, 0.1
+    names = write_pdfs(ingest.DATA_DIR, n_files)
+
+    parser = FakeLlamaParse()
+    parser.latency_s = parse_s
+    jobs, _ = ingest.plan_ingestion(names, manifest)
+
+    start = time.perf_counter()
+    completed = asyncio.run(ingest.ingest_files(jobs, parser, FakeEmbedding(latency_s=embed_s), vector_store, manifest))
+    elapsed = time.perf_counter() - start
+
+    assert len(completed) == n_files
+    assert len(manifest) == n_files
+    sequential = n_files * (parse_s + embed_s)          # un fichier après l'autre : 4,0 s
+    slowest_stage = n_files * parse_s / 4                # parsing, 4 en parallèle : 0,8 s
+    # Les étages se recouvrent : le parsing domine, plus la traversée du dernier fichier
+    assert elapsed < slowest_stage + parse_s + embed_s + 0.5, f"{elapsed:.2f}s"
+    assert elapsed < sequential / 2
+
+
+def test_file_without_text_is_recorded_in_manifest(ingest_env, write_pdfs):
+    ingest, vector_store, manifest = ingest_env
+    names = write_pdfs(ingest.DATA_DIR, 2)
+
+    class ScannedPdfParser(FakeLlamaParse):
+        latency_s = 0.0
+
+        async def aload_data(self, file_path):
+            if file_path.endswith(names[0]):
+                return []  # PDF scanné : aucune couche texte
+            return await super().aload_data(file_path)
+
+    jobs, _ = ingest.plan_ingestion(names, manifest)
+    completed = asyncio.run(ingest.ingest_files(jobs, ScannedPdfParser(), FakeEmbedding(latency_s=0), vector_store, manifest))
+
+    assert {job.pdf_file for job in completed} == set(names)
+    assert manifest.get(names[0]).chunk_ids == []
+    assert manifest.get(names[1]).chunk_ids
+    # Exécution suivante : rien à reparser
+    assert ingest.plan_ingestion(names, manifest) == ([], 2)
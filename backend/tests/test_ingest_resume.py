@@ -0,0 +1,157 @@
+"""
+Reprise de l'ingestion : un run tué (SIGKILL) en cours de route puis relancé
+aboutit à la même collection qu'un run propre, sans reparser les fichiers
+déjà parsés. Chaque run s'exécute dans un sous-processus (ce module lancé
+comme script), avec les doublures de benchmarks/fakes.py.
+"""
+
+import asyncio
+import os
+import re
+import shutil
+import signal
+import sqlite3
+import subprocess
+import sys
+import time
+
+from fakes import FakeEmbedding, FakeLlamaParse
+
+N_FILES = 8
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def ingestion_env(root: str) -> dict:
+    return {
+        **os.environ,
+        "DATA_DIR": os.path.join(root, "data"),
+        "CHROMA_DB_DIR": os.path.join(root, "chroma_db"),
+        "EMBEDDING_CACHE_PATH": os.path.join(root, "embedding_cache.sqlite"),
+        "INGEST_PARSE_CONCURRENCY": "2",
+        "INGEST_EMBED_CONCURRENCY": "1",
+        "PYTHONPATH": os.pathsep.join([BACKEND_DIR, os.path.join(BACKEND_DIR, "benchmarks")]),
+    }
+
+
+def start_ingestion(root: str) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), os.path.join(root, "parsed.log")],
+        env=ingestion_env(root),
+        cwd=BACKEND_DIR,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+
+
+def finish(process: subprocess.Popen) -> int:
+    """Attend la fin du run ; retourne le nombre d'appels à l'API d'embedding."""
+    stdout, stderr = process.communicate(timeout=120)
+    assert process.returncode == 0, stderr
+    return int(re.search(r"Embedding API calls: (\d+)", stdout).group(1))
+
+
+def manifest_rows(root: str) -> int:
+    path = os.path.join(root, "chroma_db", "ingest_manifest.sqlite")
+    try:
+        with sqlite3.connect(path) as conn:
+            return conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+    except sqlite3.Error:
+        return 0
+
+
+def parsed_files(root: str) -> list[str]:
+    with open(os.path.join(root, "parsed.log"), encoding="utf-8") as f:
+        return f.read().split()
+
+
+def collection_snapshot(root: str) -> dict:
+    import chromadb
+
+    collection = chromadb.PersistentClient(path=os.path.join(root, "chroma_db")).get_collection("rag_collection")
+    data = collection.get(include=["documents", "metadatas", "embeddings"])
+    return {
+        chunk_id: (document, metadata, [round(float(v), 5) for v in embedding])
+        for chunk_id, document, metadata, embedding in zip(
+            data["ids"], data["documents"], data["metadatas"], data["embeddings"]
+        )
+    }
+
+
+def test_killed_run_resumes_to_clean_result(tmp_path, write_pdfs):
+    clean, resumed = str(tmp_path / "clean"), str(tmp_path / "resumed")
+    names = write_pdfs(os.path.join(clean, "data"), N_FILES)
+    shutil.copytree(os.path.join(clean, "data"), os.path.join(resumed, "data"))
+
+    assert finish(start_ingestion(clean)) > 0
+    expected = collection_snapshot(clean)
+    assert {meta["file_name"] for _, meta, _ in expected.values()} == set(names)
+
+    # Run interrompu brutalement une fois quelques fichiers indexés
+    process = start_ingestion(resumed)
+    deadline = time.monotonic() + 60
+    while manifest_rows(resumed) < 3 and process.poll() is None and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert process.poll() is None, "ingestion terminée avant l'interruption"
+    process.send_signal(signal.SIGKILL)
+    process.communicate()
+
+    parsed_before_kill = set(os.listdir(os.path.join(resumed, "chroma_db", "parse_cache")))
+    indexed_before_kill = manifest_rows(resumed)
+    assert 3 <= indexed_before_kill < N_FILES
+    os.remove(os.path.join(resumed, "parsed.log"))
+
+    embedding_calls = finish(start_ingestion(resumed))
+
+    # Seuls les fichiers sans markdown en cache ont été reparsés, et seuls
+    # les fichiers non indexés au moment de l'arrêt ont pu être embeddés
+    assert len(parsed_files(resumed)) == N_FILES - len([f for f in parsed_before_kill if f.endswith(".json")])
+    assert embedding_calls <= N_FILES - indexed_before_kill
+    assert manifest_rows(resumed) == N_FILES
+    assert collection_snapshot(resumed) == expected
+
+
+def test_identical_pdfs_keep_their_own_chunks(ingest_env, write_pdfs):
+    ingest, vector_store, manifest = ingest_env
+    [original] = write_pdfs(ingest.DATA_DIR, 1)
+    names = [original]
+    for copy_name in ("copie_a.pdf", "copie_b.pdf"):  # même contenu, autres noms
+        shutil.copy(os.path.join(ingest.DATA_DIR, original), os.path.join(ingest.DATA_DIR, copy_name))
+        names.append(copy_name)
+
+    parser = FakeLlamaParse()
+    parser.latency_s = 0.0
+    jobs, _ = ingest.plan_ingestion(sorted(names), manifest)
+    asyncio.run(ingest.ingest_files(jobs, parser, FakeEmbedding(latency_s=0), vector_store, manifest))
+
+    entries = manifest.entries()
+    chunk_ids = [set(entries[name].chunk_ids) for name in names]
+    assert all(chunk_ids) and not (chunk_ids[0] & chunk_ids[1] or chunk_ids[0] & chunk_ids[2] or chunk_ids[1] & chunk_ids[2])
+    stored = vector_store._collection.get(include=["metadatas"])
+    assert sorted(meta["file_name"] for meta in stored["metadatas"]) == sorted(
+        name for name in names for _ in entries[name].chunk_ids
+    )
+
+
+def run_ingestion(parsed_log: str) -> None:
+    """Sous-processus : ingest.ingest_documents() avec doublures, fichiers parsés journalisés."""
+    import ingest
+    from fakes import FakeLLM
+
+    class LoggingParse(FakeLlamaParse):
+        latency_s = 0.3
+
+        async def aload_data(self, file_path):
+            documents = await super().aload_data(file_path)
+            with open(parsed_log, "a", encoding="utf-8") as f:
+                f.write(os.path.basename(file_path) + "\n")
+            return documents
+
+    ingest.LlamaParse = LoggingParse
+    ingest.OpenAIEmbedding = lambda model: FakeEmbedding(latency_s=0.05)
+    ingest.OpenAI = lambda **kwargs: FakeLLM()
+    ingest.ingest_documents()
+
+
+if __name__ == "__main__":
+    run_ingestion(sys.argv[1])
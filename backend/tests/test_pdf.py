@@ -0,0 +1,78 @@
+"""
+Service des PDF : page seule servie en mémoire (insensible à l'éviction du
+cache disque), revalidée (304) sans ouvrir le PDF, et en-têtes de lecture
+partielle exposés au frontend (CORS).
+"""
+
+import io
+import os
+
+import httpx
+from fastapi.testclient import TestClient
+
+
+def get(api, path: str, headers: dict | None = None) -> httpx.Response:
+    # TestClient (boucle anyio dédiée) : les routes synchrones s'exécutent dans des
+    # threads anyio, arrêtés avec la boucle même si nest_asyncio est actif (ingest)
+    auth = {"Authorization": f"Bearer {api.get_token_signer().issue('test')}", **(headers or {})}
+    return TestClient(api.app).get(path, headers=auth)  # sans lifespan (pas de préchargement)
+
+
+def write_pdf(path: str, n_pages: int) -> None:
+    from pypdf import PdfWriter
+
+    writer = PdfWriter()
+    for _ in range(n_pages):
+        writer.add_blank_page(612, 792)
+    with open(path, "wb") as f:
+        writer.write(f)
+
+
+def test_page_survives_eviction(api, monkeypatch, tmp_path):
+    from pdf_pages import PageCache
+    from pypdf import PdfReader
+
+    monkeypatch.setattr(api, "DATA_DIR", str(tmp_path))
+    cache = PageCache(str(tmp_path / "cache"), max_bytes=1)  # chaque page évince les autres
+    monkeypatch.setattr(api, "pdf_page_cache", cache)
+    write_pdf(str(tmp_path / "rapport.pdf"), 5)
+
+    for page in (2, 3, 2):
+        response = get(api, f"/pdf/rapport.pdf/page/{page}")
+        assert response.status_code == 200
+        assert response.headers["x-page-count"] == "5"
+        assert len(PdfReader(io.BytesIO(response.content)).pages) == 1
+    assert len([name for name in os.listdir(cache.cache_dir) if name.endswith(".pdf")]) == 1
+
+    assert get(api, "/pdf/rapport.pdf/page/9").status_code == 404
+
+
+def test_page_revalidation_does_not_open_pdf(api, monkeypatch, tmp_path):
+    from pdf_pages import PageCache
+
+    monkeypatch.setattr(api, "DATA_DIR", str(tmp_path))
+    cache = PageCache(str(tmp_path / "cache"), max_bytes=10 * 1024 * 1024)
+    monkeypatch.setattr(api, "pdf_page_cache", cache)
+    write_pdf(str(tmp_path / "rapport.pdf"), 3)
+
+    first = get(api, "/pdf/rapport.pdf/page/2")
+    assert first.status_code == 200
+
+    def no_pdf_access(*args):
+        raise AssertionError("PDF ouvert pour un 304")
+
+    monkeypatch.setattr(cache, "page_count", no_pdf_access)
+    monkeypatch.setattr(cache, "get_page", no_pdf_access)
+    revalidated = get(api, "/pdf/rapport.pdf/page/2", {"If-None-Match": first.headers["etag"]})
+    assert revalidated.status_code == 304
+    assert revalidated.headers["etag"] == first.headers["etag"]
+
+
+def test_range_headers_exposed_to_frontend(api, monkeypatch, tmp_path):
+    monkeypatch.setattr(api, "DATA_DIR", str(tmp_path))
+    write_pdf(str(tmp_path / "rapport.pdf"), 2)
+
+    response = get(api, "/pdf/rapport.pdf", {"Origin": "http://localhost:3000", "Range": "bytes=0-99"})
+    assert response.status_code == 206
+    exposed = {h.strip().lower() for h in response.headers["access-control-expose-headers"].split(",")}
+    assert {"accept-ranges", "content-range", "content-length"} <= exposed
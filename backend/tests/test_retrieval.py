@@ -0,0 +1,130 @@
+"""
+Filtre spatial (mémo borné), scores de la fusion BM25 + vecteurs, et
+reranking par cross-encoder (session ONNX factice) : réordonnancement,
+troncature au top-n, scores dans [0, 1], repli sans modèle.
+"""
+
+import asyncio
+import sys
+import types
+
+import numpy as np
+import pytest
+from llama_index.core.schema import NodeWithScore, TextNode
+
+from fakes import FakeEmbedding, FakeLLM
+
+
+def test_document_filter_memo_is_bounded(monkeypatch):
+    import document_index
+    from document_index import DocumentFilterIndex
+
+    monkeypatch.setattr(document_index, "MEMO_SIZE", 8)
+    index = DocumentFilterIndex(["rapport_Zone_A_2024.pdf", "rapport_Zone_B_2023.pdf"])
+
+    for i in range(100):  # groupes fournis par les clients
+        index.resolve([f"groupe_{i}"])
+    assert index.resolve(["Zone_A"]) == ["rapport_Zone_A_2024.pdf"]
+    assert len(index._memo) == 8
+    assert "zone_a" in index._memo
+
+
+def test_fused_scores_are_normalized():
+    from retrieval import FusionRetriever
+
+    nodes = {f"c{i}": TextNode(id_=f"c{i}", text=f"chunk {i}") for i in range(4)}
+
+    class VectorRetriever:
+        def retrieve(self, query_bundle):
+            return [NodeWithScore(node=nodes[c], score=0.8 - i / 10) for i, c in enumerate(["c0", "c1", "c2"])]
+
+    class Lexical:
+        def search(self, query, limit, file_names):
+            return [("c0", 12.0), ("c3", 9.0)]
+
+    class VectorStore:
+        def get_nodes(self, node_ids):
+            return [nodes[chunk_id] for chunk_id in node_ids]
+
+    retriever = FusionRetriever(VectorRetriever(), Lexical(), VectorStore(), 4, 10, None, None, rrf_k=60)
+    results = retriever.retrieve("forage")
+
+    assert [n.node.node_id for n in results][0] == "c0"
+    assert results[0].score == 1.0  # premier des deux classements
+    assert all(0 < n.score <= 1 for n in results)
+    assert [n.score for n in results] == sorted((n.score for n in results), reverse=True)
+
+
+@pytest.fixture
+def reranker_model(monkeypatch, tmp_path):
+    """Répertoire de modèle : vrai tokenizer (un mot = un token) et session ONNX factice."""
+    from tokenizers import Tokenizer
+    from tokenizers.models import WordLevel
+    from tokenizers.pre_tokenizers import WhitespaceSplit
+
+    words = ["[PAD]", "[UNK]", "piezo", "forage", "nappe", "sol"]
+    tokenizer = Tokenizer(WordLevel({w: i for i, w in enumerate(words)}, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = WhitespaceSplit()
+    tokenizer.save(str(tmp_path / "tokenizer.json"))
+    (tmp_path / "model.onnx").write_bytes(b"")
+    relevant_id = words.index("piezo")
+
+    class InferenceSession:
+        """Logit = 2 × occurrences de « piezo » dans la paire − 3."""
+
+        def __init__(self, path, sess_options=None, providers=None):
+            self.batches = []
+
+        def get_inputs(self):
+            return [types.SimpleNamespace(name="input_ids"), types.SimpleNamespace(name="attention_mask")]
+
+        def run(self, output_names, feeds):
+            self.batches.append(len(feeds["input_ids"]))
+            counts = (feeds["input_ids"] == relevant_id).sum(axis=1)
+            return [(2.0 * counts - 3.0)[:, None].astype(np.float32)]
+
+    onnxruntime = types.ModuleType("onnxruntime")
+    onnxruntime.SessionOptions = types.SimpleNamespace
+    onnxruntime.InferenceSession = InferenceSession
+    monkeypatch.setitem(sys.modules, "onnxruntime", onnxruntime)
+    return tmp_path
+
+
+def rerank_setup(api, monkeypatch, model_dir, texts: list[str]) -> None:
+    """Reranker rechargé depuis `model_dir` ; le retriever renvoie `texts` dans cet ordre."""
+    api.configure_models(embed_model=FakeEmbedding(latency_s=0), llm=FakeLLM(latency_s=0))
+    monkeypatch.setattr(api, "RERANK_MODEL_DIR", str(model_dir))
+    monkeypatch.setattr(api, "RERANK_MODES", {"internal"})
+    monkeypatch.setattr(api, "RERANK_BATCH_SIZE", 2)
+    monkeypatch.setattr(api, "reranker", None)
+    monkeypatch.setattr(api, "reranker_failed", False)
+
+    class Retriever:
+        async def aretrieve(self, query):
+            return [NodeWithScore(node=TextNode(text=t), score=0.5) for t in texts]
+
+    monkeypatch.setattr(api, "get_retriever", lambda index, k, filters=None: Retriever())
+
+
+def test_reranking_reorders_and_truncates(api, monkeypatch, reranker_model):
+    texts = ["sol", "piezo forage", "nappe", "piezo piezo piezo", "forage sol"]
+    rerank_setup(api, monkeypatch, reranker_model, texts)
+
+    ranked = asyncio.run(api.retrieve_nodes(None, "piezo", 2, None, "internal"))
+    assert [n.node.get_content() for n in ranked] == ["piezo piezo piezo", "piezo forage"]
+    assert all(0 < n.score < 1 for n in ranked)
+    assert ranked[0].score > ranked[1].score
+    assert api.reranker._session.batches == [2, 2, 1]  # lots de RERANK_BATCH_SIZE paires
+
+    # Mode sans reranking : ordre du retriever
+    plain = asyncio.run(api.retrieve_nodes(None, "piezo", 2, None, "hybrid"))
+    assert [n.node.get_content() for n in plain] == ["sol", "piezo forage"]
+
+
+def test_missing_model_falls_back_to_retriever_order(api, monkeypatch, reranker_model):
+    texts = ["sol", "piezo", "nappe"]
+    rerank_setup(api, monkeypatch, reranker_model / "absent", texts)  # onnxruntime présent, modèle absent
+
+    ranked = asyncio.run(api.retrieve_nodes(None, "piezo", 2, None, "internal"))
+    assert [n.node.get_content() for n in ranked] == ["sol", "piezo"]
+    assert api.reranker is None and api.reranker_failed
@@ -0,0 +1,55 @@
+"""
+Démarrage de l'API : `import main` (processus neuf, `python -X importtime`)
+n'importe aucune dépendance lourde et tient dans le budget de
+benchmarks/startup_time.py (STARTUP_IMPORT_BUDGET_MS) ; /readyz reste en 503
+pendant le préchargement de l'index, /healthz répond dès le démarrage.
+"""
+
+import threading
+import time
+import types
+
+from fastapi.testclient import TestClient
+
+from startup_time import DEFAULT_BUDGET_MS, HEAVY_MODULES, measure_import
+
+
+def test_import_main_stays_light():
+    runs = [measure_import() for _ in range(3)]
+
+    assert [m for m in HEAVY_MODULES if m in runs[0]] == []
+    best_ms = min(run["main"] for run in runs) / 1000  # meilleur des 3 : insensible à une machine chargée
+    assert best_ms <= DEFAULT_BUDGET_MS, f"import main : {best_ms:.0f} ms > {DEFAULT_BUDGET_MS} ms"
+
+
+def test_readyz_waits_for_warmup(api, monkeypatch):
+    import context_packer
+
+    release = threading.Event()
+    loaded_index = object()
+
+    def blocked_get_index():
+        release.wait(timeout=30)
+        api.index = loaded_index
+        return loaded_index
+
+    monkeypatch.setattr(api, "get_index", blocked_get_index)
+    monkeypatch.setattr(api, "chroma_collection", types.SimpleNamespace(count=lambda: 42))
+    monkeypatch.setattr(context_packer, "_get_encoding", lambda model: None)
+
+    try:
+        with TestClient(api.app) as client:  # lifespan : warm_up lancé en tâche de fond
+            not_ready = client.get("/readyz")
+            assert not_ready.status_code == 503
+            assert not_ready.json()["status"] == "loading"
+            assert client.get("/healthz").status_code == 200
+
+            release.set()
+            deadline = time.monotonic() + 10
+            while (ready := client.get("/readyz")).status_code != 200 and time.monotonic() < deadline:
+                time.sleep(0.02)
+            assert ready.status_code == 200
+            assert ready.json()["status"] == "ready" and ready.json()["collection_size"] == 42
+            assert client.get("/healthz").status_code == 200
+    finally:
+        release.set()
@@ -0,0 +1,94 @@
+"""
+Client Tavily : un seul client poolé réutilisé entre les appels, retry avec
+backoff sur 429/5xx (Retry-After plafonné), pas de retry sur les autres 4xx.
+"""
+
+import asyncio
+
+import httpx
+import pytest
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Attentes demandées par post_with_retry (sans attendre réellement)."""
+    recorded = []
+    real_sleep = asyncio.sleep
+
+    async def fake_sleep(delay, *args, **kwargs):
+        recorded.append(delay)
+        await real_sleep(0)
+
+    monkeypatch.setattr(asyncio, "sleep", fake_sleep)
+    return recorded
+
+
+def scripted_client(api, statuses: list[int], headers: dict | None = None):
+    """Client dont le transport répond successivement `statuses` ; retourne (client, requêtes reçues)."""
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        status = statuses[min(len(requests), len(statuses)) - 1]
+        return httpx.Response(status, json={"results": []}, headers=headers or {})
+
+    return api.create_tavily_client(transport=httpx.MockTransport(handler)), requests
+
+
+def test_shared_pooled_client_is_reused(api, monkeypatch):
+    monkeypatch.setenv("TAVILY_API_KEY", "tvly-test")
+    client, requests = scripted_client(api, [200])
+    monkeypatch.setattr(api, "tavily_client", client)
+
+    async def search_twice():
+        await api.search_web_agent("nappe phréatique")
+        await api.search_web_agent("piézomètre", use_domain_filters=False)
+
+    asyncio.run(search_twice())
+    assert len(requests) == 2
+    assert api.get_tavily_client() is client
+
+    pooled = api.create_tavily_client()
+    assert pooled._transport._pool._max_connections == api.TAVILY_MAX_CONNECTIONS
+    assert pooled._transport._pool._max_keepalive_connections == api.TAVILY_MAX_KEEPALIVE
+
+
+@pytest.mark.parametrize("status", [429, 503])
+def test_retryable_errors_are_retried_with_backoff(api, monkeypatch, sleeps, status):
+    monkeypatch.setattr(api, "TAVILY_MAX_RETRIES", 2)
+    monkeypatch.setattr(api, "TAVILY_RETRY_BACKOFF", 0.5)
+    client, requests = scripted_client(api, [status, status, 200])
+
+    response = asyncio.run(api.post_with_retry(client, "https://tavily.test/search", {}))
+    assert response.status_code == 200
+    assert len(requests) == 3
+    assert sleeps == [0.5, 1.0]
+
+
+def test_client_errors_are_not_retried(api, sleeps):
+    client, requests = scripted_client(api, [400])
+
+    response = asyncio.run(api.post_with_retry(client, "https://tavily.test/search", {}))
+    assert response.status_code == 400
+    assert len(requests) == 1
+    assert sleeps == []
+
+
+def test_retry_after_is_capped(api, monkeypatch, sleeps):
+    monkeypatch.setattr(api, "TAVILY_MAX_RETRIES", 1)
+    monkeypatch.setattr(api, "TAVILY_MAX_BACKOFF", 4.0)
+    client, requests = scripted_client(api, [429, 200], headers={"Retry-After": "3600"})
+
+    response = asyncio.run(api.post_with_retry(client, "https://tavily.test/search", {}))
+    assert response.status_code == 200
+    assert sleeps == [4.0]
+
+
+def test_no_retry_past_deadline(api, monkeypatch, sleeps):
+    monkeypatch.setattr(api, "TAVILY_MAX_RETRIES", 3)
+    monkeypatch.setattr(api, "TAVILY_RETRY_DEADLINE", 1.0)
+    client, requests = scripted_client(api, [503], headers={"Retry-After": "2"})
+
+    response = asyncio.run(api.post_with_retry(client, "https://tavily.test/search", {}))
+    assert response.status_code == 503
+    assert len(requests) == 1 and sleeps == []
@@ -334,14 +334,8 @@ export default function ChatInterface() {
         setIsExporting(false);
         return;
       }
-      // 1. Charger les données GeoJSON de chaque couche active
-      const layerDataPromises = exportLayers.map(async (layer) => {
-        const res = await fetch(`/api/layers/data?path=${encodeURIComponent(layer.id)}`);
-        if (!res.ok) throw new Error(`Erreur chargement couche ${layer.id}`);
-        const geojson = await res.json();
-        return { id: layer.id, name: layer.fileName, geojson };
-      });
-      const layers = await Promise.all(layerDataPromises);
+      // 1. Références des couches : le backend lit les fichiers GeoJSON lui-même
+      const layers = exportLayers.map((layer) => ({ id: layer.id, name: layer.fileName }));
 
       // 2. Envoyer au backend pour conversion .gdb
       const API_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000';
@@ -1,6 +1,6 @@
 'use client';
 
-import React, { useState, useMemo } from 'react';
+import React, { useState, useEffect } from 'react';
 import { Document, Page, pdfjs } from 'react-pdf';
 import { X, ChevronLeft, ChevronRight, ZoomIn, ZoomOut } from 'lucide-react';
 import { Button } from '@/components/ui/button';
@@ -21,19 +21,39 @@ export default function PDFViewer({ fileName, pageNumber, onClose, token }: PDFV
   const [numPages, setNumPages] = useState<number>(0);
   const [currentPage, setCurrentPage] = useState<number>(pageNumber);
   const [scale, setScale] = useState<number>(1.0);
+  const [pageFile, setPageFile] = useState<{ data: Uint8Array } | null>(null);
+  const [loadError, setLoadError] = useState<boolean>(false);
 
   const apiUrl = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000';
-  const pdfUrl = `${apiUrl}/pdf/${encodeURIComponent(fileName)}`;
 
-  const pdfFile = useMemo(
-    () => ({ url: pdfUrl, httpHeaders: { Authorization: `Bearer ${token}` } }),
-    [pdfUrl, token]
+  // Seule la page affichée est téléchargée (/pdf/{fichier}/page/{n}, quelques centaines de Ko)
+  // au lieu du rapport complet ; X-Page-Count donne le nombre de pages pour la navigation.
+  useEffect(() => {
+    const controller = new AbortController();
+    setPageFile(null);
+    setLoadError(false);
+    fetch(`${apiUrl}/pdf/${encodeURIComponent(fileName)}/page/${currentPage}`, {
+      headers: { 'Authorization': `Bearer ${token}` },
+      signal: controller.signal,
+    })
+      .then(async res => {
+        if (!res.ok) throw new Error(`HTTP ${res.status}`);
+        const pageCount = Number(res.headers.get('X-Page-Count'));
+        if (pageCount > 0) setNumPages(pageCount);
+        setPageFile({ data: new Uint8Array(await res.arrayBuffer()) });
+      })
+      .catch(err => {
+        if (err.name !== 'AbortError') setLoadError(true);
+      });
+    return () => controller.abort();
+  }, [apiUrl, fileName, currentPage, token]);
+
+  const loadingSpinner = (
+    <div className="flex items-center justify-center p-8">
+      <div className="animate-spin rounded-full h-12 w-12 border-b-2 border-gray-900"></div>
+    </div>
   );
 
-  function onDocumentLoadSuccess({ numPages }: { numPages: number }) {
-    setNumPages(numPages);
-  }
-
   const goToPrevPage = () => {
     setCurrentPage(prev => Math.max(1, prev - 1));
   };
@@ -107,30 +127,30 @@ export default function PDFViewer({ fileName, pageNumber, onClose, token }: PDFV
         {/* PDF Content */}
         <div className="flex-1 overflow-auto bg-gray-100 p-4">
           <div className="flex justify-center">
-            <Document
-              file={pdfFile}
-              onLoadSuccess={onDocumentLoadSuccess}
-              loading={
-                <div className="flex items-center justify-center p-8">
-                  <div className="animate-spin rounded-full h-12 w-12 border-b-2 border-gray-900"></div>
-                </div>
-              }
-              error={
-                <div className="text-center p-8 text-red-600">
-                  <p>Erreur lors du chargement du PDF</p>
-                  <p className="text-sm text-gray-500 mt-2">
-                    Vérifiez que le fichier existe sur le serveur
-                  </p>
-                </div>
-              }
-            >
-              <Page
-                pageNumber={currentPage}
-                scale={scale}
-                renderTextLayer={true}
-                renderAnnotationLayer={true}
-              />
-            </Document>
+            {loadError ? (
+              <div className="text-center p-8 text-red-600">
+                <p>Erreur lors du chargement du PDF</p>
+                <p className="text-sm text-gray-500 mt-2">
+                  Vérifiez que le fichier existe sur le serveur
+                </p>
+              </div>
+            ) : !pageFile ? (
+              loadingSpinner
+            ) : (
+              <Document
+                file={pageFile}
+                onLoadError={() => setLoadError(true)}
+                loading={loadingSpinner}
+              >
+                {/* Le PDF reçu ne contient que la page demandée */}
+                <Page
+                  pageNumber={1}
+                  scale={scale}
+                  renderTextLayer={true}
+                  renderAnnotationLayer={true}
+                />
+              </Document>
+            )}
           </div>
         </div>
       </div>